@@ -1,7 +1,13 @@
-from flask import Blueprint, render_template, session, redirect, url_for, flash, request
+from flask import Blueprint, render_template, session, redirect, url_for, flash, request, Response
 from functools import wraps
-from data_manager import load_json, save_json, get_menu_item_by_id, get_user_by_id, get_menu_items
+from data_manager import get_menu_item_by_id, get_menu_items, get_users, get_report_aggregates
+from data_manager import get_orders_summary
+from data_manager import join_records
+from data_manager import get_purchase_requests, update_purchase_request, get_reviews, update_review, delete_review
+from data_manager import add_menu_item as dm_add_menu_item, update_menu_item
 from datetime import datetime
+import exports
+import report_jobs
 
 admin_bp = Blueprint('admin', __name__)
 
@@ -23,64 +29,46 @@ def admin_required(f):
 @admin_required
 def dashboard():
     """Панель управления администратора"""
-    # Статистика оплат
-    users = load_json('data/users.json').get('users', [])
-    students = [user for user in users if user['role'] == 'student']
-    total_balance = sum(student.get('balance', 0) for student in students)
-
-    # Заявки на закупку
-    requests = load_json('data/purchase_requests.json').get('requests', [])
-    pending_requests = [r for r in requests if r['status'] == 'pending']
-
-    # Посещаемость
-    orders = load_json('data/orders.json').get('orders', [])
+    # Все показатели — из сводной записи, которая обновляется при каждой записи
+    totals = get_report_aggregates()
     today = datetime.now().strftime('%Y-%m-%d')
-    today_attendance = len([o for o in orders if o.get('date') == today])
-
-    # Отзывы
-    reviews = load_json('data/reviews.json').get('reviews', [])
-    pending_reviews = [r for r in reviews if not r.get('approved')]
 
     return render_template('admin/dashboard.html',
-                           total_students=len(students),
-                           total_balance=total_balance,
-                           pending_requests=len(pending_requests),
-                           today_attendance=today_attendance,
-                           pending_reviews=len(pending_reviews))
+                           total_students=totals['students'],
+                           total_balance=totals['balance_total'],
+                           pending_requests=totals['pending_requests'],
+                           today_attendance=totals['orders_by_day'].get(today, 0),
+                           pending_reviews=totals['pending_reviews'])
 
 
 @admin_bp.route('/requests')
 @admin_required
 def requests():
     """Управление заявками на закупку"""
-    requests_data = load_json('data/purchase_requests.json')
+    # Черновики по прогнозу расхода видит только повар, пока не отправит их
+    purchase_requests = [r for r in get_purchase_requests() if r.get('status') != 'draft']
 
     # Добавляем информацию о создателе
-    users = load_json('data/users.json').get('users', [])
+    users = get_users()
     user_dict = {user['id']: user for user in users}
 
-    for request in requests_data.get('requests', []):
+    for request in purchase_requests:
         creator_id = request.get('created_by')
         if creator_id in user_dict:
             request['creator'] = user_dict[creator_id]
 
-    return render_template('admin/requests.html', requests=requests_data.get('requests', []))
+    return render_template('admin/requests.html', requests=purchase_requests)
 
 
 @admin_bp.route('/approve_request/<int:request_id>')
 @admin_required
 def approve_request(request_id):
     """Согласование заявки"""
-    requests_data = load_json('data/purchase_requests.json')
-
-    for req in requests_data['requests']:
-        if req['id'] == request_id:
-            req['status'] = 'approved'
-            req['approved_by'] = session['user_id']
-            req['approved_at'] = datetime.now().isoformat()
-            break
-
-    save_json('data/purchase_requests.json', requests_data)
+    update_purchase_request(request_id, {
+        'status': 'approved',
+        'approved_by': session['user_id'],
+        'approved_at': datetime.now().isoformat()
+    })
     flash('Заявка согласована', 'success')
     return redirect(url_for('admin.requests'))
 
@@ -89,16 +77,11 @@ def approve_request(request_id):
 @admin_required
 def reject_request(request_id):
     """Отклонение заявки"""
-    requests_data = load_json('data/purchase_requests.json')
-
-    for req in requests_data['requests']:
-        if req['id'] == request_id:
-            req['status'] = 'rejected'
-            req['rejected_by'] = session['user_id']
-            req['rejected_at'] = datetime.now().isoformat()
-            break
-
-    save_json('data/purchase_requests.json', requests_data)
+    update_purchase_request(request_id, {
+        'status': 'rejected',
+        'rejected_by': session['user_id'],
+        'rejected_at': datetime.now().isoformat()
+    })
     flash('Заявка отклонена', 'success')
     return redirect(url_for('admin.requests'))
 
@@ -107,77 +90,127 @@ def reject_request(request_id):
 @admin_required
 def reports():
     """Генерация отчетов"""
-    # Получаем данные для отчета
-    orders = load_json('data/orders.json').get('orders', [])
-    users = load_json('data/users.json').get('users', [])
-
-    # Статистика по дням
-    attendance_by_day = {}
-    for order in orders:
-        date = order.get('date')
-        attendance_by_day[date] = attendance_by_day.get(date, 0) + 1
-
-    # Статистика по классам
-    class_attendance = {}
-    students = {user['id']: user for user in users if user['role'] == 'student'}
-
-    for order in orders:
-        student = students.get(order.get('student_id'))
-        if student and student.get('class'):
-            class_name = student['class']
-            class_attendance[class_name] = class_attendance.get(class_name, 0) + 1
-
-    # Финансовая статистика
-    payments = load_json('data/payments.json').get('payments', [])
+    # Статистика по дням и классам и выручка — из сводных показателей
+    totals = get_report_aggregates()
+
+    # Финансовая статистика: пополнения баланса — не выручка
     today = datetime.now().strftime('%Y-%m-%d')
-    today_payments = [p for p in payments if p.get('date', '').startswith(today)]
-    today_revenue = sum(p.get('amount', 0) for p in today_payments if p.get('type') != 'recharge')
+    today_revenue = sum(amount for payment_type, amount in totals['revenue_by_day'].get(today, {}).items()
+                        if payment_type != 'recharge')
+
+    attendance_by_day = sorted(totals['orders_by_day'].items())
+    class_attendance = sorted(totals['orders_by_class'].items())
+    total_orders = totals['orders_total']
+
+    # За выбранный период — по итогам закрытых дней и заказам остальных
+    start_date = request.args.get('start_date') or None
+    end_date = request.args.get('end_date') or None
+    try:
+        for value in (start_date, end_date):
+            if value:
+                datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        flash('Неверная дата периода', 'danger')
+        start_date = end_date = None
+    if start_date or end_date:
+        period = get_orders_summary(start_date, end_date)
+        attendance_by_day = [(date, stats['total']) for date, stats in sorted(period['orders_by_day'].items())]
+        class_attendance = sorted(period['orders_by_class'].items())
+        total_orders = period['orders_total']
 
     return render_template('admin/reports.html',
-                           attendance_by_day=sorted(attendance_by_day.items()),
-                           class_attendance=sorted(class_attendance.items()),
-                           total_orders=len(orders),
+                           attendance_by_day=attendance_by_day,
+                           class_attendance=class_attendance,
+                           total_orders=total_orders,
                            today_revenue=today_revenue)
 
 
+@admin_bp.route('/export')
+@admin_required
+def export():
+    """Выгрузка отчета за период в CSV или XLSX.
+    Файл формируется по мере отправки (exports.py)"""
+    report = request.args.get('report', 'orders')
+    file_format = request.args.get('format', 'csv')
+    start_date = request.args.get('start_date') or None
+    end_date = request.args.get('end_date') or None
+
+    if report not in exports.REPORTS or file_format not in exports.FORMATS:
+        flash('Неизвестный отчет или формат выгрузки', 'danger')
+        return redirect(url_for('admin.reports'))
+    try:
+        for value in (start_date, end_date):
+            if value:
+                datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        flash('Неверная дата периода', 'danger')
+        return redirect(url_for('admin.reports'))
+
+    filename = exports.filename(report, file_format, start_date, end_date)
+    return Response(exports.export(report, file_format, start_date, end_date),
+                    content_type=exports.FORMATS[file_format],
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+
+@admin_bp.route('/report_jobs', methods=['GET', 'POST'])
+@admin_required
+def report_jobs_list():
+    """Фоновые отчеты: постановка в очередь и список заданий"""
+    if request.method == 'POST':
+        report = request.form.get('report')
+        start_date = request.form.get('start_date') or None
+        end_date = request.form.get('end_date') or None
+        try:
+            for value in (start_date, end_date):
+                if value:
+                    datetime.strptime(value, '%Y-%m-%d')
+        except ValueError:
+            flash('Неверная дата периода', 'danger')
+            return redirect(url_for('admin.report_jobs_list'))
+        if report not in report_jobs.REPORTS:
+            flash('Неизвестный отчет', 'danger')
+            return redirect(url_for('admin.report_jobs_list'))
+
+        key = report_jobs.submit(report, start_date, end_date)
+        return redirect(url_for('admin.report_job', key=key))
+
+    return render_template('admin/report_jobs.html',
+                           reports=report_jobs.REPORTS,
+                           jobs=report_jobs.jobs())
+
+
+@admin_bp.route('/report_jobs/<key>')
+@admin_required
+def report_job(key):
+    """Состояние фонового отчета и его результат"""
+    job = report_jobs.get(key)
+    if job is None:
+        flash('Отчет не найден', 'danger')
+        return redirect(url_for('admin.report_jobs_list'))
+    return render_template('admin/report_job.html', job=job)
+
+
 @admin_bp.route('/reviews')
 @admin_required
 def reviews():
     """Управление отзывами"""
-    reviews_data = load_json('data/reviews.json')
-
-    if 'reviews' not in reviews_data:
-        reviews_data['reviews'] = []
-
-    # Добавляем информацию о блюдах и пользователях
-    for review in reviews_data['reviews']:
-        menu_item = get_menu_item_by_id(review.get('menu_item_id'))
-        student = get_user_by_id(review.get('student_id'))
+    all_reviews = get_reviews()
 
-        review['menu_item'] = menu_item
-        review['student'] = student
+    # Добавляем информацию о блюдах и пользователях (одним пакетом на коллекцию)
+    join_records(all_reviews, 'menu_item_id', 'menu', 'menu_item')
+    join_records(all_reviews, 'student_id', 'users', 'student')
 
-    return render_template('admin/reviews.html', reviews=reviews_data['reviews'])
+    return render_template('admin/reviews.html', reviews=all_reviews)
 
 
 @admin_bp.route('/approve_review/<int:review_id>')
 @admin_required
 def approve_review(review_id):
     """Одобрение отзыва"""
-    reviews_data = load_json('data/reviews.json')
-
-    if 'reviews' not in reviews_data:
-        flash('Отзывы не найдены', 'danger')
+    if update_review(review_id, {'approved': True, 'approved_at': datetime.now().isoformat()}):
+        flash('Отзыв одобрен', 'success')
         return redirect(url_for('admin.reviews'))
 
-    for i, review in enumerate(reviews_data['reviews']):
-        if review.get('id') == review_id:
-            reviews_data['reviews'][i]['approved'] = True
-            reviews_data['reviews'][i]['approved_at'] = datetime.now().isoformat()
-            save_json('data/reviews.json', reviews_data)
-            flash('Отзыв одобрен', 'success')
-            return redirect(url_for('admin.reviews'))
-
     flash('Отзыв не найден', 'danger')
     return redirect(url_for('admin.reviews'))
 
@@ -186,19 +219,10 @@ def approve_review(review_id):
 @admin_required
 def reject_review(review_id):
     """Отклонение отзыва"""
-    reviews_data = load_json('data/reviews.json')
-
-    if 'reviews' not in reviews_data:
-        flash('Отзывы не найдены', 'danger')
+    if delete_review(review_id):
+        flash('Отзыв отклонен и удален', 'success')
         return redirect(url_for('admin.reviews'))
 
-    for i, review in enumerate(reviews_data['reviews']):
-        if review.get('id') == review_id:
-            del reviews_data['reviews'][i]
-            save_json('data/reviews.json', reviews_data)
-            flash('Отзыв отклонен и удален', 'success')
-            return redirect(url_for('admin.reviews'))
-
     flash('Отзыв не найден', 'danger')
     return redirect(url_for('admin.reviews'))
 
@@ -246,7 +270,6 @@ def add_menu_item():
         'preparation_time': '20 мин'
     }
 
-    from data_manager import add_menu_item as dm_add_menu_item
     dm_add_menu_item(new_item)
     flash('Блюдо добавлено в меню', 'success')
     return redirect(url_for('admin.menu') + f'?date={date}')
@@ -259,7 +282,6 @@ def toggle_menu_item(item_id):
     menu_item = get_menu_item_by_id(item_id)
 
     if menu_item:
-        from data_manager import update_menu_item
         update_menu_item(item_id, {'available': not menu_item.get('available', True)})
         status = 'доступно' if not menu_item.get('available', True) else 'недоступно'
         flash(f'Блюдо теперь {status}', 'success')
@@ -394,11 +416,11 @@ school_canteen/
 ├── data/                 # JSON-файлы с данными
 │   ├── users.json
 │   ├── menu.json
-│   ├── orders.json
+│   ├── orders/           # заказы по месяцам: 2026-10.json
 │   ├── inventory.json
 │   ├── purchase_requests.json
 │   └── reviews.json
-|   ____payments.json
+|   ____payments/         # платежи по месяцам
 │
 ├── templates/            # HTML шаблоны
 │   ├── base.html         # Базовый шаблон
@@ -0,0 +1,215 @@
+"""Сводные показатели для панели и отчётов администратора.
+
+Показатели хранятся одной записью коллекции aggregates и обновляются при
+каждой записи в хранилище (Backend.transaction): по изменённым записям
+вычисляется разница, и она записывается в той же транзакции, что и сами
+данные. Поэтому страницам администратора не нужно просматривать все
+заказы, платежи и пользователей.
+
+Запись плоская — изменение затрагивает только несколько полей, и в журнал
+попадают только они:
+    students, balance_total          — ученики и сумма их балансов
+    pending_requests, pending_reviews — заявки и отзывы, ждущие решения
+    orders_total                     — всего заказов
+    orders_by_day:<дата>             — заказов за день
+    orders_by_class:<класс>          — заказов по классам
+    revenue:<дата>:<тип платежа>     — сумма платежей за день по типам
+    rollup_dirty:<месяц>             — изменения заказов и платежей прошедших
+                                       дней месяца после закрытия (rollups.py)
+
+Класс заказа берётся у ученика в момент записи; если ученика перевели
+в другой класс, счётчики по классам уточнит пересчёт:
+    python rebuild_aggregates.py
+Массовые операции (replace_all, перенос между хранилищами) показатели
+не обновляют — после них нужен пересчёт.
+"""
+import re
+from collections import defaultdict
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Tuple
+
+AGGREGATES_ID = 1
+ROLLUP_DIRTY = 'rollup_dirty:'
+# Коллекции, по которым считаются итоги закрытых дней (rollups.py)
+ROLLED_UP = ('orders', 'payments')
+_DAY_RE = re.compile(r'\d{4}-\d{2}-\d{2}')
+
+# Коллекции, от которых зависят показатели
+TRACKED = ('users', 'orders', 'payments', 'purchase_requests', 'reviews')
+
+_PREFIXES = {
+    'orders_by_day': 'orders_by_day:',
+    'orders_by_class': 'orders_by_class:',
+}
+
+
+def _contributions(collection: str, record: Optional[Dict], student_class) -> Iterable[Tuple[str, float]]:
+    """Вклад одной записи в показатели"""
+    if record is None:
+        return
+    if collection == 'users':
+        if record.get('role') == 'student':
+            yield 'students', 1
+            yield 'balance_total', record.get('balance', 0) or 0
+    elif collection == 'orders':
+        yield 'orders_total', 1
+        yield f"orders_by_day:{record.get('date')}", 1
+        class_name = student_class(record.get('student_id'))
+        if class_name:
+            yield f'orders_by_class:{class_name}', 1
+    elif collection == 'payments':
+        day = str(record.get('date') or '')[:10]
+        yield f"revenue:{day}:{record.get('type')}", record.get('amount', 0) or 0
+    elif collection == 'purchase_requests':
+        if record.get('status') == 'pending':
+            yield 'pending_requests', 1
+    elif collection == 'reviews':
+        if not record.get('approved'):
+            yield 'pending_reviews', 1
+
+
+def _closed_month(record: Optional[Dict], today: str) -> Optional[str]:
+    """Месяц записи, если она относится к уже прошедшему дню"""
+    if record is None:
+        return None
+    day = str(record.get('date') or '')[:10]
+    return day[:7] if _DAY_RE.fullmatch(day) and day < today else None
+
+
+def _class_of(user: Optional[Dict]) -> Optional[str]:
+    """Класс пользователя для заказов по классам: только у учеников, как в
+    прежней статистике (класс повара или администратора не учитывается)"""
+    return user.get('class') if user and user.get('role') == 'student' else None
+
+
+def _class_lookup(backend):
+    classes = {}
+
+    def student_class(student_id):
+        if student_id not in classes:
+            classes[student_id] = _class_of(backend.get('users', student_id) if student_id is not None else None)
+        return classes[student_id]
+    return student_class
+
+
+def record_states(backend, ops: List[Dict], tracked) -> Dict[tuple, list]:
+    """Итоговое состояние каждой записи коллекций tracked, затронутой
+    операциями ops: {(коллекция, id): [до транзакции, после]}.
+    Вызывается под блокировкой транзакции, до записи ops."""
+    states: Dict[tuple, list] = {}
+    for op in ops:
+        collection = op['collection']
+        if collection not in tracked:
+            continue
+        kind = op['op']
+        record_id = op['record'].get('id') if kind in ('add', 'put') else op['id']
+        state = states.get((collection, record_id))
+        if state is None:
+            # Новая запись ('add') до транзакции не существовала
+            before = None if kind == 'add' else backend.get(collection, record_id)
+            state = states[(collection, record_id)] = [before, before]
+        if kind in ('add', 'put'):
+            state[1] = op['record']
+        elif kind == 'set':
+            if state[1] is not None:
+                state[1] = dict(state[1], **op['fields'])
+        elif kind == 'del':
+            state[1] = None
+    return states
+
+
+def changes(backend, ops: List[Dict]) -> List[Dict]:
+    """Операции над записью показателей для набора операций транзакции.
+    Вызывается под блокировкой транзакции, до записи ops."""
+    states = record_states(backend, ops, TRACKED)
+    if not states:
+        return []
+
+    current = backend.get('aggregates', AGGREGATES_ID)
+    if current is None:
+        # Показатели ещё не посчитаны — их создаст пересчёт, а не приращения
+        return []
+
+    student_class = _class_lookup(backend)
+    deltas = defaultdict(float)
+    today = date.today().isoformat()
+    for (collection, _), (before, after) in states.items():
+        for name, value in _contributions(collection, before, student_class):
+            deltas[name] -= value
+        for name, value in _contributions(collection, after, student_class):
+            deltas[name] += value
+        if collection in ROLLED_UP:
+            # Итоги прошедших дней этого месяца устарели до следующего закрытия
+            for month in {_closed_month(before, today), _closed_month(after, today)} - {None}:
+                deltas[ROLLUP_DIRTY + month] += 1
+
+    fields = {}
+    for name, delta in deltas.items():
+        if delta:
+            value = current.get(name, 0) + delta
+            fields[name] = int(value) if float(value).is_integer() else value
+    if not fields:
+        return []
+    return [{'op': 'set', 'collection': 'aggregates', 'id': AGGREGATES_ID, 'fields': fields}]
+
+
+def compute(backend) -> Dict:
+    """Показатели, посчитанные заново по всем данным (плоская запись)"""
+    users = {user['id']: user for user in backend.all('users')}
+
+    def student_class(student_id):
+        return _class_of(users.get(student_id))
+
+    totals = defaultdict(float)
+    for collection in TRACKED:
+        records = users.values() if collection == 'users' else backend.scan(collection)
+        for record in records:
+            for name, value in _contributions(collection, record, student_class):
+                totals[name] += value
+
+    record = {'id': AGGREGATES_ID}
+    for name in ('students', 'balance_total', 'pending_requests', 'pending_reviews', 'orders_total'):
+        totals.setdefault(name, 0)
+    for name, value in totals.items():
+        record[name] = int(value) if float(value).is_integer() else value
+    return record
+
+
+def rebuild(backend) -> Dict:
+    """Пересчитывает показатели с нуля и сохраняет их"""
+    with backend.transaction(*TRACKED, 'aggregates'):
+        record = compute(backend)
+        # Отметки устаревших итогов по данным не восстановить — переносим их
+        current = backend.get('aggregates', AGGREGATES_ID) or {}
+        record.update((name, value) for name, value in current.items()
+                      if isinstance(name, str) and name.startswith(ROLLUP_DIRTY))
+        backend.replace_all('aggregates', [record])
+    return record
+
+
+def unpack(record: Dict) -> Dict:
+    """Плоская запись показателей -> словарь для страниц"""
+    result = {
+        'students': record.get('students', 0),
+        'balance_total': record.get('balance_total', 0),
+        'pending_requests': record.get('pending_requests', 0),
+        'pending_reviews': record.get('pending_reviews', 0),
+        'orders_total': record.get('orders_total', 0),
+        'orders_by_day': {},
+        'orders_by_class': {},
+        'revenue_by_day': {},
+    }
+    for name, value in record.items():
+        if not isinstance(name, str):
+            continue
+        for section, prefix in _PREFIXES.items():
+            if name.startswith(prefix):
+                if value:
+                    result[section][name[len(prefix):]] = value
+                break
+        else:
+            if name.startswith('revenue:'):
+                _, day, payment_type = name.split(':', 2)
+                if value:
+                    result['revenue_by_day'].setdefault(day, {})[payment_type] = value
+    return result
@@ -0,0 +1,303 @@
+"""Аналитика заказов и платежей на массивах NumPy.
+
+Отчёты и статистика повара раньше проходили циклом по всем записям
+истории при каждом показе страницы. Здесь заказы и платежи один раз
+раскладываются по столбцам — массивам NumPy (день, ученик, блюдо, цена,
+тип), — а группировки по дням, классам и блюдам и суммы за период
+считаются векторными операциями над ними.
+
+Столбцы хранятся в памяти процесса по месяцам — разделам хранилища —
+и перечитываются только для месяцев, версия которых изменилась
+(Backend.partition_versions): после нового заказа следующий отчёт
+загрузит заново лишь текущий месяц.
+
+День — число дней от 1970-01-01. Записи без корректной даты получают
+NO_DAY: они входят в общее количество, но не в выборки по дням и за период.
+Границы периода (start, end) — строки 'YYYY-MM-DD', обе включительно.
+"""
+import threading
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+import backends
+
+NO_DAY = -1
+# Коды типа заказа; все прочие типы получают код len(MEAL_TYPES)
+MEAL_TYPES = ('breakfast', 'lunch')
+_EPOCH = date(1970, 1, 1)
+
+# коллекция -> (хранилище, {раздел: (версия, столбцы)}, столбцы всей коллекции)
+_cache: Dict[str, tuple] = {}
+_cache_lock = threading.Lock()
+# Коды типов платежей заранее не известны и назначаются по мере появления.
+# Словарь общий для всех месяцев, чтобы коды совпадали при объединении
+_payment_types: Dict[str, int] = {}
+
+
+def day_number(value) -> int:
+    """'2026-10-16' (или дата-время ISO) -> номер дня; NO_DAY, если дата некорректна"""
+    try:
+        return (date.fromisoformat(str(value or '')[:10]) - _EPOCH).days
+    except ValueError:
+        return NO_DAY
+
+
+def day_string(day: int) -> str:
+    """Номер дня -> 'YYYY-MM-DD'"""
+    return (_EPOCH + timedelta(days=int(day))).isoformat()
+
+
+def _days(records) -> np.ndarray:
+    # Различных дат немного (по одной на учебный день) — разбираем каждую один раз
+    memo: Dict[str, int] = {}
+    days = np.empty(len(records), dtype=np.int32)
+    for position, record in enumerate(records):
+        text = str(record.get('date') or '')[:10]
+        day = memo.get(text)
+        if day is None:
+            day = memo[text] = day_number(text)
+        days[position] = day
+    return days
+
+
+def _load_orders(records: List[Dict]) -> Dict:
+    type_codes = {name: code for code, name in enumerate(MEAL_TYPES)}
+    other = len(MEAL_TYPES)
+    count = len(records)
+    return {
+        'day': _days(records),
+        'student_id': np.fromiter((r.get('student_id') or 0 for r in records), np.int64, count),
+        'menu_item_id': np.fromiter((r.get('menu_item_id') or 0 for r in records), np.int64, count),
+        'price': np.fromiter((r.get('price') or 0 for r in records), np.float64, count),
+        'type': np.fromiter((type_codes.get(r.get('type'), other) for r in records), np.int8, count),
+    }
+
+
+def _payment_type(name) -> int:
+    code = _payment_types.get(name)
+    if code is None:
+        with _cache_lock:
+            code = _payment_types.setdefault(name, len(_payment_types))
+    return code
+
+
+def _load_payments(records: List[Dict]) -> Dict:
+    count = len(records)
+    return {
+        'day': _days(records),
+        'user_id': np.fromiter((r.get('user_id') or 0 for r in records), np.int64, count),
+        'amount': np.fromiter((r.get('amount') or 0 for r in records), np.float64, count),
+        'type': np.fromiter((_payment_type(r.get('type')) for r in records), np.int16, count),
+    }
+
+
+_LOADERS = {
+    'orders': _load_orders,
+    'payments': _load_payments,
+}
+
+
+def columns(collection: str) -> Dict:
+    """Столбцы коллекции ('orders' или 'payments'). Месяцы, изменившиеся
+    с прошлой загрузки, перечитываются, остальные берутся из памяти."""
+    backend = backends.get_backend()
+    versions = backend.partition_versions(collection)
+    with _cache_lock:
+        cached = _cache.get(collection)
+    if cached is None or cached[0] is not backend:
+        cached = (backend, {}, None)
+    partitions = cached[1]
+    if cached[2] is not None and versions == {name: part[0] for name, part in partitions.items()}:
+        return cached[2]
+
+    # Версии взяты до чтения: если запись пришла во время загрузки,
+    # следующий вызов увидит новую версию и перечитает месяц ещё раз
+    loaded = {}
+    for partition, version in sorted(versions.items()):
+        part = partitions.get(partition)
+        if part is None or part[0] != version:
+            part = (version, _LOADERS[collection](list(backend.scan_partition(collection, partition))))
+        loaded[partition] = part
+    if loaded:
+        parts = [data for _, data in loaded.values()]
+        combined = {name: np.concatenate([data[name] for data in parts]) for name in parts[0]}
+    else:
+        combined = _LOADERS[collection]([])
+    with _cache_lock:
+        _cache[collection] = (backend, loaded, combined)
+    return combined
+
+
+def invalidate() -> None:
+    """Забывает загруженные столбцы"""
+    with _cache_lock:
+        _cache.clear()
+
+
+def _period(data: Dict, start: Optional[str], end: Optional[str]) -> np.ndarray:
+    """Маска записей с корректной датой, попадающих в период"""
+    day = data['day']
+    mask = day != NO_DAY
+    first, last = day_number(start) if start else NO_DAY, day_number(end) if end else NO_DAY
+    if first != NO_DAY:
+        mask &= day >= first
+    if last != NO_DAY:
+        mask &= day <= last
+    return mask
+
+
+# --- Заказы ---
+
+def order_count(start: str = None, end: str = None) -> int:
+    """Количество заказов; без периода — все, включая заказы без даты"""
+    data = columns('orders')
+    if start is None and end is None:
+        return len(data['day'])
+    return int(np.count_nonzero(_period(data, start, end)))
+
+
+def orders_by_day(start: str = None, end: str = None) -> Dict[str, Dict[str, int]]:
+    """Заказы по дням: {'2026-10-16': {'breakfast': 12, 'lunch': 30, 'total': 42}}"""
+    data = columns('orders')
+    mask = _period(data, start, end)
+    days = data['day'][mask]
+    if not len(days):
+        return {}
+    first = int(days.min())
+    width = len(MEAL_TYPES) + 1
+    # Одна гистограмма по парам (день, тип): строка — день, столбец — тип
+    cells = (days.astype(np.int64) - first) * width + data['type'][mask]
+    counts = np.bincount(cells, minlength=(int(days.max()) - first + 1) * width).reshape(-1, width)
+    totals = counts.sum(axis=1)
+    result = {}
+    for offset in np.flatnonzero(totals):
+        row = counts[offset]
+        stats = {meal_type: int(row[code]) for code, meal_type in enumerate(MEAL_TYPES)}
+        stats['total'] = int(totals[offset])
+        result[day_string(first + offset)] = stats
+    return result
+
+
+def orders_by_student(start: str = None, end: str = None) -> Dict[int, int]:
+    """Количество заказов каждого ученика: {student_id: заказов}"""
+    data = columns('orders')
+    student_ids = data['student_id'] if start is None and end is None \
+        else data['student_id'][_period(data, start, end)]
+    ids, counts = np.unique(student_ids, return_counts=True)
+    return {int(student_id): int(count) for student_id, count in zip(ids, counts) if student_id}
+
+
+def orders_by_class(student_classes: Dict[int, str], start: str = None, end: str = None) -> Dict[str, int]:
+    """Заказы по классам. student_classes — {id ученика: класс};
+    класс берётся текущий, а не на момент заказа"""
+    result: Dict[str, int] = {}
+    for student_id, count in orders_by_student(start, end).items():
+        class_name = student_classes.get(student_id)
+        if class_name:
+            result[class_name] = result.get(class_name, 0) + count
+    return result
+
+
+def orders_by_dish(start: str = None, end: str = None, limit: int = None) -> List[Tuple[int, int]]:
+    """Самые заказываемые позиции меню: [(menu_item_id, заказов)] по убыванию"""
+    data = columns('orders')
+    item_ids = data['menu_item_id'] if start is None and end is None \
+        else data['menu_item_id'][_period(data, start, end)]
+    ids, counts = np.unique(item_ids[item_ids != 0], return_counts=True)
+    order = np.argsort(-counts, kind='stable')
+    if limit is not None:
+        order = order[:limit]
+    return [(int(ids[i]), int(counts[i])) for i in order]
+
+
+def month_string(month: int) -> str:
+    """Номер месяца от 1970-01 -> 'YYYY-MM'"""
+    return str(np.datetime64(int(month), 'M'))
+
+
+def _labels(ids: np.ndarray, labels: Dict[int, int]) -> np.ndarray:
+    """Для каждого id — номер его группы из labels ({id: номер}), -1 — без группы"""
+    size = max(int(ids.max()) if len(ids) else 0, max(labels, default=0)) + 1
+    lookup = np.full(size, -1, dtype=np.int64)
+    for record_id, label in labels.items():
+        if record_id >= 0:
+            lookup[record_id] = label
+    return lookup[ids]
+
+
+def _by_month(groups: np.ndarray, days: np.ndarray, names: List, weights: np.ndarray = None) -> Dict:
+    """{имя группы: {'YYYY-MM': количество или сумма weights}} по номерам групп groups"""
+    keep = groups >= 0
+    groups, days = groups[keep], days[keep]
+    if not len(groups):
+        return {}
+    months = days.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+    first = int(months.min())
+    width = int(months.max()) - first + 1
+    cells = groups * width + (months - first)
+    size = len(names) * width
+    counts = np.bincount(cells, minlength=size).reshape(len(names), width)
+    values = counts if weights is None else \
+        np.bincount(cells, weights=weights[keep], minlength=size).reshape(len(names), width)
+    result: Dict = {}
+    for group, month in zip(*np.nonzero(counts)):
+        value = values[group, month]
+        result.setdefault(names[group], {})[month_string(first + month)] = \
+            int(value) if weights is None else float(value)
+    return result
+
+
+def orders_by_class_and_month(student_classes: Dict[int, str], start: str = None, end: str = None,
+                              spending: bool = False) -> Dict[str, Dict[str, float]]:
+    """Заказы по классам и месяцам: {класс: {'2026-10': заказов}};
+    spending=True — сумма цен заказов вместо количества"""
+    data = columns('orders')
+    mask = _period(data, start, end)
+    names = sorted({class_name for class_name in student_classes.values() if class_name})
+    codes = {class_name: code for code, class_name in enumerate(names)}
+    groups = _labels(data['student_id'][mask], {student_id: codes[class_name]
+                                                  for student_id, class_name in student_classes.items()
+                                                  if class_name})
+    return _by_month(groups, data['day'][mask], names, data['price'][mask] if spending else None)
+
+
+def orders_by_dish_and_month(start: str = None, end: str = None, limit: int = 10) -> Dict[int, Dict[str, int]]:
+    """Заказы самых популярных за период позиций меню по месяцам:
+    {menu_item_id: {'2026-10': заказов}}"""
+    top = [item_id for item_id, _ in orders_by_dish(start, end, limit)]
+    data = columns('orders')
+    mask = _period(data, start, end)
+    groups = _labels(data['menu_item_id'][mask], {item_id: code for code, item_id in enumerate(top)})
+    return _by_month(groups, data['day'][mask], top)
+
+
+# --- Платежи ---
+
+def _payment_mask(data: Dict, start, end, exclude) -> np.ndarray:
+    mask = _period(data, start, end)
+    for payment_type in exclude:
+        code = _payment_types.get(payment_type)
+        if code is not None:
+            mask &= data['type'] != code
+    return mask
+
+
+def revenue(start: str = None, end: str = None, exclude=('recharge',)) -> float:
+    """Сумма платежей за период; пополнения баланса по умолчанию не выручка"""
+    data = columns('payments')
+    return float(data['amount'][_payment_mask(data, start, end, exclude)].sum())
+
+
+def revenue_by_day(start: str = None, end: str = None, exclude=('recharge',)) -> Dict[str, float]:
+    """Сумма платежей по дням: {'2026-10-16': 4200.0}"""
+    data = columns('payments')
+    mask = _payment_mask(data, start, end, exclude)
+    days = data['day'][mask]
+    if not len(days):
+        return {}
+    first = int(days.min())
+    sums = np.bincount(days.astype(np.int64) - first, weights=data['amount'][mask])
+    counts = np.bincount(days.astype(np.int64) - first)
+    return {day_string(first + offset): float(sums[offset]) for offset in np.flatnonzero(counts)}
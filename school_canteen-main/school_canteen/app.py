@@ -1,9 +1,16 @@
-from flask import Flask, render_template, session, redirect, url_for, request, flash
-from auth import auth_bp
-from student_routes import student_bp
-from cook_routes import cook_bp
-from admin_routes import admin_bp
-import config
+import time
+
+_started = time.perf_counter()
+
+from flask import Flask, render_template, session, redirect, url_for, request, flash  # noqa: E402
+from auth import auth_bp  # noqa: E402
+from student_routes import student_bp  # noqa: E402
+from cook_routes import cook_bp  # noqa: E402
+from admin_routes import admin_bp  # noqa: E402
+from data_manager import check_ready  # noqa: E402
+import config  # noqa: E402
+import request_context  # noqa: E402
+import rollups  # noqa: E402
 
 app = Flask(__name__)
 app.secret_key = config.SECRET_KEY
@@ -13,6 +20,21 @@ app.register_blueprint(auth_bp)
 app.register_blueprint(student_bp, url_prefix='/student')
 app.register_blueprint(cook_bp, url_prefix='/cook')
 app.register_blueprint(admin_bp, url_prefix='/admin')
+request_context.init_app(app)
+
+# При старте (в том числе каждого воркера gunicorn) данные только проверяются:
+# создание коллекций и тестовых данных — отдельная команда bootstrap.py
+_missing = check_ready()
+if _missing:
+    raise RuntimeError('Данные не подготовлены, не созданы коллекции: ' + ', '.join(_missing)
+                       + '. Выполните: python bootstrap.py')
+
+# Закрытие прошедших дней в итоги и ночное обслуживание хранилища (rollups.py):
+# поток только ждёт config.ROLLUP_TIME, при старте ничего не записывается
+rollups.start_scheduler()
+
+STARTUP_SECONDS = time.perf_counter() - _started
+app.logger.info('Приложение запущено за %.1f мс', STARTUP_SECONDS * 1000)
 
 
 # Контекстный процессор для передачи темы во все шаблоны
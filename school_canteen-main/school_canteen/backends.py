@@ -0,0 +1,1003 @@
+"""Хранилища данных столовой.
+
+Приложение работает не с файлами, а с коллекциями записей (users, menu,
+orders, ...) через объект хранилища:
+
+    db = get_backend()
+    db.query('orders', student_id=5, date='2026-10-16')
+    with db.transaction('users', 'payments') as tx:
+        tx.patch('users', 5, {'balance': 100})
+        tx.append('payments', {...})
+
+Реализации:
+- JsonBackend — JSON-файлы в каталоге data (поверх storage);
+- SqliteBackend — база SQLite в режиме WAL, записи хранятся как JSON,
+  индексы построены по выражениям json_extract.
+
+Хранилище выбирается настройкой config.STORAGE_BACKEND (переменная
+окружения CANTEEN_STORAGE). Перенос данных — migrate_storage.py.
+
+Заказы и платежи накапливаются за всё время работы столовой, поэтому
+JSON-хранилище держит их по месяцам (data/orders/2026-10.json). Выборки
+за день или месяц читают только нужный раздел, а полный проход по истории
+(scan) открывает разделы по одному.
+
+Заказы и платежи хранят метку времени ts (timestamps.py), которую
+хранилище проставляет при каждой записи. По ней работают выборки за
+период в порядке времени (between, latest) и выборки за день или месяц
+(scan с date_prefix): JSON-хранилище ищет границы двоичным поиском по
+упорядоченному индексу в памяти, SQLite — по индексу (поля, ts).
+
+Записи основных коллекций описаны схемами (models.py). Запись проверяется
+по схеме при каждом изменении в транзакции; JSON-хранилище, кроме того,
+держит прочитанные записи в кэше объектами models.Record, а не словарями.
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+import aggregates
+import config
+import models
+import stock_ledger
+import storage
+import student_counters
+from storage import clone
+from timestamps import date_range, month_of, stamp, timestamp
+
+# Коллекция -> (файл JSON-хранилища, ключ списка записей в документе)
+COLLECTIONS = {
+    'users': (config.USERS_FILE, 'users'),
+    'dishes': (config.DISHES_FILE, 'dishes'),
+    'menu': (config.MENU_FILE, 'menu'),
+    'orders': (config.ORDERS_FILE, 'orders'),
+    'inventory': (config.INVENTORY_FILE, 'inventory'),
+    'purchase_requests': (config.PURCHASE_REQUESTS_FILE, 'requests'),
+    'reviews': (config.REVIEWS_FILE, 'reviews'),
+    'payments': (config.PAYMENTS_FILE, 'payments'),
+    'aggregates': (config.AGGREGATES_FILE, 'aggregates'),
+    'rollups': (config.ROLLUPS_FILE, 'rollups'),
+    'student_counters': (config.STUDENT_COUNTERS_FILE, 'student_counters'),
+    'stock_movements': (config.STOCK_MOVEMENTS_FILE, 'movements'),
+    'stock_snapshots': (config.STOCK_SNAPSHOTS_FILE, 'snapshots'),
+}
+
+# Производные данные, которые пересчитываются в той же транзакции, что и
+# исходные записи: (модуль с TRACKED и changes(), коллекция, в которую он пишет)
+DERIVED = (
+    (aggregates, 'aggregates'),
+    (student_counters, 'student_counters'),
+    (stock_ledger, 'stock_movements'),
+)
+
+# Коллекции, разбитые по месяцам поля date: коллекция -> каталог разделов.
+# У записей этих коллекций есть метка времени ts
+PARTITIONS = {
+    'orders': config.ORDERS_DIR,
+    'payments': config.PAYMENTS_DIR,
+    'stock_movements': config.STOCK_MOVEMENTS_DIR,
+    'stock_snapshots': config.STOCK_SNAPSHOTS_DIR,
+}
+# Раздел для записей без корректной даты
+UNDATED = 'undated'
+_MONTH_RE = re.compile(r'\d{4}-\d{2}')
+
+# Индексы SQLite: по этим полям (и их сочетаниям) ищут записи data_manager
+# и страницы. JSON-хранилище строит такие индексы в памяти по первому запросу.
+INDEXED_FIELDS = {
+    'users': [('username',)],
+    'dishes': [('name',)],
+    'menu': [('date',), ('date', 'type')],
+    'orders': [('student_id',), ('date',), ('menu_item_id',), ('student_id', 'date'),
+               ('ts',), ('student_id', 'ts')],
+    'payments': [('user_id',), ('date',), ('ts',), ('user_id', 'ts')],
+    'reviews': [('student_id',), ('menu_item_id',)],
+    'rollups': [('kind', 'month'), ('user_id', 'month')],
+    'stock_movements': [('ts',), ('item_id', 'ts')],
+    'stock_snapshots': [('ts',)],
+}
+
+
+def _check_collection(collection: str) -> None:
+    if collection not in COLLECTIONS:
+        raise ValueError(f'Неизвестная коллекция: {collection}')
+
+
+def partition_of(record: Dict) -> str:
+    """Раздел записи: месяц YYYY-MM из поля date"""
+    month = str(record.get('date') or '')[:7]
+    return month if _MONTH_RE.fullmatch(month) else UNDATED
+
+
+def _matches_prefix(record: Dict, date_prefix: Optional[str]) -> bool:
+    return not date_prefix or str(record.get('date') or '').startswith(date_prefix)
+
+
+class UnitOfWork:
+    """Изменения, накопленные в транзакции хранилища.
+    Записываются при успешном выходе из блока transaction (по одной
+    записи на файл или одной транзакцией SQLite), при исключении
+    отбрасываются. До фиксации изменения не видны через методы чтения.
+    reason у методов изменения — причина изменения для производных данных
+    (вид движения продукта, stock_ledger.py); она не сохраняется в записи."""
+
+    def __init__(self, backend: 'Backend', collections):
+        self.backend = backend
+        self.collections = set(collections)
+        self.ops: List[Dict] = []
+
+    def _check(self, collection: str) -> None:
+        if collection not in self.collections:
+            raise ValueError(f'Коллекция {collection} не заблокирована этой транзакцией')
+
+    def _staged(self, collection: str, kinds=('add', 'put')) -> List[Dict]:
+        return [op for op in self.ops if op['collection'] == collection and op['op'] in kinds]
+
+    # Чтение — текущее зафиксированное состояние
+    def all(self, collection: str) -> List[Dict]:
+        return self.backend.all(collection)
+
+    def get(self, collection: str, record_id) -> Optional[Dict]:
+        return self.backend.get(collection, record_id)
+
+    def query(self, collection: str, **fields) -> List[Dict]:
+        return self.backend.query(collection, **fields)
+
+    def _current(self, collection: str, record_id) -> Optional[Dict]:
+        """Запись с учётом уже накопленных в транзакции изменений"""
+        record = self.backend.get(collection, record_id)
+        for op in self.ops:
+            if op['collection'] != collection:
+                continue
+            if op['op'] in ('add', 'put') and op['record'].get('id') == record_id:
+                record = op['record']
+            elif op['op'] == 'set' and op['id'] == record_id and record is not None:
+                record = dict(record, **op['fields'])
+            elif op['op'] == 'del' and op['id'] == record_id:
+                record = None
+        return record
+
+    def next_id(self, collection: str) -> int:
+        """id для новой записи с учётом уже добавленных в транзакции"""
+        self._check(collection)
+        # Максимальный id + 1, а не число записей: после удаления id не повторяются
+        staged = [op['record'].get('id') for op in self._staged(collection)]
+        return max([self.backend.next_id(collection)]
+                   + [record_id + 1 for record_id in staged if isinstance(record_id, int)])
+
+    def _add_op(self, op: Dict, reason: Optional[str]) -> None:
+        if reason is not None:
+            op['reason'] = reason
+        self.ops.append(op)
+
+    def append(self, collection: str, record: Dict, reason: str = None) -> int:
+        """Добавляет запись; если у неё нет id, назначает следующий"""
+        self._check(collection)
+        if record.get('id') is None:
+            record['id'] = self.next_id(collection)
+        record = clone(record)
+        if collection in PARTITIONS:
+            stamp(record)
+        models.validate(collection, record)
+        self._add_op({'op': 'add', 'collection': collection, 'record': record}, reason)
+        return record['id']
+
+    def put(self, collection: str, record: Dict, reason: str = None) -> None:
+        """Добавляет запись или заменяет запись с тем же id"""
+        self._check(collection)
+        record = clone(record)
+        if collection in PARTITIONS:
+            stamp(record)
+        models.validate(collection, record)
+        self._add_op({'op': 'put', 'collection': collection, 'record': record}, reason)
+
+    def patch(self, collection: str, record_id, fields: Dict, reason: str = None) -> bool:
+        """Изменяет поля записи. Возвращает False, если записи нет."""
+        self._check(collection)
+        if (self.backend.get(collection, record_id) is None
+                and not any(op['record'].get('id') == record_id for op in self._staged(collection))):
+            return False
+        fields = clone(fields)
+        record = dict(self._current(collection, record_id) or {}, **fields)
+        if collection in PARTITIONS and ('date' in fields or 'time' in fields):
+            # Изменилось время записи — пересчитываем её метку времени
+            fields['ts'] = record['ts'] = timestamp(record)
+        models.validate(collection, record)
+        self._add_op({'op': 'set', 'collection': collection, 'id': record_id, 'fields': fields}, reason)
+        return True
+
+    def delete(self, collection: str, record_id, reason: str = None) -> bool:
+        """Удаляет запись. Возвращает False, если записи нет."""
+        self._check(collection)
+        if self.backend.get(collection, record_id) is None:
+            return False
+        self._add_op({'op': 'del', 'collection': collection, 'id': record_id}, reason)
+        return True
+
+
+class Backend:
+    """Интерфейс хранилища коллекций.
+    Записи, которые возвращают методы чтения, изменять нельзя: JSON-хранилище
+    отдаёт общие объекты кэша. Для изменения нужна копия (storage.clone)."""
+
+    name = None
+
+    # --- Чтение ---
+
+    def all(self, collection: str) -> List[Dict]:
+        """Все записи коллекции в порядке добавления"""
+        raise NotImplementedError
+
+    def get(self, collection: str, record_id) -> Optional[Dict]:
+        """Запись по id или None"""
+        raise NotImplementedError
+
+    def get_many(self, collection: str, record_ids) -> Dict:
+        """Записи по списку id: {id: запись}; отсутствующих id в ответе нет"""
+        records = {}
+        for record_id in set(record_ids):
+            record = self.get(collection, record_id)
+            if record is not None:
+                records[record_id] = record
+        return records
+
+    def query(self, collection: str, **fields) -> List[Dict]:
+        """Записи, у которых поля равны заданным значениям"""
+        raise NotImplementedError
+
+    def scan(self, collection: str, date_prefix: str = None, **fields) -> Iterator[Dict]:
+        """Проход по записям без сборки общего списка.
+        date_prefix — начало поля date ('2026-10' — месяц, '2026-10-16' — день)."""
+        for record in self.query(collection, **fields):
+            if _matches_prefix(record, date_prefix):
+                yield record
+
+    def between(self, collection: str, start: int = None, end: int = None, reverse: bool = False,
+                **fields) -> Iterator[Dict]:
+        """Записи коллекции из PARTITIONS с меткой времени ts в [start, end)
+        (None — без границы) по возрастанию ts, при равных ts — по id;
+        reverse — по убыванию. fields — равенство полей (student_id=5).
+        Записи без корректной даты (без ts) не возвращаются."""
+        raise NotImplementedError
+
+    def latest(self, collection: str, **fields) -> Optional[Dict]:
+        """Самая поздняя по ts запись с заданными полями или None"""
+        return next(self.between(collection, reverse=True, **fields), None)
+
+    def next_id(self, collection: str) -> int:
+        """id для новой записи"""
+        raise NotImplementedError
+
+    def version(self, collection: str):
+        """Версия коллекции: значение, которое меняется при каждом изменении
+        её записей (в том числе из других процессов). По нему кэши поверх
+        хранилища (analytics.py) понимают, что данные пора перечитать."""
+        raise NotImplementedError
+
+    def partition_versions(self, collection: str) -> Dict[str, object]:
+        """Для коллекций из PARTITIONS: {раздел: версия} — версия раздела
+        меняется при изменении записей этого месяца, так что кэш может
+        перечитать только изменившиеся месяцы"""
+        raise NotImplementedError
+
+    def scan_partition(self, collection: str, partition: str) -> Iterator[Dict]:
+        """Записи одного раздела: месяца 'YYYY-MM' или UNDATED"""
+        date_prefix = partition if partition != UNDATED else None
+        for record in self.scan(collection, date_prefix):
+            if partition_of(record) == partition:
+                yield record
+
+    # --- Служебные операции ---
+
+    def exists(self, collection: str) -> bool:
+        """Создана ли коллекция"""
+        raise NotImplementedError
+
+    def create(self, collection: str) -> None:
+        """Создает пустую коллекцию (существующая очищается)"""
+        self.replace_all(collection, [])
+
+    def replace_all(self, collection: str, records: List[Dict]) -> None:
+        """Заменяет содержимое коллекции (заполнение, миграция)"""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """Освобождает ресурсы (соединения с базой)"""
+
+    def compact(self) -> None:
+        """Обслуживание хранилища в спокойное время (ночью): сворачивает
+        накопленные журналы изменений"""
+
+    def add_timestamps(self, collection: str) -> int:
+        """Проставляет ts записям коллекции из PARTITIONS, сохранённым до
+        появления меток времени. Возвращает количество изменённых записей."""
+        raise NotImplementedError
+
+    # --- Запись ---
+
+    @contextmanager
+    def _lock(self, collections):
+        """Блокирует коллекции; возвращает объект, через который пишет _commit"""
+        raise NotImplementedError
+        yield
+
+    def _commit(self, handle, ops: List[Dict]) -> None:
+        raise NotImplementedError
+
+    @contextmanager
+    def transaction(self, *collections: str):
+        """Операция чтение-изменение-запись над несколькими коллекциями.
+        Все нужные коллекции следует перечислить сразу.
+        Если меняются коллекции, от которых зависят производные данные
+        (DERIVED: сводные показатели, счётчики учеников), блокируются и они:
+        их изменения записываются вместе с данными."""
+        for collection in collections:
+            _check_collection(collection)
+        derived = [(module, target) for module, target in DERIVED
+                   if any(collection in module.TRACKED for collection in collections)]
+        locked = tuple(collections)
+        for _, target in derived:
+            if target not in locked:
+                locked += (target,)
+        with self._lock(locked) as handle:
+            tx = UnitOfWork(self, collections)
+            yield tx
+            if tx.ops:
+                ops = list(tx.ops)
+                for module, _ in derived:
+                    ops += module.changes(self, tx.ops)
+                self._commit(handle, ops)
+
+    # Одиночные изменения — транзакция из одной операции
+
+    def append(self, collection: str, record: Dict) -> int:
+        with self.transaction(collection) as tx:
+            return tx.append(collection, record)
+
+    def put(self, collection: str, record: Dict) -> None:
+        with self.transaction(collection) as tx:
+            tx.put(collection, record)
+
+    def patch(self, collection: str, record_id, fields: Dict) -> bool:
+        with self.transaction(collection) as tx:
+            return tx.patch(collection, record_id, fields)
+
+    def delete(self, collection: str, record_id) -> bool:
+        with self.transaction(collection) as tx:
+            return tx.delete(collection, record_id)
+
+
+class JsonBackend(Backend):
+    """Коллекции в JSON-файлах: один документ {ключ: [записи]} на коллекцию,
+    для коллекций из PARTITIONS — по документу на месяц.
+    Чтение идёт через кэш storage, поиск по полям — через хэш-индексы."""
+
+    name = 'json'
+
+    def __init__(self):
+        self._split_checked = set()     # коллекции, для которых проверен старый общий файл
+        self._max_ids: Dict[str, tuple] = {}
+        # Записи, прочитанные с диска, хранятся в кэше объектами models.Record
+        for collection, record_type in models.RECORD_TYPES.items():
+            path, key = COLLECTIONS[collection]
+            storage.register_decoder(PARTITIONS.get(collection, path), key, record_type.load)
+
+    # --- Разделы по месяцам ---
+
+    @staticmethod
+    def _partition_path(collection: str, partition: str) -> str:
+        return os.path.join(PARTITIONS[collection], partition + '.json')
+
+    @staticmethod
+    def _partition_name(path: str) -> str:
+        return os.path.splitext(os.path.basename(path))[0]
+
+    def _partitions(self, collection: str, date_prefix: str = None) -> List[str]:
+        """Пути разделов коллекции по возрастанию месяца.
+        С date_prefix — только разделы, в которых могут быть такие даты."""
+        self._split_legacy(collection)
+        try:
+            names = os.listdir(PARTITIONS[collection])
+        except FileNotFoundError:
+            return []
+        # Раздел может существовать только в виде журнала (.jsonl)
+        partitions = sorted({os.path.splitext(n)[0] for n in names
+                             if n.endswith(('.json', '.jsonl')) and not n.startswith('.')})
+        if date_prefix:
+            month = date_prefix[:7]
+            if len(date_prefix) >= 7:
+                partitions = [p for p in partitions if p == month]
+            else:
+                partitions = [p for p in partitions if p.startswith(date_prefix) and p != UNDATED]
+        return [self._partition_path(collection, p) for p in partitions]
+
+    def _split_legacy(self, collection: str) -> None:
+        """Раскладывает по месяцам старый общий файл коллекции (orders.json)
+        и удаляет его. Выполняется один раз, при первом обращении."""
+        if collection in self._split_checked:
+            return
+        legacy_path, key = COLLECTIONS[collection]
+        if os.path.exists(legacy_path) or os.path.exists(storage.journal_path(legacy_path)):
+            with storage.transaction(legacy_path):
+                if os.path.exists(legacy_path) or os.path.exists(storage.journal_path(legacy_path)):
+                    by_partition: Dict[str, List[Dict]] = {}
+                    for record in storage.load_json(legacy_path).get(key, []):
+                        by_partition.setdefault(partition_of(record), []).append(record)
+                    for partition, records in by_partition.items():
+                        path = self._partition_path(collection, partition)
+                        with storage.transaction(path):
+                            # Раздел мог остаться от прерванного разбиения
+                            ids = {r.get('id') for r in records}
+                            existing = [r for r in storage.load_json(path).get(key, [])
+                                        if r.get('id') not in ids]
+                            storage.save_json(path, {key: existing + records})
+                    storage.remove_document(legacy_path)
+        self._split_checked.add(collection)
+
+    def _stamp_partition(self, collection: str, path: str) -> int:
+        """Проставляет ts записям раздела, сохранённым до появления меток
+        времени (add_timestamps). Возвращает количество изменённых записей."""
+        key = COLLECTIONS[collection][1]
+        stamped = 0
+        if any(not isinstance(r.get('ts'), int) and timestamp(r) is not None
+               for r in storage.load_json_shared(path).get(key, [])):
+            with storage.transaction(COLLECTIONS[collection][0], path):
+                records = storage.load_json(path).get(key, [])
+                for record in records:
+                    if not isinstance(record.get('ts'), int) and timestamp(record) is not None:
+                        stamp(record)
+                        stamped += 1
+                if stamped:
+                    storage.save_json(path, {key: records})
+        return stamped
+
+    def _records(self, path: str, key: str, fields: Dict) -> List[Dict]:
+        if fields:
+            return storage.find_records(path, key, **fields)
+        return storage.load_json_shared(path).get(key, [])
+
+    def _max_id(self, path: str, key: str) -> int:
+        records = storage.load_json_shared(path).get(key, [])
+        # Список кэша заменяется при каждом изменении документа, поэтому
+        # максимум достаточно пересчитывать, только когда сменился сам список
+        cached = self._max_ids.get(path)
+        if cached is None or cached[0] is not records:
+            cached = (records, max((r.get('id', 0) for r in records), default=0))
+            self._max_ids[path] = cached
+        return cached[1]
+
+    # --- Чтение ---
+
+    def all(self, collection: str) -> List[Dict]:
+        if collection in PARTITIONS:
+            return list(self.scan(collection))
+        file_path, key = COLLECTIONS[collection]
+        return storage.load_json_shared(file_path).get(key, [])
+
+    def get(self, collection: str, record_id) -> Optional[Dict]:
+        file_path, key = COLLECTIONS[collection]
+        if collection not in PARTITIONS:
+            return storage.find_record(file_path, key, record_id)
+        # Чаще всего нужны недавние записи — начинаем с последнего месяца
+        for path in reversed(self._partitions(collection)):
+            record = storage.find_record(path, key, record_id)
+            if record is not None:
+                return record
+        return None
+
+    def get_many(self, collection: str, record_ids) -> Dict:
+        wanted = set(record_ids)
+        if collection not in PARTITIONS:
+            return super().get_many(collection, wanted)
+        # Каждый раздел просматривается один раз для всех искомых id
+        key = COLLECTIONS[collection][1]
+        records = {}
+        for path in reversed(self._partitions(collection)):
+            if not wanted:
+                break
+            for record_id in list(wanted):
+                record = storage.find_record(path, key, record_id)
+                if record is not None:
+                    records[record_id] = record
+                    wanted.discard(record_id)
+        return records
+
+    def query(self, collection: str, **fields) -> List[Dict]:
+        if collection in PARTITIONS:
+            date = fields.get('date')
+            return list(self.scan(collection, date_prefix=date if isinstance(date, str) else None, **fields))
+        if not fields:
+            return self.all(collection)
+        file_path, key = COLLECTIONS[collection]
+        return storage.find_records(file_path, key, **fields)
+
+    def scan(self, collection: str, date_prefix: str = None, **fields) -> Iterator[Dict]:
+        if collection not in PARTITIONS:
+            yield from super().scan(collection, date_prefix, **fields)
+            return
+        period = date_range(date_prefix) if date_prefix and 'date' not in fields else None
+        if period is not None:
+            # День, месяц или год — границы по упорядоченному индексу
+            yield from self.between(collection, *period, **fields)
+            return
+        key = COLLECTIONS[collection][1]
+        for path in self._partitions(collection, date_prefix):
+            for record in self._records(path, key, fields):
+                if _matches_prefix(record, date_prefix):
+                    yield record
+
+    def between(self, collection: str, start: int = None, end: int = None, reverse: bool = False,
+                **fields) -> Iterator[Dict]:
+        if collection not in PARTITIONS:
+            raise ValueError(f'У записей коллекции {collection} нет меток времени')
+        key = COLLECTIONS[collection][1]
+        first = month_of(start) if start is not None else None
+        last = month_of(end - 1) if end is not None else None
+        # Раздел — месяц, поэтому разделы по порядку дают записи по порядку ts
+        paths = [path for path in self._partitions(collection)
+                 if self._partition_name(path) != UNDATED
+                 and (first is None or self._partition_name(path) >= first)
+                 and (last is None or self._partition_name(path) <= last)]
+        for path in (reversed(paths) if reverse else paths):
+            yield from storage.find_between(path, key, start, end, reverse, **fields)
+
+    def next_id(self, collection: str) -> int:
+        if collection not in PARTITIONS:
+            # Наибольший id + 1, как в SQLite: «количество записей + 1» после
+            # удаления выдавало id существующей записи, и она заменялась
+            file_path, key = COLLECTIONS[collection]
+            return self._max_id(file_path, key) + 1
+        # Заказ может быть оформлен на дату следующего месяца, поэтому
+        # последний раздел не обязательно содержит наибольший id: берём
+        # максимум по всем разделам (для неизменённых разделов он запомнен)
+        key = COLLECTIONS[collection][1]
+        return max((self._max_id(p, key) for p in self._partitions(collection)), default=0) + 1
+
+    def version(self, collection: str):
+        if collection not in PARTITIONS:
+            return storage.document_version(COLLECTIONS[collection][0])
+        return tuple(sorted(self.partition_versions(collection).items()))
+
+    def partition_versions(self, collection: str) -> Dict[str, object]:
+        return {self._partition_name(path): storage.document_version(path)
+                for path in self._partitions(collection)}
+
+    def scan_partition(self, collection: str, partition: str) -> Iterator[Dict]:
+        # Раздел — отдельный файл, фильтровать записи не нужно
+        key = COLLECTIONS[collection][1]
+        self._split_legacy(collection)
+        yield from storage.load_json_shared(self._partition_path(collection, partition)).get(key, [])
+
+    # --- Служебные операции ---
+
+    def exists(self, collection: str) -> bool:
+        file_path, _ = COLLECTIONS[collection]
+        if collection in PARTITIONS:
+            return os.path.isdir(PARTITIONS[collection]) or os.path.exists(file_path)
+        return os.path.exists(file_path) and os.path.getsize(file_path) > 0
+
+    def create(self, collection: str) -> None:
+        if collection in PARTITIONS:
+            os.makedirs(PARTITIONS[collection], exist_ok=True)
+        else:
+            super().create(collection)
+
+    def replace_all(self, collection: str, records: List[Dict]) -> None:
+        file_path, key = COLLECTIONS[collection]
+        if collection not in PARTITIONS:
+            with storage.transaction(file_path):
+                storage.save_json(file_path, {key: clone(records)})
+            return
+        by_partition: Dict[str, List[Dict]] = {}
+        for record in records:
+            by_partition.setdefault(partition_of(record), []).append(record)
+        with storage.transaction(file_path):
+            os.makedirs(PARTITIONS[collection], exist_ok=True)
+            for path in self._partitions(collection):
+                storage.remove_document(path)
+            for partition, partition_records in sorted(by_partition.items()):
+                path = self._partition_path(collection, partition)
+                with storage.transaction(path):
+                    storage.save_json(path, {key: [stamp(record) for record in clone(partition_records)]})
+
+    def add_timestamps(self, collection: str) -> int:
+        # Раздел блокируется отдельно, вне других транзакций
+        return sum(self._stamp_partition(collection, path) for path in self._partitions(collection))
+
+    def compact(self) -> None:
+        for collection, (file_path, _) in COLLECTIONS.items():
+            paths = self._partitions(collection) if collection in PARTITIONS else [file_path]
+            for path in paths:
+                if os.path.exists(storage.journal_path(path)):
+                    storage.compact_journal(path)
+
+    # --- Запись ---
+
+    @contextmanager
+    def _lock(self, collections):
+        # Для коллекций по месяцам блокировкой всей коллекции служит
+        # блокировка её старого общего файла (data/orders.json.lock)
+        with storage.transaction(*(COLLECTIONS[c][0] for c in collections)) as stx:
+            yield stx
+
+    def _locate(self, collection: str, record_id):
+        """Раздел, в котором сейчас лежит запись, и сама запись"""
+        key = COLLECTIONS[collection][1]
+        for path in reversed(self._partitions(collection)):
+            record = storage.find_record(path, key, record_id)
+            if record is not None:
+                return path, record
+        return None, None
+
+    def _commit(self, stx, ops: List[Dict]) -> None:
+        # Операции накапливаются в транзакции storage и записываются при её
+        # закрытии: одна запись журнала или одна перезапись на файл
+        staged: List[tuple] = []    # (путь, ключ, операция storage)
+        # Для коллекций по месяцам сначала вычисляется итоговое состояние
+        # каждой затронутой записи: [исходный раздел, запись или None, если
+        # удалена, операции над ней]. Запись, которая осталась в своём
+        # разделе, получает свои операции как есть (изменение полей — короткая
+        # запись журнала), а запись, у которой изменился месяц, переносится
+        # в другой раздел целиком
+        final: Dict[tuple, list] = {}
+        for op in ops:
+            collection = op['collection']
+            file_path, key = COLLECTIONS[collection]
+            kind = op['op']
+            if collection not in PARTITIONS:
+                staged.append((file_path, key, op))
+                continue
+            record_id = op['record'].get('id') if kind in ('add', 'put') else op['id']
+            state = final.get((collection, record_id))
+            if state is None:
+                # Новая запись ('add') может оказаться только в своём разделе
+                origin, current = (None, None) if kind == 'add' else self._locate(collection, record_id)
+                state = final[(collection, record_id)] = [origin, current, []]
+            if kind in ('add', 'put'):
+                state[1] = op['record']
+            elif kind == 'set':
+                if state[1] is not None:
+                    state[1] = dict(state[1], **op['fields'])
+            elif kind == 'del':
+                state[1] = None
+            state[2].append(op)
+
+        for (collection, record_id), (origin, record, record_ops) in final.items():
+            key = COLLECTIONS[collection][1]
+            path = self._partition_path(collection, partition_of(record)) if record is not None else None
+            if origin is not None and path is not None and origin != path:
+                staged.append((origin, key, {'op': 'del', 'id': record_id}))
+                staged.append((path, key, {'op': 'put', 'record': record}))
+            elif origin is not None or path is not None:
+                staged.extend((origin or path, key, op) for op in record_ops)
+
+        with storage.transaction(*{path for path, _, _ in staged}) as ptx:
+            for path, key, op in staged:
+                kind = op['op']
+                if kind == 'add':
+                    ptx.append(path, key, op['record'])
+                elif kind == 'put':
+                    ptx.put(path, key, op['record'])
+                elif kind == 'set':
+                    ptx.patch(path, key, op['id'], op['fields'])
+                elif kind == 'del':
+                    ptx.delete(path, key, op['id'])
+
+
+class SqliteBackend(Backend):
+    """Коллекции в базе SQLite: таблица (id, doc) на коллекцию, doc — запись
+    в JSON. Индексы по полям строятся по выражениям json_extract, поэтому
+    новые поля записей не требуют миграции схемы.
+    База работает в режиме WAL: читатели не блокируют писателя. Запись идёт
+    в транзакции BEGIN IMMEDIATE, которая сериализует писателей всех процессов."""
+
+    name = 'sqlite'
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        # После fork соединение родителя использовать нельзя
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # isolation_level=None: транзакции открываются явно в _lock
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        self._create_schema(conn)
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        self._local.depth = 0
+        return conn
+
+    @staticmethod
+    def _field(name: str) -> str:
+        # Имена полей подставляются в SQL — допускаем только идентификаторы
+        if not name.isidentifier():
+            raise ValueError(f'Недопустимое имя поля: {name}')
+        return f"json_extract(doc, '$.{name}')"
+
+    def _create_schema(self, conn: sqlite3.Connection) -> None:
+        for collection in COLLECTIONS:
+            conn.execute(f'CREATE TABLE IF NOT EXISTS {collection} (id INTEGER PRIMARY KEY, doc TEXT NOT NULL)')
+            for fields in INDEXED_FIELDS.get(collection, []):
+                columns = ', '.join(self._field(f) for f in fields)
+                conn.execute(f"CREATE INDEX IF NOT EXISTS {collection}_{'_'.join(fields)} "
+                             f"ON {collection} ({columns})")
+        # Счётчики изменений: строка 'orders' — коллекции (см. version),
+        # строки 'orders/2026-10' — разделов коллекций из PARTITIONS
+        conn.execute('CREATE TABLE IF NOT EXISTS _versions (collection TEXT PRIMARY KEY, version INTEGER NOT NULL)')
+        for collection in PARTITIONS:
+            if conn.execute('SELECT 1 FROM _versions WHERE collection = ?', (collection,)).fetchone() is None:
+                # База создана до появления счётчиков: заводим их для имеющихся месяцев
+                partitions = {partition_of({'date': date}) for date, in
+                              conn.execute(f"SELECT {self._field('date')} FROM {collection}")}
+                self._bump_versions(conn, {collection: partitions})
+
+    def _unstamped(self, conn: sqlite3.Connection, collection: str) -> Dict[int, Dict]:
+        """Записи без ts, которым его можно проставить: {id: запись}"""
+        rows = conn.execute(f"SELECT id, doc FROM {collection} WHERE {self._field('ts')} IS NULL")
+        records = {record_id: json.loads(doc) for record_id, doc in rows}
+        return {record_id: record for record_id, record in records.items() if timestamp(record) is not None}
+
+    def _stamp_rows(self, conn: sqlite3.Connection, collection: str) -> int:
+        """Проставляет ts; вызывается в транзакции записи"""
+        records = self._unstamped(conn, collection)
+        conn.executemany(f'UPDATE {collection} SET doc = ? WHERE id = ?',
+                         ((json.dumps(stamp(record), ensure_ascii=False), record_id)
+                          for record_id, record in records.items()))
+        return len(records)
+
+    @staticmethod
+    def _bump_versions(conn: sqlite3.Connection, touched: Dict[str, set]) -> None:
+        """touched — {коллекция: изменённые разделы}"""
+        keys = []
+        for collection, partitions in touched.items():
+            keys.append(collection)
+            keys.extend(f'{collection}/{partition}' for partition in partitions)
+        conn.executemany('INSERT INTO _versions (collection, version) VALUES (?, 1) '
+                         'ON CONFLICT (collection) DO UPDATE SET version = version + 1',
+                         ((key,) for key in keys))
+
+    def _select(self, collection: str, where: str = '', params=()) -> List[Dict]:
+        _check_collection(collection)
+        rows = self._connection().execute(f'SELECT doc FROM {collection} {where} ORDER BY id', params)
+        return [json.loads(doc) for doc, in rows]
+
+    def all(self, collection: str) -> List[Dict]:
+        return self._select(collection)
+
+    def get(self, collection: str, record_id) -> Optional[Dict]:
+        records = self._select(collection, 'WHERE id = ?', (record_id,))
+        return records[0] if records else None
+
+    def get_many(self, collection: str, record_ids) -> Dict:
+        _check_collection(collection)
+        ids = list(set(record_ids))
+        records = {}
+        # Один запрос на пачку id (не больше лимита параметров SQLite)
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            placeholders = ', '.join('?' * len(chunk))
+            rows = self._connection().execute(
+                f'SELECT id, doc FROM {collection} WHERE id IN ({placeholders})', chunk)
+            for record_id, doc in rows:
+                records[record_id] = json.loads(doc)
+        return records
+
+    def _conditions(self, fields: Dict):
+        conditions, params = [], []
+        for name, value in fields.items():
+            if value is None:
+                conditions.append(f'{self._field(name)} IS NULL')
+            else:
+                conditions.append(f'{self._field(name)} = ?')
+                params.append(value)
+        return conditions, params
+
+    def query(self, collection: str, **fields) -> List[Dict]:
+        conditions, params = self._conditions(fields)
+        where = 'WHERE ' + ' AND '.join(conditions) if conditions else ''
+        return self._select(collection, where, params)
+
+    def scan(self, collection: str, date_prefix: str = None, **fields) -> Iterator[Dict]:
+        _check_collection(collection)
+        period = date_range(date_prefix) if date_prefix and collection in PARTITIONS and 'date' not in fields \
+            else None
+        if period is not None:
+            yield from self.between(collection, *period, **fields)
+            return
+        conditions, params = self._conditions(fields)
+        if date_prefix:
+            # Диапазон вместо LIKE, чтобы работал индекс по date
+            conditions.append(f"{self._field('date')} >= ? AND {self._field('date')} < ?")
+            params += [date_prefix, date_prefix + '\uffff']
+        where = 'WHERE ' + ' AND '.join(conditions) if conditions else ''
+        # Курсор читает строки по мере прохода, а не все сразу
+        for doc, in self._connection().execute(f'SELECT doc FROM {collection} {where} ORDER BY id', params):
+            yield json.loads(doc)
+
+    def between(self, collection: str, start: int = None, end: int = None, reverse: bool = False,
+                **fields) -> Iterator[Dict]:
+        _check_collection(collection)
+        if collection not in PARTITIONS:
+            raise ValueError(f'У записей коллекции {collection} нет меток времени')
+        conditions, params = self._conditions(fields)
+        ts = self._field('ts')
+        conditions.append(f'{ts} IS NOT NULL')
+        if start is not None:
+            conditions.append(f'{ts} >= ?')
+            params.append(start)
+        if end is not None:
+            conditions.append(f'{ts} < ?')
+            params.append(end)
+        direction = 'DESC' if reverse else 'ASC'
+        for doc, in self._connection().execute(
+                f"SELECT doc FROM {collection} WHERE {' AND '.join(conditions)} "
+                f"ORDER BY {ts} {direction}, id {direction}", params):
+            yield json.loads(doc)
+
+    def next_id(self, collection: str) -> int:
+        _check_collection(collection)
+        row = self._connection().execute(f'SELECT COALESCE(MAX(id), 0) + 1 FROM {collection}').fetchone()
+        return row[0]
+
+    def version(self, collection: str) -> int:
+        _check_collection(collection)
+        row = self._connection().execute('SELECT version FROM _versions WHERE collection = ?',
+                                         (collection,)).fetchone()
+        return row[0] if row else 0
+
+    def partition_versions(self, collection: str) -> Dict[str, object]:
+        _check_collection(collection)
+        prefix = collection + '/'
+        rows = self._connection().execute(
+            'SELECT collection, version FROM _versions WHERE collection >= ? AND collection < ?',
+            (prefix, prefix + '\uffff'))
+        return {key[len(prefix):]: version for key, version in rows}
+
+    def exists(self, collection: str) -> bool:
+        # Таблицы создаются при подключении
+        _check_collection(collection)
+        self._connection()
+        return True
+
+    def replace_all(self, collection: str, records: List[Dict]) -> None:
+        if collection in PARTITIONS:
+            records = [stamp(dict(record)) for record in records]
+        with self._lock((collection,)) as conn:
+            conn.execute(f'DELETE FROM {collection}')
+            conn.executemany(f'INSERT OR REPLACE INTO {collection} (id, doc) VALUES (?, ?)',
+                             ((r['id'], json.dumps(r, ensure_ascii=False, default=storage.json_default))
+                              for r in records))
+            # Меняются и прежние разделы коллекции, и разделы новых записей
+            partitions = set()
+            if collection in PARTITIONS:
+                partitions = set(self.partition_versions(collection)) | {partition_of(r) for r in records}
+            self._bump_versions(conn, {collection: partitions})
+
+    def close(self) -> None:
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def add_timestamps(self, collection: str) -> int:
+        with self._lock((collection,)) as conn:
+            return self._stamp_rows(conn, collection)
+
+    def compact(self) -> None:
+        conn = self._connection()
+        # Переносим WAL в основной файл базы и обновляем статистику индексов
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        conn.execute('PRAGMA optimize')
+
+    @contextmanager
+    def _lock(self, collections):
+        conn = self._connection()
+        outermost = self._local.depth == 0
+        if outermost:
+            conn.execute('BEGIN IMMEDIATE')
+        self._local.depth += 1
+        try:
+            yield conn
+        except BaseException:
+            self._local.depth -= 1
+            if outermost:
+                conn.execute('ROLLBACK')
+            raise
+        self._local.depth -= 1
+        if outermost:
+            try:
+                conn.execute('COMMIT')
+            except sqlite3.Error:
+                conn.execute('ROLLBACK')
+                raise
+
+    def _commit(self, conn: sqlite3.Connection, ops: List[Dict]) -> None:
+        touched: Dict[str, set] = {}    # коллекция -> изменённые разделы
+
+        def touch(collection, record):
+            partitions = touched.setdefault(collection, set())
+            if collection in PARTITIONS and record is not None:
+                partitions.add(partition_of(record))
+
+        def current(collection, record_id):
+            row = conn.execute(f'SELECT doc FROM {collection} WHERE id = ?', (record_id,)).fetchone()
+            return json.loads(row[0]) if row else None
+
+        for op in ops:
+            collection = op['collection']
+            kind = op['op']
+            if kind in ('add', 'put'):
+                record = op['record']
+                if kind == 'put' and collection in PARTITIONS:
+                    # Замена могла перенести запись в другой месяц
+                    touch(collection, current(collection, record['id']))
+                touch(collection, record)
+                conn.execute(f'INSERT OR REPLACE INTO {collection} (id, doc) VALUES (?, ?)',
+                             (record['id'], json.dumps(record, ensure_ascii=False)))
+            elif kind == 'set':
+                record = current(collection, op['id'])
+                if record is None:
+                    continue
+                touch(collection, record)
+                record.update(op['fields'])
+                touch(collection, record)
+                conn.execute(f'UPDATE {collection} SET doc = ? WHERE id = ?',
+                             (json.dumps(record, ensure_ascii=False), op['id']))
+            elif kind == 'del':
+                touch(collection, current(collection, op['id']) if collection in PARTITIONS else None)
+                conn.execute(f'DELETE FROM {collection} WHERE id = ?', (op['id'],))
+        self._bump_versions(conn, touched)
+
+
+_backends: Dict[str, Backend] = {}
+_backends_lock = threading.Lock()
+
+
+def get_backend(name: str = None) -> Backend:
+    """Хранилище по имени ('json' или 'sqlite'), по умолчанию — из настроек"""
+    name = name or config.STORAGE_BACKEND
+    with _backends_lock:
+        backend = _backends.get(name)
+        if backend is None:
+            if name == 'json':
+                backend = JsonBackend()
+            elif name == 'sqlite':
+                backend = SqliteBackend(config.SQLITE_FILE)
+            else:
+                raise ValueError(f'Неизвестное хранилище: {name}')
+            _backends[name] = backend
+        return backend
+
+
+def reset_backends() -> None:
+    """Закрывает соединения и забывает созданные хранилища
+    (например, после смены каталога данных в тестах и бенчмарках)"""
+    with _backends_lock:
+        for backend in _backends.values():
+            backend.close()
+        _backends.clear()
+
+
+def migrate(source: str, target: str) -> Dict[str, int]:
+    """Копирует все коллекции из одного хранилища в другое.
+    Возвращает количество перенесённых записей по коллекциям."""
+    src, dst = get_backend(source), get_backend(target)
+    copied = {}
+    for collection in COLLECTIONS:
+        records = src.all(collection) if src.exists(collection) else []
+        dst.replace_all(collection, records)
+        copied[collection] = len(records)
+    return copied
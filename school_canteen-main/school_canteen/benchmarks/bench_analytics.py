@@ -0,0 +1,174 @@
+"""Сравнение отчётов на циклах по записям и на столбцах NumPy (analytics.py).
+
+Во временном каталоге создаётся история столовой за год: ученики разных
+классов, завтраки и обеды по учебным дням и платежи за них. Затем одни и
+те же показатели — статистика повара (по дням, по блюдам, всего), заказы по
+классам и выручка по дням за месяц — считаются:
+    циклы    — проходом по записям, как страницы считали их раньше;
+    загрузка — первым запросом к analytics (чтение и раскладка по столбцам);
+    столбцы  — повторными запросами к уже загруженным столбцам;
+    обновление — запросом после нового заказа (перечитывается один месяц).
+Результаты обоих способов сверяются.
+
+Запуск из каталога school_canteen:
+    python benchmarks/bench_analytics.py --students 400 --days 365 --backend json sqlite
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLASSES = [f'{grade}{letter}' for grade in range(5, 12) for letter in 'АБ']
+MENU_ITEMS = 40
+
+
+def _generate(students, days, seed):
+    """Ученики, заказы и платежи за days дней до сегодняшнего"""
+    rng = random.Random(seed)
+    users = [{'id': i + 1, 'username': f'student{i + 1}', 'role': 'student',
+              'class': rng.choice(CLASSES), 'balance': 0} for i in range(students)]
+    orders, payments = [], []
+    first = date.today() - timedelta(days=days - 1)
+    for offset in range(days):
+        day = first + timedelta(days=offset)
+        if day.weekday() >= 5:
+            continue
+        day_text = day.isoformat()
+        for user in users:
+            for meal_type, chance, price in (('breakfast', 0.6, 50), ('lunch', 0.9, 90)):
+                if rng.random() >= chance:
+                    continue
+                orders.append({'id': len(orders) + 1, 'student_id': user['id'],
+                               'menu_item_id': rng.randint(1, MENU_ITEMS), 'date': day_text,
+                               'time': '08:30', 'type': meal_type, 'price': price, 'status': 'ordered'})
+                payments.append({'id': len(payments) + 1, 'user_id': user['id'], 'amount': price,
+                                 'type': 'meal_purchase', 'date': day_text + 'T08:30:00',
+                                 'status': 'completed'})
+            if day.weekday() == 0:
+                payments.append({'id': len(payments) + 1, 'user_id': user['id'], 'amount': 1000,
+                                 'type': 'recharge', 'date': day_text + 'T07:45:00',
+                                 'status': 'completed'})
+    return users, orders, payments
+
+
+def _loops(db, month):
+    """Показатели проходом по записям — как считали страницы до analytics"""
+    students = {user['id']: user for user in db.all('users') if user['role'] == 'student'}
+    stats_by_day, by_dish, by_class = {}, {}, {}
+    total_orders = 0
+    for order in db.scan('orders'):
+        total_orders += 1
+        menu_item_id = order.get('menu_item_id')
+        if menu_item_id:
+            by_dish[menu_item_id] = by_dish.get(menu_item_id, 0) + 1
+        day = order.get('date')
+        if day:
+            stats = stats_by_day.setdefault(day, {'breakfast': 0, 'lunch': 0, 'total': 0})
+            if order.get('type') in ('breakfast', 'lunch'):
+                stats[order['type']] += 1
+            stats['total'] += 1
+        student = students.get(order.get('student_id'))
+        if student and student.get('class'):
+            by_class[student['class']] = by_class.get(student['class'], 0) + 1
+    revenue_by_day = {}
+    for payment in db.scan('payments', date_prefix=month):
+        if payment.get('type') != 'recharge':
+            day = payment['date'][:10]
+            revenue_by_day[day] = revenue_by_day.get(day, 0) + payment.get('amount', 0)
+    top = sorted(by_dish.items(), key=lambda x: x[1], reverse=True)[:5]
+    return stats_by_day, {count for _, count in top}, by_class, total_orders, revenue_by_day
+
+
+def _columns(analytics, db, month):
+    """Те же показатели через analytics"""
+    classes = {user['id']: user.get('class') for user in db.all('users') if user['role'] == 'student'}
+    month_start = month + '-01'
+    month_end = month + '-31'
+    return (analytics.orders_by_day(),
+            {count for _, count in analytics.orders_by_dish(limit=5)},
+            analytics.orders_by_class(classes),
+            analytics.order_count(),
+            analytics.revenue_by_day(month_start, month_end))
+
+
+def _timed(func, repeat):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - started)
+    return min(times), result
+
+
+def run(backend, users, orders, payments, repeat):
+    work_dir = tempfile.mkdtemp(prefix='canteen_analytics_')
+    os.chdir(work_dir)
+    try:
+        import analytics
+        import backends
+        import config
+        import storage
+        config.STORAGE_BACKEND = backend
+        backends.reset_backends()
+        storage.invalidate_cache()
+        analytics.invalidate()
+
+        db = backends.get_backend()
+        db.replace_all('users', users)
+        db.replace_all('orders', orders)
+        db.replace_all('payments', payments)
+        month = date.today().strftime('%Y-%m')
+
+        # Прогрев: кэш документов JSON-хранилища заполняется один раз
+        list(db.scan('orders'))
+        list(db.scan('payments'))
+
+        loops_time, expected = _timed(lambda: _loops(db, month), repeat)
+        started = time.perf_counter()
+        analytics.columns('orders')
+        analytics.columns('payments')
+        load_time = time.perf_counter() - started
+        columns_time, actual = _timed(lambda: _columns(analytics, db, month), repeat)
+
+        def after_order():
+            db.append('orders', {'student_id': users[0]['id'], 'menu_item_id': 1, 'date': date.today().isoformat(),
+                                 'time': '12:00', 'type': 'lunch', 'price': 90, 'status': 'ordered'})
+            started = time.perf_counter()
+            result = _columns(analytics, db, month)
+            return time.perf_counter() - started, result
+
+        refresh_time = min(after_order()[0] for _ in range(repeat))
+        same = expected == actual and _columns(analytics, db, month) == _loops(db, month)
+        return loops_time, load_time, columns_time, refresh_time, same
+    finally:
+        os.chdir(APP_DIR)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--students', type=int, default=400)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--backend', nargs='+', default=['json'], choices=['json', 'sqlite'])
+    args = parser.parse_args()
+    sys.path.insert(0, APP_DIR)
+
+    users, orders, payments = _generate(args.students, args.days, args.seed)
+    print(f'Учеников: {len(users)}, заказов: {len(orders)}, платежей: {len(payments)}')
+    print(f"{'хранилище':>9} {'циклы, мс':>10} {'загрузка, мс':>13} {'столбцы, мс':>12} "
+          f"{'обновление, мс':>15} {'ускорение':>10}  совпадают")
+    for backend in args.backend:
+        loops_time, load_time, columns_time, refresh_time, same = run(backend, users, orders, payments, args.repeat)
+        print(f'{backend:>9} {loops_time * 1000:>10.1f} {load_time * 1000:>13.1f} {columns_time * 1000:>12.1f} '
+              f'{refresh_time * 1000:>15.1f} {loops_time / columns_time:>9.0f}x  {"да" if same else "НЕТ"}')
+
+
+if __name__ == '__main__':
+    main()
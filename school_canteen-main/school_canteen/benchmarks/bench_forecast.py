@@ -0,0 +1,175 @@
+"""Время прогноза расхода продуктов (forecast.py) на истории за год.
+
+Во временном каталоге создаются каталог блюд с рецептурами, инвентарь,
+меню по учебным дням за год и на неделю вперёд и заказы учеников. Прогноз
+на неделю считается:
+    циклы    — проходом по заказам и записям меню в Python (спрос по блюду
+               и дню недели) и суммированием рецептур по словарям;
+    загрузка — первым вызовом forecast.project (с раскладкой заказов по
+               столбцам analytics);
+    прогноз  — повторными вызовами.
+Ожидаемый остаток в конце прогноза обоими способами сверяется.
+
+Запуск из каталога school_canteen:
+    python benchmarks/bench_forecast.py --students 400 --days 365 --products 300 --backend json sqlite
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DISHES = 40
+DISHES_PER_DAY = 6
+HORIZON = 7
+
+
+def _generate(students, days, products, seed):
+    """Блюда, продукты, меню и заказы за days дней до сегодняшнего и меню на HORIZON дней вперёд"""
+    rng = random.Random(seed)
+    inventory = [{'id': i + 1, 'name': f'продукт {i + 1}', 'quantity': rng.uniform(50, 500), 'unit': 'кг',
+                  'minimum': 20} for i in range(products)]
+    dishes = []
+    for i in range(DISHES):
+        lines = rng.sample(inventory, 6)
+        dishes.append({'id': i + 1, 'name': f'блюдо {i + 1}',
+                       'recipe': [{'ingredient': item['name'], 'quantity': rng.randint(20, 200), 'unit': 'г'}
+                                  for item in lines]})
+    menu, orders = [], []
+    first = date.today() - timedelta(days=days)
+    for offset in range(days + HORIZON):
+        day = first + timedelta(days=offset)
+        if day.weekday() >= 5:
+            continue
+        for dish in rng.sample(dishes, DISHES_PER_DAY):
+            menu.append({'id': len(menu) + 1, 'date': day.isoformat(), 'type': 'lunch', 'dish_id': dish['id'],
+                         'price': 90, 'available': True})
+        if day >= date.today():
+            continue
+        entries = menu[-DISHES_PER_DAY:]
+        for student in range(students):
+            if rng.random() < 0.8:
+                entry = rng.choice(entries)
+                orders.append({'id': len(orders) + 1, 'student_id': student + 1, 'menu_item_id': entry['id'],
+                               'date': entry['date'], 'time': '12:00', 'type': 'lunch', 'price': 90,
+                               'status': 'served'})
+    return dishes, inventory, menu, orders
+
+
+def _loops(db, forecast, recipes, ingredients):
+    """Тот же прогноз циклами по записям"""
+    today = date.today()
+    horizon = [(today + timedelta(days=offset)).isoformat() for offset in range(HORIZON)]
+    first = (today - timedelta(days=forecast.config.FORECAST_HISTORY_DAYS)).isoformat()
+    menu = {entry['id']: entry for entry in db.all('menu')}
+    shown, ordered = {}, {}
+    for entry in menu.values():
+        if first <= entry['date'] < today.isoformat():
+            key = (entry['dish_id'], date.fromisoformat(entry['date']).weekday())
+            shown[key] = shown.get(key, 0) + 1
+    for order in db.scan('orders'):
+        entry = menu.get(order.get('menu_item_id'))
+        if entry and first <= order['date'] < today.isoformat():
+            key = (entry['dish_id'], date.fromisoformat(order['date']).weekday())
+            ordered[key] = ordered.get(key, 0) + 1
+    # Блюдо не было в меню в этот день недели — среднее по блюду
+    dish_shown, dish_ordered = {}, {}
+    for (dish_id, _), value in shown.items():
+        dish_shown[dish_id] = dish_shown.get(dish_id, 0) + value
+    for (dish_id, _), value in ordered.items():
+        dish_ordered[dish_id] = dish_ordered.get(dish_id, 0) + value
+    inventory = db.all('inventory')
+    products = {item['id']: item for item in inventory}
+    resolution = ingredients.resolution(inventory)
+    stock = {item['id']: item['quantity'] for item in inventory}
+    for entry in menu.values():
+        if entry['date'] not in horizon:
+            continue
+        dish_id = entry['dish_id']
+        key = (dish_id, date.fromisoformat(entry['date']).weekday())
+        if key in shown:
+            servings = ordered.get(key, 0) / shown[key]
+        elif dish_id in dish_shown:
+            servings = dish_ordered.get(dish_id, 0) / dish_shown[dish_id]
+        else:
+            servings = sum(ordered.values()) / sum(shown.values())
+        for _, item_id, amount in recipes.entry_portions(resolution, entry, products)[0]:
+            stock[item_id] -= amount * servings
+    return stock
+
+
+def _timed(func, repeat):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - started)
+    return min(times), result
+
+
+def run(backend, data, repeat):
+    dishes, inventory, menu, orders = data
+    work_dir = tempfile.mkdtemp(prefix='canteen_forecast_')
+    os.chdir(work_dir)
+    try:
+        import analytics
+        import backends
+        import config
+        import forecast
+        import ingredients
+        import recipes
+        import storage
+        config.STORAGE_BACKEND = backend
+        backends.reset_backends()
+        storage.invalidate_cache()
+        analytics.invalidate()
+        ingredients.invalidate()
+
+        db = backends.get_backend()
+        db.replace_all('dishes', dishes)
+        db.replace_all('inventory', inventory)
+        db.replace_all('menu', menu)
+        db.replace_all('orders', orders)
+        # Прогрев: кэш документов JSON-хранилища заполняется один раз
+        list(db.scan('orders'))
+
+        loops_time, expected = _timed(lambda: _loops(db, forecast, recipes, ingredients), repeat)
+        started = time.perf_counter()
+        forecast.project(db, HORIZON)
+        load_time = time.perf_counter() - started
+        project_time, report = _timed(lambda: forecast.project(db, HORIZON), repeat)
+
+        projected = {line['item_id']: line['projected'] for line in report['items']}
+        same = all(abs(projected.get(item_id, quantity) - quantity) < 1e-3 for item_id, quantity in expected.items())
+        return loops_time, load_time, project_time, same
+    finally:
+        os.chdir(APP_DIR)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--students', type=int, default=400)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--products', type=int, default=300)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--backend', nargs='+', default=['json'], choices=['json', 'sqlite'])
+    args = parser.parse_args()
+    sys.path.insert(0, APP_DIR)
+
+    data = _generate(args.students, args.days, args.products, args.seed)
+    print(f'Блюд: {len(data[0])}, продуктов: {len(data[1])}, записей меню: {len(data[2])}, заказов: {len(data[3])}')
+    print(f"{'хранилище':>9} {'циклы, мс':>10} {'загрузка, мс':>13} {'прогноз, мс':>12} {'ускорение':>10}  совпадают")
+    for backend in args.backend:
+        loops_time, load_time, project_time, same = run(backend, data, args.repeat)
+        print(f'{backend:>9} {loops_time * 1000:>10.1f} {load_time * 1000:>13.1f} {project_time * 1000:>12.1f} '
+              f'{loops_time / project_time:>9.0f}x  {"да" if same else "НЕТ"}')
+
+
+if __name__ == '__main__':
+    main()
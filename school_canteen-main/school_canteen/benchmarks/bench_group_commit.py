@@ -0,0 +1,82 @@
+"""Нагрузочный тест групповой записи: несколько потоков одного процесса
+добавляют заказы, сравниваются режимы без групповой записи и с окнами
+разной длины. После прогона проверяется, что все заказы дошли до диска.
+
+Запуск из каталога school_canteen:
+    python benchmarks/bench_group_commit.py --threads 8 --orders 400 --window 0 2 5
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+import config  # noqa: E402
+import storage  # noqa: E402
+
+
+def _run(threads, orders, window):
+    """Один прогон; возвращает (время, статистика, результат проверки)"""
+    config.GROUP_COMMIT_MS = window
+    data_dir = tempfile.mkdtemp(prefix='canteen_gc_')
+    orders_file = os.path.join(data_dir, 'orders.json')
+    counter_file = os.path.join(data_dir, 'counter.json')
+    try:
+        storage.save_json(orders_file, {'orders': []})
+        storage.save_json(counter_file, {'count': 0})
+        storage.reset_cache_stats()
+
+        def worker(count):
+            for _ in range(count):
+                with storage.transaction(orders_file, counter_file) as tx:
+                    current = tx.read(orders_file)
+                    storage.append_record(orders_file, 'orders', {'id': len(current['orders']) + 1})
+                    counter = tx.load(counter_file)
+                    counter['count'] += 1
+                    storage.save_json(counter_file, counter)
+
+        per_thread = orders // threads
+        pool = [threading.Thread(target=worker, args=(per_thread,)) for _ in range(threads)]
+        started = time.perf_counter()
+        for thread in pool:
+            thread.start()
+        for thread in pool:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        stats = storage.cache_stats()
+
+        # Проверяем то, что реально записано на диск
+        storage.invalidate_cache()
+        expected = per_thread * threads
+        saved = storage.load_json(orders_file)['orders']
+        with open(counter_file, encoding='utf-8') as f:
+            counter = json.load(f)['count']
+        ok = len(saved) == expected and len({o['id'] for o in saved}) == expected and counter == expected
+        return elapsed, stats, 'OK' if ok else f'ОШИБКА: заказов {len(saved)}, счётчик {counter}'
+    finally:
+        storage.invalidate_cache()
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--orders', type=int, default=400)
+    parser.add_argument('--window', type=float, nargs='+', default=[0, 2, 5])
+    args = parser.parse_args()
+
+    print(f"{'окно, мс':>9} {'время, с':>9} {'заказ/с':>9} {'записей':>8} {'на диск':>8}  проверка")
+    for window in args.window:
+        elapsed, stats, status = _run(args.threads, args.orders, window)
+        print(f"{window:>9g} {elapsed:>9.2f} {args.orders / elapsed:>9.1f} "
+              f"{stats['writes']:>8} {stats['flushes']:>8}  {status}")
+
+
+if __name__ == '__main__':
+    main()
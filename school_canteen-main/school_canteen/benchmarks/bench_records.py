@@ -0,0 +1,111 @@
+"""Память и скорость записей models.Record по сравнению со словарями.
+
+Генерируются заказы, как их создаёт столовая (create_order): несколько
+десятков блюд, учебные дни, время заказа с точностью до минуты. Один и тот
+же JSON разбирается:
+    словари — json.loads, как кэш storage хранил записи раньше;
+    записи  — json.loads и Order.decode (проверка схемы, интернирование).
+Для обоих вариантов замеряются память, которую держат записи (tracemalloc,
+в пересчёте на 100 тыс. заказов), время разбора, обратной записи в JSON и
+прохода по полям, как при подсчёте статистики.
+
+Запуск из каталога school_canteen:
+    python benchmarks/bench_records.py --orders 100000
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+from models import Order  # noqa: E402
+from storage import json_default  # noqa: E402
+from timestamps import stamp  # noqa: E402
+
+DISHES = [f'Блюдо {n}' for n in range(1, 41)]
+
+
+def _generate(count, seed):
+    rng = random.Random(seed)
+    orders = []
+    day = date.today() - timedelta(days=count // 600)
+    while len(orders) < count:
+        day += timedelta(days=1)
+        if day.weekday() >= 5:
+            continue
+        for _ in range(min(600, count - len(orders))):
+            meal_type = rng.choice(('breakfast', 'lunch'))
+            dish = rng.randrange(len(DISHES))
+            orders.append(stamp({
+                'id': len(orders) + 1, 'student_id': rng.randint(1, 400), 'menu_item_id': dish + 1,
+                'menu_item_name': DISHES[dish], 'date': day.isoformat(),
+                'time': f'{rng.randint(8, 14):02d}:{rng.randint(0, 59):02d}', 'type': meal_type,
+                'price': 50 if meal_type == 'breakfast' else 90, 'status': 'ordered',
+            }))
+    return orders
+
+
+def _retained(build):
+    """Память (байт), которую держит результат build(), и время его построения"""
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size, elapsed
+
+
+def _best(func, repeat=3):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - started)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--orders', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    text = json.dumps(_generate(args.orders, args.seed), ensure_ascii=False)
+    scale = 100000 / args.orders
+
+    def decode():
+        return [Order.decode(record) for record in json.loads(text)]
+
+    dicts, dict_bytes, _ = _retained(lambda: json.loads(text))
+    records, record_bytes, _ = _retained(decode)
+    assert [r.to_dict() for r in records] == dicts
+
+    rows = [
+        ('память на 100 тыс., МБ', dict_bytes * scale / 2 ** 20, record_bytes * scale / 2 ** 20),
+        ('разбор JSON, мс', _best(lambda: json.loads(text)) * 1000, _best(decode) * 1000),
+        ('запись в JSON, мс',
+         _best(lambda: json.dumps(dicts, ensure_ascii=False)) * 1000,
+         _best(lambda: json.dumps(records, ensure_ascii=False, default=json_default)) * 1000),
+        ('проход по полям, мс',
+         _best(lambda: sum(r.get('price') or 0 for r in dicts if r.get('status') != 'cancelled')) * 1000,
+         _best(lambda: sum(r.get('price') or 0 for r in records if r.get('status') != 'cancelled')) * 1000),
+    ]
+    print(f'Заказов: {args.orders}')
+    print(f"{'':>24} {'словари':>10} {'записи':>10} {'отношение':>10}")
+    for name, before, after in rows:
+        print(f'{name:>24} {before:>10.1f} {after:>10.1f} {after / before:>10.2f}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,82 @@
+"""Время холодного старта приложения и проверка, что старт ничего не пишет.
+
+Каждый запуск — новый процесс Python, как при старте воркера gunicorn:
+импорт app (модули, Blueprint, проверка готовности данных). Данные
+заранее создаются командой bootstrap.py во временном каталоге; после всех
+запусков сравнивается содержимое каталога данных — файлы не должны
+появляться или изменяться.
+
+Запуск из каталога school_canteen:
+    python benchmarks/bench_startup.py --runs 10 --backend json sqlite
+"""
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_START_SCRIPT = '''
+import sys, time
+started = time.perf_counter()
+sys.path.insert(0, {app_dir!r})
+import app
+print(app.STARTUP_SECONDS, time.perf_counter() - started)
+'''
+
+
+def _snapshot(data_dir):
+    """Файлы каталога данных с размером и временем изменения"""
+    files = {}
+    for root, _, names in os.walk(data_dir):
+        for name in names:
+            path = os.path.join(root, name)
+            st = os.stat(path)
+            files[os.path.relpath(path, data_dir)] = (st.st_size, st.st_mtime_ns)
+    return files
+
+
+def run(runs, backend):
+    work_dir = tempfile.mkdtemp(prefix='canteen_startup_')
+    env = dict(os.environ, CANTEEN_STORAGE=backend)
+    try:
+        subprocess.run([sys.executable, os.path.join(APP_DIR, 'bootstrap.py')],
+                       cwd=work_dir, env=env, check=True, stdout=subprocess.DEVNULL)
+        data_dir = os.path.join(work_dir, 'data')
+        # Блокировки создаются при заполнении и дальше не меняются
+        before = _snapshot(data_dir)
+
+        app_times, total_times = [], []
+        for _ in range(runs):
+            result = subprocess.run([sys.executable, '-c', _START_SCRIPT.format(app_dir=APP_DIR)],
+                                    cwd=work_dir, env=env, check=True, capture_output=True, text=True)
+            app_time, total_time = map(float, result.stdout.split()[-2:])
+            app_times.append(app_time)
+            total_times.append(total_time)
+
+        after = _snapshot(data_dir)
+        changed = sorted(name for name in set(before) | set(after) if before.get(name) != after.get(name))
+        return app_times, total_times, changed
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--backend', nargs='+', default=['json'], choices=['json', 'sqlite'])
+    args = parser.parse_args()
+
+    print(f"{'хранилище':>9} {'запусков':>9} {'app, мс':>9} {'импорт, мс':>11} {'макс., мс':>10}  запись на диск")
+    for backend in args.backend:
+        app_times, total_times, changed = run(args.runs, backend)
+        status = 'нет' if not changed else 'изменены: ' + ', '.join(changed)
+        print(f'{backend:>9} {args.runs:>9} {statistics.median(app_times) * 1000:>9.1f} '
+              f'{statistics.median(total_times) * 1000:>11.1f} {max(total_times) * 1000:>10.1f}  {status}')
+
+
+if __name__ == '__main__':
+    main()
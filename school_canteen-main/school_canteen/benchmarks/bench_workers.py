@@ -0,0 +1,179 @@
+"""Нагрузочный тест хранилища: несколько процессов одновременно оформляют заказы.
+
+Каждый процесс моделирует воркер gunicorn и вызывает data_manager.create_order.
+Все воркеры работают с одними и теми же учениками, поэтому без блокировок
+часть списаний с баланса терялась бы. После прогона проверяется, что
+количество заказов и платежей и итоговые балансы сходятся.
+
+Запуск из каталога school_canteen:
+    python benchmarks/bench_workers.py --workers 1 2 4 8 --orders 400 --backend json sqlite
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PRICE = 50
+START_BALANCE = 1_000_000
+
+
+def _seed(data_dir, students, menu_items):
+    """Создает файлы данных с учениками и меню на сегодня"""
+    os.makedirs(data_dir)
+    today = datetime.now().strftime('%Y-%m-%d')
+    users = [{
+        'id': i + 1,
+        'username': f'student{i + 1}',
+        'password': '',
+        'role': 'student',
+        'full_name': f'Ученик {i + 1}',
+        'email': '',
+        'class': '5А',
+        'allergies': [],
+        'balance': START_BALANCE,
+        'created_at': datetime.now().isoformat()
+    } for i in range(students)]
+    menu = [{
+        'id': i + 1,
+        'date': today,
+        'type': 'lunch',
+        'name': f'Блюдо {i + 1}',
+        'price': PRICE,
+        'available': True
+    } for i in range(menu_items)]
+
+    files = {
+        'users.json': {'users': users},
+        'menu.json': {'menu': menu},
+        'inventory.json': {'inventory': []},
+        'purchase_requests.json': {'requests': []},
+        'reviews.json': {'reviews': []}
+    }
+    for name, data in files.items():
+        with open(os.path.join(data_dir, name), 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+    # Заказы и платежи хранятся по месяцам — пустые каталоги разделов
+    for name in ('orders', 'payments'):
+        os.makedirs(os.path.join(data_dir, name), exist_ok=True)
+
+
+def _migrate(work_dir, backend):
+    """Переносит заполненные JSON-файлы в проверяемое хранилище"""
+    if backend == 'json':
+        return
+    sys.path.insert(0, APP_DIR)
+    os.chdir(work_dir)
+    import backends
+    backends.migrate('json', backend)
+    backends.reset_backends()
+
+
+def _worker(work_dir, jobs, start_event, students, backend):
+    os.chdir(work_dir)
+    sys.path.insert(0, APP_DIR)
+    os.environ['CANTEEN_STORAGE'] = backend
+    import data_manager
+
+    start_event.wait()
+    for number in jobs:
+        # Номер заказа однозначно задает пару (ученик, блюдо), так что
+        # проверка «уже заказано сегодня» не срабатывает
+        student_id = number % students + 1
+        menu_item_id = number // students + 1
+        if not data_manager.create_order(student_id, menu_item_id):
+            raise RuntimeError(f'Заказ {number} не создан')
+
+
+def _verify(work_dir, total_orders, students, backend):
+    sys.path.insert(0, APP_DIR)
+    os.chdir(work_dir)
+    import backends
+    import storage
+    storage.invalidate_cache()
+
+    db = backends.get_backend(backend)
+    orders = db.all('orders')
+    payments = db.all('payments')
+    users = {u['id']: u for u in db.all('users')}
+    backends.reset_backends()
+
+    problems = []
+    if len(orders) != total_orders:
+        problems.append(f'заказов {len(orders)} вместо {total_orders}')
+    if len({o['id'] for o in orders}) != len(orders):
+        problems.append('повторяющиеся id заказов')
+    meal_payments = [p for p in payments if p.get('type') == 'meal_purchase']
+    if len(meal_payments) != total_orders:
+        problems.append(f'платежей {len(meal_payments)} вместо {total_orders}')
+
+    per_student = {}
+    for number in range(total_orders):
+        student_id = number % students + 1
+        per_student[student_id] = per_student.get(student_id, 0) + 1
+    for student_id, count in per_student.items():
+        expected = START_BALANCE - count * PRICE
+        if users[student_id]['balance'] != expected:
+            problems.append(f'баланс ученика {student_id}: {users[student_id]["balance"]} вместо {expected}')
+            break
+    return problems
+
+
+def run(workers, total_orders, students, backend='json'):
+    work_dir = tempfile.mkdtemp(prefix='canteen_bench_')
+    try:
+        menu_items = total_orders // students + 1
+        _seed(os.path.join(work_dir, 'data'), students, menu_items)
+        _migrate(work_dir, backend)
+
+        ctx = multiprocessing.get_context('spawn')
+        start_event = ctx.Event()
+        processes = []
+        for w in range(workers):
+            jobs = list(range(w, total_orders, workers))
+            p = ctx.Process(target=_worker, args=(work_dir, jobs, start_event, students, backend))
+            p.start()
+            processes.append(p)
+
+        # Даем воркерам импортировать модули, затем стартуем одновременно
+        time.sleep(1.0)
+        started = time.perf_counter()
+        start_event.set()
+        for p in processes:
+            p.join()
+        elapsed = time.perf_counter() - started
+
+        failed = [p.exitcode for p in processes if p.exitcode != 0]
+        problems = _verify(work_dir, total_orders, students, backend)
+        if failed:
+            problems.append(f'воркеры завершились с ошибкой: {failed}')
+        return elapsed, problems
+    finally:
+        os.chdir(APP_DIR)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--orders', type=int, default=400, help='всего заказов за прогон')
+    parser.add_argument('--students', type=int, default=50)
+    parser.add_argument('--backend', nargs='+', default=['json'], choices=['json', 'sqlite'])
+    args = parser.parse_args()
+
+    print(f"{'хранилище':>9} {'воркеры':>8} {'заказов':>8} {'время, с':>9} {'заказ/с':>9}  проверка")
+    for backend in args.backend:
+        for workers in args.workers:
+            elapsed, problems = run(workers, args.orders, args.students, backend)
+            status = 'OK' if not problems else '; '.join(problems)
+            print(f'{backend:>9} {workers:>8} {args.orders:>8} {elapsed:>9.2f} {args.orders / elapsed:>9.1f}  {status}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+"""Подготовка данных столовой: создание коллекций и тестовых данных.
+
+Запуск из каталога school_canteen перед первым стартом приложения:
+    python bootstrap.py                # коллекции, тестовые пользователи и меню
+    python bootstrap.py --no-menu      # без тестового меню
+    python bootstrap.py --no-users     # без тестовых пользователей
+    python bootstrap.py --check        # только проверить готовность, ничего не записывая
+
+Повторный запуск безопасен: существующие данные не изменяются.
+Приложение само данные не создаёт — при старте оно лишь проверяет,
+что все коллекции на месте.
+"""
+import argparse
+import sys
+
+import data_manager
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--no-users', action='store_true', help='не создавать тестовых пользователей')
+    parser.add_argument('--no-menu', action='store_true', help='не создавать тестовое меню')
+    parser.add_argument('--check', action='store_true', help='только проверить готовность данных')
+    args = parser.parse_args()
+
+    if args.check:
+        missing = data_manager.check_ready()
+        if missing:
+            print('Не созданы коллекции: ' + ', '.join(missing))
+            return 1
+        print('Данные готовы')
+        return 0
+
+    created = data_manager.init_all_data(users=not args.no_users, menu=not args.no_menu)
+    print(f"Коллекции созданы. Новых пользователей: {created['users']}, блюд в меню: {created['menu']}")
+    if created['normalized']:
+        print(f"Меню переведено на каталог блюд: {created['normalized']} записей")
+    if created['stamped']:
+        print(f"Метки времени проставлены записям: {created['stamped']}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,70 @@
+"""Ингредиенты блюд, которые не сопоставлены с продуктами инвентаря.
+
+При выдаче блюда списываются только сопоставленные ингредиенты
+(ingredients.py); остальные повар видит как «Не найден ингредиент».
+Команда выводит для каждого блюда каталога ингредиенты без продукта:
+не найденные, подходящие к нескольким продуктам и со ссылкой на
+удалённый продукт. Исправить — псевдонимом продукта (поле aliases) или
+явной ссылкой в блюде (ingredient_links: {ингредиент: id продукта}).
+Выводятся и строки рецептур (recipes.py), количество в которых нельзя
+пересчитать в единицу продукта. Код возврата 1, если такие ингредиенты есть.
+
+Запуск из каталога school_canteen:
+    python check_ingredients.py
+    python check_ingredients.py --all    # и сопоставленные ингредиенты
+"""
+import argparse
+import sys
+
+import backends
+import ingredients
+import recipes
+
+REASONS = {
+    ingredients.MISSING: 'продукт не найден',
+    ingredients.AMBIGUOUS: 'подходит несколько продуктов',
+    ingredients.BROKEN_LINK: 'ссылка на удалённый продукт',
+}
+WAYS = {
+    ingredients.BY_LINK: 'по ссылке',
+    ingredients.BY_NAME: 'по названию',
+    ingredients.BY_WORDS: 'по словам',
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--all', action='store_true', help='показать и сопоставленные ингредиенты')
+    args = parser.parse_args()
+
+    backend = backends.get_backend()
+    resolution = ingredients.resolution()
+    products = {item.get('id'): item for item in backend.all('inventory')}
+    unresolved = 0
+    for dish in backend.all('dishes'):
+        lines = []
+        portions = resolution.portions.get(dish.get('id'), {})
+        for ingredient, product_id, how in resolution.dishes.get(dish.get('id'), ()):
+            if product_id is None:
+                unresolved += 1
+                lines.append(f'  {ingredient}: {REASONS[how]}')
+                continue
+            product = products.get(product_id, {})
+            try:
+                amount = recipes.portion(portions.get(ingredient), product.get('unit'))
+            except ValueError as e:
+                unresolved += 1
+                lines.append(f"  {ingredient} -> {product.get('name')}: рецептура: {e}")
+                continue
+            if args.all:
+                lines.append(f"  {ingredient} -> {product.get('name')} (id {product_id}, {WAYS[how]}), "
+                             f"{amount:g} {product.get('unit', '')} на порцию")
+        if lines:
+            print(f"{dish.get('name')} (id {dish.get('id')}):")
+            print('\n'.join(lines))
+    print('Все ингредиенты сопоставлены' if not unresolved else f'Не сопоставлено ингредиентов: {unresolved}')
+    return 1 if unresolved else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
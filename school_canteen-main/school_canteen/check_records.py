@@ -0,0 +1,46 @@
+"""Проверка сохранённых записей по схемам коллекций (models.py).
+
+Новые и изменённые записи проверяются при записи, но данные, сохранённые
+раньше или исправленные вручную, могут не соответствовать схеме. Такие
+записи приложение читает как обычные словари и пишет о них предупреждение;
+команда выводит их все. Код возврата 1, если найдены некорректные записи.
+
+Запуск из каталога school_canteen:
+    python check_records.py
+    python check_records.py --collection orders payments
+"""
+import argparse
+import sys
+
+import backends
+import models
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--collection', nargs='+', choices=sorted(models.RECORD_TYPES),
+                        default=sorted(models.RECORD_TYPES))
+    args = parser.parse_args()
+
+    backend = backends.get_backend()
+    invalid = 0
+    for collection in args.collection:
+        record_type = models.RECORD_TYPES[collection]
+        checked = 0
+        for record in backend.scan(collection):
+            checked += 1
+            # Записи, прошедшие проверку при чтении, хранилище уже отдаёт объектами
+            if isinstance(record, models.Record):
+                continue
+            try:
+                record_type.decode(record)
+            except models.InvalidRecordError as e:
+                invalid += 1
+                print(f'{collection}: {e}')
+        print(f'{collection}: проверено {checked}')
+    print('Некорректных записей нет' if not invalid else f'Некорректных записей: {invalid}')
+    return 1 if invalid else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,39 @@
+"""Закрытие прошедших дней в итоги по месяцам (rollups.py).
+
+Приложение закрывает дни само каждую ночь (config.ROLLUP_TIME). Команда
+нужна, если планировщик в приложении выключен (CANTEEN_ROLLUP_TIME=''),
+например чтобы запускать закрытие из cron, и для полного пересчёта
+итогов после переноса данных между хранилищами или ручной правки файлов.
+
+Запуск из каталога school_canteen:
+    python close_days.py               # закрыть незакрытые и изменённые дни, свернуть журналы
+    python close_days.py --rebuild     # пересчитать итоги всех месяцев
+    python close_days.py --no-compact  # без обслуживания хранилища
+"""
+import argparse
+import sys
+import time
+
+import backends
+import rollups
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rebuild', action='store_true', help='пересчитать итоги всех месяцев')
+    parser.add_argument('--no-compact', action='store_true', help='не сворачивать журналы хранилища')
+    args = parser.parse_args()
+
+    backend = backends.get_backend()
+    started = time.perf_counter()
+    closed = rollups.close_days(backend, rebuild=args.rebuild)
+    print(f"Пересчитаны итоги за месяцы: {', '.join(closed) if closed else 'нет изменений'}")
+    if not args.no_compact:
+        backend.compact()
+        print('Журналы хранилища свернуты')
+    print(f'Готово за {time.perf_counter() - started:.1f} с')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
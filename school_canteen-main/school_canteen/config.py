@@ -3,8 +3,69 @@ import os
 SECRET_KEY = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
 DATA_DIR = 'data'
 USERS_FILE = os.path.join(DATA_DIR, 'users.json')
+# Меню на день ссылается на блюда каталога (dish_id), а не копирует их
 MENU_FILE = os.path.join(DATA_DIR, 'menu.json')
+DISHES_FILE = os.path.join(DATA_DIR, 'dishes.json')
 ORDERS_FILE = os.path.join(DATA_DIR, 'orders.json')
 INVENTORY_FILE = os.path.join(DATA_DIR, 'inventory.json')
 PURCHASE_REQUESTS_FILE = os.path.join(DATA_DIR, 'purchase_requests.json')
-REVIEWS_FILE = os.path.join(DATA_DIR, 'reviews.json')
\ No newline at end of file
+REVIEWS_FILE = os.path.join(DATA_DIR, 'reviews.json')
+PAYMENTS_FILE = os.path.join(DATA_DIR, 'payments.json')
+# Сводные показатели для администратора (aggregates.py)
+AGGREGATES_FILE = os.path.join(DATA_DIR, 'aggregates.json')
+# Итоги закрытых дней по месяцам (rollups.py)
+ROLLUPS_FILE = os.path.join(DATA_DIR, 'rollups.json')
+# Счётчики питания учеников за месяц (student_counters.py)
+STUDENT_COUNTERS_FILE = os.path.join(DATA_DIR, 'student_counters.json')
+
+# Заказы и платежи хранятся по месяцам: data/orders/2026-10.json.
+# Старые orders.json и payments.json раскладываются по месяцам при первом обращении
+ORDERS_DIR = os.path.join(DATA_DIR, 'orders')
+PAYMENTS_DIR = os.path.join(DATA_DIR, 'payments')
+# Движения продуктов и снимки остатков (stock_ledger.py) — тоже по месяцам
+STOCK_MOVEMENTS_FILE = os.path.join(DATA_DIR, 'stock_movements.json')
+STOCK_SNAPSHOTS_FILE = os.path.join(DATA_DIR, 'stock_snapshots.json')
+STOCK_MOVEMENTS_DIR = os.path.join(DATA_DIR, 'stock_movements')
+STOCK_SNAPSHOTS_DIR = os.path.join(DATA_DIR, 'stock_snapshots')
+
+# Хранилище данных: 'json' (файлы в DATA_DIR) или 'sqlite' (SQLITE_FILE).
+# Перенос данных между ними: python migrate_storage.py --to sqlite
+STORAGE_BACKEND = os.environ.get('CANTEEN_STORAGE', 'json')
+SQLITE_FILE = os.environ.get('CANTEEN_SQLITE_FILE', os.path.join(DATA_DIR, 'canteen.db'))
+
+# Журналируемые коллекции: новые записи и изменения статусов дописываются
+# в файл <имя>.jsonl рядом с основным снимком, а не переписывают весь файл
+JOURNAL_ENABLED = os.environ.get('CANTEEN_JOURNAL', '1') != '0'
+JOURNAL_FILES = (ORDERS_FILE, PAYMENTS_FILE, AGGREGATES_FILE, ROLLUPS_FILE, STUDENT_COUNTERS_FILE)
+# Каталоги, все файлы которых журналируются (месячные разделы)
+JOURNAL_DIRS = (ORDERS_DIR, PAYMENTS_DIR, STOCK_MOVEMENTS_DIR)
+# После скольких записей журнал автоматически сворачивается в снимок
+JOURNAL_COMPACT_THRESHOLD = int(os.environ.get('CANTEEN_JOURNAL_COMPACT', '1000'))
+
+# Групповая запись: записи в один файл, пришедшие в пределах окна (мс),
+# объединяются в одну физическую запись. 0 — выключено.
+# Режим рассчитан на один процесс с несколькими потоками.
+GROUP_COMMIT_MS = float(os.environ.get('CANTEEN_GROUP_COMMIT_MS', '0'))
+
+# Чтения data_manager запоминаются на время одного запроса (request_context.py)
+REQUEST_SNAPSHOT = os.environ.get('CANTEEN_REQUEST_SNAPSHOT', '1') != '0'
+
+# Фоновые отчеты администратора (report_jobs.py): результаты хранятся в
+# REPORTS_DIR, считаются в пуле процессов ('process') или потоков ('thread')
+REPORTS_DIR = os.path.join(DATA_DIR, 'reports')
+REPORT_POOL = os.environ.get('CANTEEN_REPORT_POOL', 'process')
+REPORT_WORKERS = int(os.environ.get('CANTEEN_REPORT_WORKERS', '2'))
+# Задание, которое не завершилось за это время (с), считается потерянным
+# (например, воркер перезапустили) и при повторном запросе ставится заново
+REPORT_JOB_TIMEOUT = int(os.environ.get('CANTEEN_REPORT_JOB_TIMEOUT', '600'))
+
+# Закрытие дней в итоги (rollups.py) и сворачивание журналов — каждую ночь
+# в это время (ЧЧ:ММ) в одном из процессов приложения (не при старте).
+# Пустая строка — не запускать, тогда закрытие запускается командой
+# (например, из cron): python close_days.py
+ROLLUP_TIME = os.environ.get('CANTEEN_ROLLUP_TIME', '01:00')
+
+# Прогноз расхода продуктов (forecast.py): на сколько дней вперёд и за
+# сколько прошедших дней брать заказы
+FORECAST_DAYS = int(os.environ.get('CANTEEN_FORECAST_DAYS', '7'))
+FORECAST_HISTORY_DAYS = int(os.environ.get('CANTEEN_FORECAST_HISTORY_DAYS', '365'))
@@ -1,8 +1,15 @@
 from flask import Blueprint, render_template, session, redirect, url_for, flash, request
 from functools import wraps
-from data_manager import get_menu_items, load_json, save_json, get_menu_item_by_id, consume_ingredients_for_menu_item
-from data_manager import get_user_by_id, update_user
+from data_manager import get_menu_items, get_menu_item_by_id, consume_ingredients_for_menu_item
+from data_manager import get_menu_items_by_ids, get_users_by_ids, join_records
+from data_manager import get_user_by_id, get_order_by_id, add_order, update_order
+from data_manager import get_orders, get_inventory, seed_inventory, add_inventory_item, update_inventory_item
+from data_manager import get_purchase_requests, add_purchase_request, prepare_orders, serve_orders, get_stock_at
+from data_manager import update_purchase_request, delete_purchase_request, forecast_purchases
 from datetime import datetime
+import analytics
+import forecast
+import stock_ledger
 
 cook_bp = Blueprint('cook', __name__)
 
@@ -25,15 +32,16 @@ def cook_required(f):
 def dashboard():
     """Панель управления повара"""
     # Получаем инвентарь
-    inventory = load_json('data/inventory.json').get('inventory', [])
+    inventory = get_inventory()
 
-    # Получаем заявки на закупку
-    requests = load_json('data/purchase_requests.json').get('requests', [])
+    # Получаем заявки на закупку; черновики по прогнозу расхода — отдельно
+    requests = get_purchase_requests()
+    drafts = [r for r in requests if r.get('status') == forecast.DRAFT]
+    requests = [r for r in requests if r.get('status') != forecast.DRAFT]
 
     # Получаем сегодняшние заказы
-    orders = load_json('data/orders.json').get('orders', [])
     today = datetime.now().strftime('%Y-%m-%d')
-    today_orders = [order for order in orders if order.get('date') == today]
+    today_orders = get_orders(date=today)
 
     # Получаем сегодняшнее меню для статистики
     menu_today = get_menu_items(date=today)
@@ -41,6 +49,7 @@ def dashboard():
     return render_template('cook/dashboard.html',
                            inventory=inventory[:10],
                            requests=requests[:5],
+                           drafts=drafts,
                            today_orders=today_orders,
                            menu_today=menu_today,
                            today=today)
@@ -50,11 +59,9 @@ def dashboard():
 @cook_required
 def inventory():
     """Управление инвентарем"""
-    inventory_data = load_json('data/inventory.json')
-
     # Если инвентарь пустой, создаем тестовые данные
-    if not inventory_data.get('inventory'):
-        inventory_data['inventory'] = [
+    if not get_inventory():
+        seed_inventory([
             {
                 'id': 1,
                 'name': 'Картофель',
@@ -105,10 +112,20 @@ def inventory():
                 'expires': '2024-12-28',
                 'description': 'Репчатый лук'
             }
-        ]
-        save_json('data/inventory.json', inventory_data)
+        ])
+
+    # Остатки на прошедшую дату — по журналу движений продуктов
+    stock_date = request.args.get('at') or None
+    stock_at = None
+    if stock_date:
+        try:
+            stock_at = get_stock_at(stock_date)
+        except ValueError:
+            flash('Неверная дата', 'danger')
+            stock_date = None
 
-    return render_template('cook/inventory.html', inventory=inventory_data.get('inventory', []))
+    return render_template('cook/inventory.html', inventory=get_inventory(), stock_date=stock_date,
+                           stock_at=stock_at, movement_kinds=_MANUAL_MOVEMENTS)
 
 
 @cook_bp.route('/menu')
@@ -124,9 +141,7 @@ def menu():
     lunch_items = [item for item in menu_items if item['type'] == 'lunch']
 
     # Получаем заказы на сегодня
-    orders_data = load_json('data/orders.json')
-    today_orders = [order for order in orders_data.get('orders', [])
-                    if order.get('date') == date]
+    today_orders = get_orders(date=date)
 
     # Считаем статистику по заказам
     order_stats = {}
@@ -135,9 +150,8 @@ def menu():
         if item_id:
             order_stats[item_id] = order_stats.get(item_id, 0) + 1
 
-    # Получаем студентов для отображения имен
-    users_data = load_json('data/users.json')
-    students = {user['id']: user for user in users_data.get('users', []) if user.get('role') == 'student'}
+    # Получаем студентов для отображения имен — только тех, кто сделал заказы
+    students = get_users_by_ids(order.get('student_id') for order in today_orders)
 
     return render_template('cook/menu.html',
                            breakfast_items=breakfast_items,
@@ -157,10 +171,7 @@ def issue_meal():
     menu_item_id = request.form.get('menu_item_id')
 
     # Добавляем запись о выдаче
-    orders_data = load_json('data/orders.json')
-
     new_order = {
-        'id': len(orders_data['orders']) + 1,
         'student_id': int(student_id),
         'meal_type': meal_type,
         'date': datetime.now().strftime('%Y-%m-%d'),
@@ -181,19 +192,8 @@ def issue_meal():
         except ValueError:
             pass
 
-    orders_data['orders'].append(new_order)
-    save_json('data/orders.json', orders_data)
-
-    # Синхронизируем поле meals_this_month в профиле ученика
-    try:
-        month_prefix = datetime.now().strftime('%Y-%m')
-        monthly_meals = len([
-            o for o in orders_data.get('orders', [])
-            if o.get('student_id') == int(student_id) and o.get('date', '').startswith(month_prefix)
-        ])
-        update_user(int(student_id), {'meals_this_month': monthly_meals})
-    except Exception:
-        pass
+    # Счётчики питания ученика обновятся в той же транзакции (student_counters.py)
+    add_order(new_order)
 
     flash('Питание успешно выдано', 'success')
     return redirect(url_for('cook.dashboard'))
@@ -207,39 +207,79 @@ def purchase_request():
     quantity = request.form.get('quantity')
     reason = request.form.get('reason')
 
-    requests_data = load_json('data/purchase_requests.json')
-
-    new_request = {
-        'id': len(requests_data['requests']) + 1,
+    add_purchase_request({
         'product': product,
         'quantity': quantity,
         'reason': reason,
         'status': 'pending',
         'created_by': session['user_id'],
         'created_at': datetime.now().isoformat()
-    }
-
-    requests_data['requests'].append(new_request)
-    save_json('data/purchase_requests.json', requests_data)
+    })
 
     flash('Заявка на закупку создана', 'success')
     return redirect(url_for('cook.dashboard'))
 
 
+@cook_bp.route('/forecast', methods=['POST'])
+@cook_required
+def run_forecast():
+    """Прогноз расхода продуктов и черновики заявок на закупку"""
+    report = forecast_purchases()
+    drafts = report['drafts']
+    if report['at_risk']:
+        flash('Опустятся ниже минимума: ' + ', '.join(f"{line['name']} ({line['below_on']})"
+                                                      for line in report['at_risk']), 'warning')
+    else:
+        flash(f"По прогнозу на {len(report['days'])} дн. всех продуктов хватит", 'success')
+    if drafts['created'] or drafts['updated']:
+        flash(f"Черновиков заявок: новых {drafts['created']}, обновлено {drafts['updated']}", 'info')
+    return redirect(url_for('cook.dashboard'))
+
+
+def _is_draft(request_id) -> bool:
+    return any(r.get('id') == request_id and r.get('status') == forecast.DRAFT for r in get_purchase_requests())
+
+
+@cook_bp.route('/submit_request/<int:request_id>', methods=['POST'])
+@cook_required
+def submit_request(request_id):
+    """Отправка черновика заявки администратору"""
+    if not _is_draft(request_id):
+        flash('Черновик заявки не найден', 'danger')
+        return redirect(url_for('cook.dashboard'))
+
+    update_purchase_request(request_id, {
+        'status': 'pending',
+        'created_by': session['user_id'],
+        'created_at': datetime.now().isoformat()
+    })
+    flash('Заявка на закупку отправлена', 'success')
+    return redirect(url_for('cook.dashboard'))
+
+
+@cook_bp.route('/discard_request/<int:request_id>', methods=['POST'])
+@cook_required
+def discard_request(request_id):
+    """Удаление черновика заявки"""
+    if not _is_draft(request_id):
+        flash('Черновик заявки не найден', 'danger')
+        return redirect(url_for('cook.dashboard'))
+
+    delete_purchase_request(request_id)
+    flash('Черновик заявки удален', 'info')
+    return redirect(url_for('cook.dashboard'))
+
+
 @cook_bp.route('/prepare_meal/<int:order_id>')
 @cook_required
 def prepare_meal(order_id):
     """Отметка о приготовлении блюда"""
-    orders_data = load_json('data/orders.json')
-
-    for order in orders_data.get('orders', []):
-        if order.get('id') == order_id:
-            order['status'] = 'prepared'
-            order['prepared_by'] = session['user_id']
-            order['prepared_at'] = datetime.now().strftime('%H:%M')
-            break
+    update_order(order_id, {
+        'status': 'prepared',
+        'prepared_by': session['user_id'],
+        'prepared_at': datetime.now().strftime('%H:%M')
+    })
 
-    save_json('data/orders.json', orders_data)
     flash('Блюдо отмечено как приготовленное', 'success')
     return redirect(request.referrer or url_for('cook.menu'))
 
@@ -248,26 +288,24 @@ def prepare_meal(order_id):
 @cook_required
 def serve_meal(order_id):
     """Отметка о выдаче блюда — при выдаче списываем ингредиенты из инвентаря, если блюдо связано с menu_item."""
-    orders_data = load_json('data/orders.json')
+    order = get_order_by_id(order_id)
 
     served_changes = []
-    for order in orders_data.get('orders', []):
-        if order.get('id') == order_id:
-            order['status'] = 'served'
-            order['served_by'] = session['user_id']
-            order['served_at'] = datetime.now().strftime('%H:%M')
-
-            # Если заказ связан с блюдом — списываем ингредиенты
-            menu_item_id = order.get('menu_item_id')
-            if menu_item_id:
-                try:
-                    changes = consume_ingredients_for_menu_item(menu_item_id, servings=1)
-                    served_changes = changes
-                except Exception:
-                    served_changes = []
-            break
-
-    save_json('data/orders.json', orders_data)
+    if order:
+        update_order(order_id, {
+            'status': 'served',
+            'served_by': session['user_id'],
+            'served_at': datetime.now().strftime('%H:%M')
+        })
+
+        # Если заказ связан с блюдом — списываем ингредиенты
+        menu_item_id = order.get('menu_item_id')
+        if menu_item_id:
+            try:
+                changes = consume_ingredients_for_menu_item(menu_item_id, servings=1)
+                served_changes = changes
+            except Exception:
+                served_changes = []
 
     # Показываем результат списания в сообщениях
     if served_changes:
@@ -289,6 +327,76 @@ def serve_meal(order_id):
     return redirect(request.referrer or url_for('cook.menu'))
 
 
+def _batch_filters():
+    """Отбор заказов для пакетных действий из формы: блюдо, тип питания, класс.
+    None, если ID блюда указан неверно."""
+    menu_item_id = request.form.get('menu_item_id')
+    try:
+        menu_item_id = int(menu_item_id) if menu_item_id else None
+    except ValueError:
+        return None
+    return {
+        'menu_item_id': menu_item_id,
+        'meal_type': request.form.get('meal_type') or None,
+        'class_name': (request.form.get('class_name') or '').strip() or None,
+    }
+
+
+def _flash_consumption(report):
+    """Сообщения повару по отчёту о списании продуктов (recipes.plan)"""
+    msgs = [f"{line['name']}: -{line['consumed']} {line['unit']} (осталось {line['after']} {line['unit']})"
+            for line in report['items']]
+    missing = sorted({item['ingredient'] for item in report['unresolved'] if item['ingredient']})
+    if missing:
+        msgs.append('Не списаны ингредиенты: ' + ', '.join(missing))
+    if msgs:
+        flash('<br>'.join(msgs), 'info')
+    if report['shortfalls']:
+        flash('Не хватило продуктов: ' + ', '.join(f"{line['name']} ({line['shortfall']} {line['unit']})"
+                                                  for line in report['shortfalls']), 'danger')
+    low_alerts = [f"{line['name']} (осталось {line['after']} {line['unit']})"
+                  for line in report['items'] if line['low_stock'] and not line['shortfall']]
+    if low_alerts:
+        flash('Низкий остаток: ' + ', '.join(low_alerts), 'warning')
+
+
+@cook_bp.route('/prepare_batch', methods=['POST'])
+@cook_required
+def prepare_batch():
+    """Отметка о приготовлении сразу всех сегодняшних заказов блюда, типа питания или класса"""
+    filters = _batch_filters()
+    if filters is None:
+        flash('Неверный ID блюда', 'danger')
+        return redirect(request.referrer or url_for('cook.menu'))
+
+    result = prepare_orders(session['user_id'], datetime.now().strftime('%Y-%m-%d'), **filters)
+    if result['orders']:
+        flash(f"Отмечено приготовленными заказов: {result['orders']}", 'success')
+    else:
+        flash('Нет заказов, ожидающих приготовления', 'info')
+    return redirect(request.referrer or url_for('cook.menu'))
+
+
+@cook_bp.route('/serve_batch', methods=['POST'])
+@cook_required
+def serve_batch():
+    """Выдача сразу всех сегодняшних заказов блюда, типа питания или класса:
+    статусы и списание продуктов на все порции — одной записью"""
+    filters = _batch_filters()
+    if filters is None:
+        flash('Неверный ID блюда', 'danger')
+        return redirect(request.referrer or url_for('cook.menu'))
+
+    result = serve_orders(session['user_id'], datetime.now().strftime('%Y-%m-%d'), **filters)
+    if not result['orders']:
+        flash('Нет заказов для выдачи', 'info')
+        return redirect(request.referrer or url_for('cook.menu'))
+
+    _flash_consumption(result['consumption'])
+    flash(f"Выдано заказов: {result['orders']} (блюд: {sum(result['by_menu_item'].values())})", 'success')
+    return redirect(request.referrer or url_for('cook.menu'))
+
+
 @cook_bp.route('/add_inventory', methods=['POST'])
 @cook_required
 def add_inventory():
@@ -300,14 +408,11 @@ def add_inventory():
     minimum = int(request.form.get('minimum', 10))
     expires = request.form.get('expires')
     description = request.form.get('description', '')
+    # Другие названия продукта в составе блюд, через запятую
+    aliases = [a.strip() for a in request.form.get('aliases', '').split(',') if a.strip()]
+    price = request.form.get('price')
 
-    inventory_data = load_json('data/inventory.json')
-
-    if 'inventory' not in inventory_data:
-        inventory_data['inventory'] = []
-
-    new_item = {
-        'id': len(inventory_data['inventory']) + 1,
+    item = {
         'name': name,
         'category': category,
         'quantity': quantity,
@@ -316,9 +421,11 @@ def add_inventory():
         'expires': expires,
         'description': description
     }
-
-    inventory_data['inventory'].append(new_item)
-    save_json('data/inventory.json', inventory_data)
+    if aliases:
+        item['aliases'] = aliases
+    if price:
+        item['price'] = float(price)
+    add_inventory_item(item)
 
     flash(f'Продукт "{name}" добавлен в инвентарь', 'success')
     return redirect(url_for('cook.inventory'))
@@ -360,6 +467,11 @@ def consume_ingredients():
     return redirect(request.referrer or url_for('cook.menu'))
 
 
+# Виды движений, которые повар указывает при изменении количества вручную
+_MANUAL_MOVEMENTS = {kind: stock_ledger.KINDS[kind]
+                     for kind in (stock_ledger.ADJUSTMENT, stock_ledger.RECEIPT, stock_ledger.WRITE_OFF)}
+
+
 @cook_bp.route('/update_inventory', methods=['POST'])
 @cook_required
 def update_inventory():
@@ -368,23 +480,20 @@ def update_inventory():
     quantity = float(request.form.get('quantity', 0))
     expires = request.form.get('expires')
     comment = request.form.get('comment', '')
-
-    inventory_data = load_json('data/inventory.json')
-
-    if 'inventory' not in inventory_data:
-        flash('Инвентарь пуст', 'danger')
-        return redirect(url_for('cook.inventory'))
-
-    for i, item in enumerate(inventory_data['inventory']):
-        if item.get('id') == item_id:
-            inventory_data['inventory'][i]['quantity'] = quantity
-            if expires:
-                inventory_data['inventory'][i]['expires'] = expires
-            if comment:
-                inventory_data['inventory'][i]['comment'] = comment
-            break
-
-    save_json('data/inventory.json', inventory_data)
+    price = request.form.get('price')
+    # Вид изменения количества для журнала движений продуктов
+    reason = request.form.get('reason')
+    if reason not in _MANUAL_MOVEMENTS:
+        reason = stock_ledger.ADJUSTMENT
+
+    updates = {'quantity': quantity}
+    if expires:
+        updates['expires'] = expires
+    if comment:
+        updates['comment'] = comment
+    if price:
+        updates['price'] = float(price)
+    update_inventory_item(item_id, updates, reason=reason)
     flash('Инвентарь обновлен', 'success')
     return redirect(url_for('cook.inventory'))
 
@@ -395,9 +504,7 @@ def orders_today():
     """Просмотр заказов на сегодня"""
     today = datetime.now().strftime('%Y-%m-%d')
 
-    orders_data = load_json('data/orders.json')
-    today_orders = [order for order in orders_data.get('orders', [])
-                    if order.get('date') == today]
+    today_orders = get_orders(date=today)
 
     # Группируем по статусам
     orders_by_status = {
@@ -411,14 +518,12 @@ def orders_today():
         if status in orders_by_status:
             orders_by_status[status].append(order)
 
-    # Добавляем информацию о студентах и блюдах
-    users_data = load_json('data/users.json')
-    students = {user['id']: user for user in users_data.get('users', []) if user.get('role') == 'student'}
-
+    # Добавляем информацию о студентах и блюдах (одним пакетом на коллекцию)
+    join_records(today_orders, 'student_id', 'users', 'student')
+    join_records(today_orders, 'menu_item_id', 'menu', 'menu_item')
     for order in today_orders:
-        order['student'] = students.get(order.get('student_id'), {})
-        menu_item = get_menu_item_by_id(order.get('menu_item_id'))
-        order['menu_item'] = menu_item
+        if order['student'] is None:
+            order['student'] = {}
 
     return render_template('cook/orders_today.html',
                            orders_by_status=orders_by_status,
@@ -432,38 +537,19 @@ def statistics():
     """Статистика для повара"""
     today = datetime.now().strftime('%Y-%m-%d')
 
-    # Получаем заказы за последние 7 дней
-    orders_data = load_json('data/orders.json')
-    all_orders = orders_data.get('orders', [])
-
-    # Статистика по дням
-    stats_by_day = {}
-    for order in all_orders:
-        date = order.get('date')
-        if date:
-            if date not in stats_by_day:
-                stats_by_day[date] = {'breakfast': 0, 'lunch': 0, 'total': 0}
-
-            if order.get('type') == 'breakfast':
-                stats_by_day[date]['breakfast'] += 1
-            elif order.get('type') == 'lunch':
-                stats_by_day[date]['lunch'] += 1
-            stats_by_day[date]['total'] += 1
-
-    # Сортируем по дате
-    stats_by_day = dict(sorted(stats_by_day.items(), key=lambda x: x[0], reverse=True)[:7])
+    # Статистика по дням и по блюдам — по столбцам заказов (analytics.py)
+    stats_by_day = analytics.orders_by_day()
+    total_orders = analytics.order_count()
 
-    # Статистика по блюдам
-    menu_items = {}
-    for order in all_orders:
-        menu_item_id = order.get('menu_item_id')
-        if menu_item_id:
-            menu_items[menu_item_id] = menu_items.get(menu_item_id, 0) + 1
+    # Сортируем по дате: последние 7 дней
+    stats_by_day = dict(sorted(stats_by_day.items(), key=lambda x: x[0], reverse=True)[:7])
 
     # Получаем названия блюд
     popular_dishes = []
-    for item_id, count in sorted(menu_items.items(), key=lambda x: x[1], reverse=True)[:5]:
-        menu_item = get_menu_item_by_id(item_id)
+    top_items = analytics.orders_by_dish(limit=5)
+    top_menu_items = get_menu_items_by_ids(item_id for item_id, _ in top_items)
+    for item_id, count in top_items:
+        menu_item = top_menu_items.get(item_id)
         if menu_item:
             popular_dishes.append({
                 'name': menu_item.get('name'),
@@ -471,12 +557,11 @@ def statistics():
             })
 
     # Статистика инвентаря
-    inventory_data = load_json('data/inventory.json')
-    low_stock = [item for item in inventory_data.get('inventory', [])
+    low_stock = [item for item in get_inventory()
                  if item.get('quantity', 0) < item.get('minimum', 10)]
 
     return render_template('cook/statistics.html',
                            stats_by_day=stats_by_day,
                            popular_dishes=popular_dishes,
                            low_stock=low_stock,
-                           total_orders=len(all_orders))
\ No newline at end of file
+                           total_orders=total_orders)
\ No newline at end of file
@@ -1,9 +1,28 @@
-import json
 import os
 import hashlib
 from typing import Dict, List, Any, Optional
 from datetime import datetime, timedelta
+from itertools import islice
 from config import *
+from storage import clone
+import aggregates
+import forecast
+import ingredients
+import recipes
+import rollups
+import stock_ledger
+import student_counters
+from backends import COLLECTIONS, PARTITIONS
+from request_context import get_backend
+from timestamps import timestamp, to_datetime
+
+
+def check_ready() -> List[str]:
+    """Быстрая проверка при старте приложения: созданы ли все коллекции.
+    Ничего не записывает. Возвращает список отсутствующих коллекций
+    (пустой — данные готовы). Создать их: python bootstrap.py"""
+    db = get_backend()
+    return [collection for collection in COLLECTIONS if not db.exists(collection)]
 
 
 def init_data_dir():
@@ -11,48 +30,15 @@ def init_data_dir():
     if not os.path.exists(DATA_DIR):
         os.makedirs(DATA_DIR)
 
-    # Инициализируем файлы если их нет или они пустые
-    default_data = {
-        USERS_FILE: {"users": []},
-        MENU_FILE: {"menu": []},
-        ORDERS_FILE: {"orders": []},
-        INVENTORY_FILE: {"inventory": []},
-        PURCHASE_REQUESTS_FILE: {"requests": []},
-        REVIEWS_FILE: {"reviews": []},
-        'data/payments.json': {"payments": []}
-    }
-
-    for file_path, data in default_data.items():
-        # Если файл не существует или пустой, создаем с дефолтными данными
-        if not os.path.exists(file_path) or os.path.getsize(file_path) == 0:
-            save_json(file_path, data)
+    # Инициализируем коллекции если их нет или они пустые
+    db = get_backend()
+    for collection in COLLECTIONS:
+        if not db.exists(collection):
+            db.create(collection)
 
     return True
 
 
-def create_data_file(file_path, default_data):
-    """Создает файл с данными по умолчанию"""
-    if not os.path.exists(file_path):
-        save_json(file_path, default_data)
-
-
-def load_json(file_path: str) -> Dict:
-    """Загружает данные из JSON файла"""
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        return {}
-
-
-def save_json(file_path: str, data: Dict) -> None:
-    """Сохраняет данные в JSON файл"""
-    os.makedirs(os.path.dirname(file_path), exist_ok=True)
-
-    with open(file_path, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-
-
 def hash_password(password: str) -> str:
     """Хеширует пароль"""
     return hashlib.sha256(password.encode()).hexdigest()
@@ -65,162 +51,278 @@ def verify_password(password: str, hashed: str) -> bool:
 
 def add_user(username: str, password: str, role: str, full_name: str, email: str) -> bool:
     """Добавляет нового пользователя"""
-    users_data = load_json(USERS_FILE)
-
-    # Инициализируем структуру если её нет
-    if 'users' not in users_data:
-        users_data = {'users': []}
-
-    # Проверяем, не существует ли пользователь
-    if any(user.get('username') == username for user in users_data['users']):
-        return False
-
-    # Создаем нового пользователя
-    new_user = {
-        'id': len(users_data['users']) + 1,
-        'username': username,
-        'password': hash_password(password),
-        'role': role,
-        'full_name': full_name,
-        'email': email,
-        'class': '10А' if role == 'student' else None,
-        'allergies': [],
-        'preferences': [],
-        'balance': 1500 if role == 'student' else 0,
-        'created_at': datetime.now().isoformat()
-    }
+    db = get_backend()
+    with db.transaction('users') as tx:
+        # Проверяем, не существует ли пользователь
+        if db.query('users', username=username):
+            return False
+
+        # Создаем нового пользователя
+        new_user = {
+            # id по максимальному, а не по количеству: запись с уже занятым id
+            # заменила бы существующего пользователя
+            'id': max((u.get('id', 0) for u in db.all('users')), default=0) + 1,
+            'username': username,
+            'password': hash_password(password),
+            'role': role,
+            'full_name': full_name,
+            'email': email,
+            'class': '10А' if role == 'student' else None,
+            'allergies': [],
+            'preferences': [],
+            'balance': 1500 if role == 'student' else 0,
+            'created_at': datetime.now().isoformat()
+        }
 
-    users_data['users'].append(new_user)
-    save_json(USERS_FILE, users_data)
-    return True
+        tx.append('users', new_user)
+        return True
 
 
 def get_user_by_username(username: str) -> Optional[Dict]:
     """Находит пользователя по имени"""
-    users_data = load_json(USERS_FILE)
-
-    # Проверяем структуру
-    if 'users' not in users_data:
-        return None
-
-    for user in users_data['users']:
-        if user.get('username') == username:
-            return user
-    return None
+    users = get_backend().query('users', username=username)
+    return clone(users[0]) if users else None
 
 
 def get_user_by_id(user_id: int) -> Optional[Dict]:
     """Находит пользователя по ID"""
-    users_data = load_json(USERS_FILE)
-
-    # Проверяем структуру
-    if 'users' not in users_data:
-        return None
-
-    for user in users_data['users']:
-        if user.get('id') == user_id:
-            return user
-    return None
+    user = get_backend().get('users', user_id)
+    return clone(user) if user is not None else None
 
 
 def update_user(user_id: int, updates: Dict) -> bool:
     """Обновляет данные пользователя"""
-    users_data = load_json(USERS_FILE)
+    return get_backend().patch('users', user_id, updates)
 
-    # Проверяем структуру
-    if 'users' not in users_data:
-        return False
 
-    for i, user in enumerate(users_data['users']):
-        if user.get('id') == user_id:
-            users_data['users'][i].update(updates)
-            save_json(USERS_FILE, users_data)
-            return True
-    return False
+def get_users(role: str = None) -> List[Dict]:
+    """Все пользователи (или только с указанной ролью)"""
+    db = get_backend()
+    users = db.query('users', role=role) if role else db.all('users')
+    return clone(users)
 
 
-# Функции для работы с меню
-def get_menu_items(date: str = None, meal_type: str = None) -> List[Dict]:
-    """Получение меню с фильтрацией"""
-    menu_data = load_json(MENU_FILE)
+def get_users_by_ids(user_ids) -> Dict[int, Dict]:
+    """Пользователи по списку ID одним обращением к хранилищу: {id: пользователь}"""
+    ids = {user_id for user_id in user_ids if user_id is not None}
+    return clone(get_backend().get_many('users', ids)) if ids else {}
 
-    # Проверяем структуру
-    if 'menu' not in menu_data:
-        return []
 
-    items = menu_data.get('menu', [])
+# Функции для работы с меню
+#
+# Блюдо (название, описание, состав, аллергены) хранится один раз в каталоге
+# dishes, а меню на день — короткие записи расписания:
+#     {'id', 'date', 'type', 'dish_id', 'price', 'available'}
+# id записи расписания — это menu_item_id в заказах и отзывах. Функции ниже
+# возвращают пункты меню в прежнем виде: запись расписания вместе с полями блюда.
+
+DISH_FIELDS = ('name', 'description', 'calories', 'allergens', 'contains', 'preparation_time')
+SCHEDULE_FIELDS = ('id', 'date', 'type', 'dish_id', 'price', 'available')
+
+
+def _resolve_menu_items(entries) -> List[Dict]:
+    """Соединяет записи расписания с блюдами каталога (каждое блюдо читается один раз).
+    Записи в старом формате (с полями блюда внутри) возвращаются как есть."""
+    dish_ids = {entry['dish_id'] for entry in entries if entry.get('dish_id') is not None}
+    dishes = get_backend().get_many('dishes', dish_ids) if dish_ids else {}
+    items = []
+    for entry in entries:
+        dish_id = entry.get('dish_id')
+        if dish_id is None:
+            items.append(clone(entry))
+            continue
+        dish = dishes.get(dish_id, {})
+        item = {field: dish[field] for field in DISH_FIELDS if field in dish}
+        item.update(entry)
+        items.append(clone(item))
+    return items
 
-    if date:
-        items = [item for item in items if item.get('date') == date]
 
+def get_menu_items(date: str = None, meal_type: str = None) -> List[Dict]:
+    """Получение меню с фильтрацией.
+    С датой читаются только записи этого дня (по индексу date или date+type)."""
+    db = get_backend()
+    fields = {}
+    if date:
+        fields['date'] = date
     if meal_type and meal_type != 'all':
-        items = [item for item in items if item.get('type') == meal_type]
-
-    return items
+        fields['type'] = meal_type
+    entries = db.query('menu', **fields) if fields else db.all('menu')
+    return _resolve_menu_items(entries)
 
 
 def get_menu_item_by_id(item_id):
     """Получение блюда по ID"""
-    menu_data = load_json(MENU_FILE)
+    entry = get_backend().get('menu', item_id)
+    return _resolve_menu_items([entry])[0] if entry is not None else None
 
-    if 'menu' not in menu_data:
-        return None
 
-    for item in menu_data['menu']:
-        if item.get('id') == item_id:
-            return item
+def get_menu_items_by_ids(item_ids) -> Dict[int, Dict]:
+    """Пункты меню по списку ID: {id: пункт меню}. Расписание и блюда
+    читаются одним обращением к хранилищу каждое."""
+    ids = {item_id for item_id in item_ids if item_id is not None}
+    if not ids:
+        return {}
+    entries = list(get_backend().get_many('menu', ids).values())
+    return {item['id']: item for item in _resolve_menu_items(entries)}
 
-    return None
 
+def get_dishes() -> List[Dict]:
+    """Каталог блюд"""
+    return clone(get_backend().all('dishes'))
 
-def add_menu_item(item_data):
-    """Добавление нового блюда в меню"""
-    menu_data = load_json(MENU_FILE)
 
-    if 'menu' not in menu_data:
-        menu_data['menu'] = []
+def _find_or_add_dish(tx, item_data: Dict, added: List[Dict] = None) -> int:
+    """id блюда каталога с такими же полями; если такого нет, добавляет его.
+    added — блюда, уже добавленные в этой транзакции (через query они ещё не видны)."""
+    dish = {field: item_data[field] for field in DISH_FIELDS if field in item_data}
+    candidates = list(tx.query('dishes', name=dish.get('name'))) + (added or [])
+    for existing in candidates:
+        if {field: existing.get(field) for field in dish} == dish:
+            return existing['id']
+    dish_id = tx.append('dishes', dish)
+    if added is not None:
+        added.append(dict(dish, id=dish_id))
+    return dish_id
+
 
-    item_id = len(menu_data['menu']) + 1
-    item_data['id'] = item_id
-    menu_data['menu'].append(item_data)
+def _schedule_entry(item_data: Dict, dish_id: int) -> Dict:
+    entry = {field: item_data[field] for field in SCHEDULE_FIELDS if field in item_data}
+    entry['dish_id'] = dish_id
+    return entry
 
-    save_json(MENU_FILE, menu_data)
-    return item_id
+
+def add_menu_item(item_data):
+    """Добавление блюда в меню на дату.
+    Если такого блюда нет в каталоге, оно добавляется туда; можно сразу
+    передать dish_id существующего блюда."""
+    with get_backend().transaction('dishes', 'menu') as tx:
+        dish_id = item_data.get('dish_id')
+        if dish_id is None:
+            dish_id = _find_or_add_dish(tx, item_data)
+        return tx.append('menu', _schedule_entry(item_data, dish_id))
+
+
+def update_menu_item(item_id, updates: Dict) -> bool:
+    """Изменение полей пункта меню (например, доступности).
+    Поля блюда (название, состав и т.п.) меняются в каталоге — для всех дат."""
+    schedule_updates = {k: v for k, v in updates.items() if k not in DISH_FIELDS}
+    dish_updates = {k: v for k, v in updates.items() if k in DISH_FIELDS}
+    with get_backend().transaction('dishes', 'menu') as tx:
+        entry = tx.get('menu', item_id)
+        if entry is None:
+            return False
+        if dish_updates and entry.get('dish_id') is None:
+            # Запись в старом формате: поля блюда хранятся в ней самой
+            schedule_updates.update(dish_updates)
+        elif dish_updates:
+            tx.patch('dishes', entry['dish_id'], dish_updates)
+        if schedule_updates:
+            tx.patch('menu', item_id, schedule_updates)
+        return True
+
+
+def normalize_menu() -> int:
+    """Переводит меню из старого формата (полная копия блюда на каждую дату)
+    в каталог блюд и расписание. id пунктов меню сохраняются, поэтому
+    заказы и отзывы по-прежнему находят свои блюда.
+    Повторный запуск ничего не меняет. Возвращает число переведённых записей."""
+    db = get_backend()
+    with db.transaction('dishes', 'menu'):
+        entries = db.all('menu')
+        legacy = sum(1 for entry in entries if entry.get('dish_id') is None)
+        if not legacy:
+            return 0
+
+        # Сначала записываются блюда, затем расписание, которое на них ссылается
+        with db.transaction('dishes') as tx:
+            added = []
+            dish_ids = [entry['dish_id'] if entry.get('dish_id') is not None
+                        else _find_or_add_dish(tx, entry, added) for entry in entries]
+
+        # В старом тестовом меню id повторялись. id остаётся у последней из
+        # таких записей (её и находил get_menu_item_by_id), остальные получают новые
+        last = {entry.get('id'): i for i, entry in enumerate(entries)}
+        next_id = max((entry.get('id') or 0 for entry in entries), default=0) + 1
+        normalized = []
+        for i, (entry, dish_id) in enumerate(zip(entries, dish_ids)):
+            entry = _schedule_entry(entry, dish_id)
+            if last[entry.get('id')] != i:
+                entry['id'] = next_id
+                next_id += 1
+            normalized.append(entry)
+        db.replace_all('menu', normalized)
+        return legacy
+
+
+# Связанные записи
+_BATCH_LOOKUPS = {
+    'users': get_users_by_ids,
+    'menu': get_menu_items_by_ids,
+}
+
+
+def join_records(records: List[Dict], key_field: str, collection: str, as_field: str) -> List[Dict]:
+    """Добавляет к каждой записи связанную запись другой коллекции:
+    record[as_field] = запись collection с id == record[key_field] (или None).
+    Все связанные записи загружаются одним пакетом, а не по одной на строку.
+
+        join_records(reviews, 'menu_item_id', 'menu', 'menu_item')
+    """
+    lookup = _BATCH_LOOKUPS.get(collection)
+    ids = [record.get(key_field) for record in records]
+    if lookup is not None:
+        related = lookup(ids)
+    else:
+        related = clone(get_backend().get_many(collection, {i for i in ids if i is not None}))
+    for record in records:
+        record[as_field] = related.get(record.get(key_field))
+    return records
 
 
 # Функции для отзывов
 def get_reviews_by_student(student_id):
     """Получение отзывов ученика"""
-    reviews_data = load_json(REVIEWS_FILE)
-
-    if 'reviews' not in reviews_data:
-        return []
-
-    return [review for review in reviews_data['reviews']
-            if review.get('student_id') == student_id]
+    return clone(get_backend().query('reviews', student_id=student_id))
 
 
 def get_reviews_by_menu_item(menu_item_id):
     """Получение отзывов для блюда"""
-    reviews_data = load_json(REVIEWS_FILE)
+    return [clone(review) for review in get_backend().query('reviews', menu_item_id=menu_item_id)
+            if review.get('approved')]
+
 
-    if 'reviews' not in reviews_data:
-        return []
+def get_reviews() -> List[Dict]:
+    """Все отзывы"""
+    return clone(get_backend().all('reviews'))
 
-    return [review for review in reviews_data['reviews']
-            if review.get('menu_item_id') == menu_item_id and review.get('approved')]
+
+def add_review(review: Dict) -> int:
+    """Добавляет отзыв и возвращает его ID"""
+    return get_backend().append('reviews', review)
+
+
+def update_review(review_id, updates: Dict) -> bool:
+    """Изменяет поля отзыва (например, одобрение)"""
+    return get_backend().patch('reviews', review_id, updates)
+
+
+def delete_review(review_id) -> bool:
+    """Удаляет отзыв"""
+    return get_backend().delete('reviews', review_id)
 
 
 # Функция для добавления платежа
 def add_payment(user_id, amount, payment_type, description):
     """Добавляет запись о платеже"""
-    payments_data = load_json('data/payments.json')
+    with get_backend().transaction('payments') as tx:
+        return _stage_payment(tx, user_id, amount, payment_type, description)
 
-    if 'payments' not in payments_data:
-        payments_data['payments'] = []
 
+def _stage_payment(tx, user_id, amount, payment_type, description) -> int:
+    """Добавляет платеж в транзакцию tx (запишется при её фиксации)"""
     payment = {
-        'id': len(payments_data['payments']) + 1,
+        'id': tx.next_id('payments'),
         'user_id': user_id,
         'amount': amount,
         'type': payment_type,
@@ -228,21 +330,31 @@ def add_payment(user_id, amount, payment_type, description):
         'date': datetime.now().isoformat(),
         'status': 'completed'
     }
-
-    payments_data['payments'].append(payment)
-    save_json('data/payments.json', payments_data)
+    tx.append('payments', payment)
     return payment['id']
 
 
 # Функция для получения платежей пользователя
 def get_user_payments(user_id):
     """Получает платежи пользователя"""
-    payments_data = load_json('data/payments.json')
+    return clone(get_backend().query('payments', user_id=user_id))
+
 
-    if 'payments' not in payments_data:
-        return []
+def get_recent_payments(user_id, limit: int = None) -> List[Dict]:
+    """Платежи пользователя от новых к старым (не больше limit) —
+    по упорядоченному индексу, без сортировки всей истории"""
+    return clone(list(islice(get_backend().between('payments', reverse=True, user_id=user_id), limit)))
 
-    return [p for p in payments_data['payments'] if p.get('user_id') == user_id]
+
+def get_payments() -> List[Dict]:
+    """Все платежи"""
+    return clone(get_backend().all('payments'))
+
+
+def iter_payments(date_prefix: str = None):
+    """Проход по платежам (или за день/месяц по началу даты) без загрузки
+    всей истории в один список. Записи только для чтения."""
+    return get_backend().scan('payments', date_prefix=date_prefix)
 
 
 def get_user_nutrition_stats(user_id, reference_date=None):
@@ -251,48 +363,47 @@ def get_user_nutrition_stats(user_id, reference_date=None):
     - потрачено за месяц (payments, исключая пополнения)
     - средняя стоимость питания (по заказам)
     - время последнего питания (читаем из orders)
+    Текущий месяц — из счётчиков ученика, прошлые — из итогов закрытых дней (rollups.py).
     """
     if reference_date is None:
         reference_date = datetime.now()
 
     month_prefix = f"{reference_date.year}-{reference_date.month:02d}"
 
-    # Заказы пользователя за текущий месяц
-    orders_data = load_json(ORDERS_FILE)
-    user_orders = [o for o in orders_data.get('orders', [])
-                   if o.get('student_id') == user_id and o.get('date', '').startswith(month_prefix)]
-
-    meals_count = len(user_orders)
-
-    # Потрачено: суммарно по платежам пользователя за месяц, исключая 'recharge'
-    payments_data = load_json('data/payments.json')
-    user_payments_month = [p for p in payments_data.get('payments', [])
-                           if p.get('user_id') == user_id and p.get('date', '').startswith(month_prefix)]
-
-    spent_sum = sum(p.get('amount', 0) for p in user_payments_month if p.get('type') != 'recharge')
+    db = get_backend()
+    if month_prefix == datetime.now().strftime('%Y-%m'):
+        # Текущий месяц — готовые счётчики ученика (student_counters.py)
+        counters = get_student_counters(user_id)
+        meals_count = counters['meals_this_month']
+        spent_sum = counters['spent_this_month']
+        order_sum = counters['order_sum_this_month']
+        last_meal = counters['last_meal']
+    else:
+        month = rollups.user_month(db, user_id, month_prefix)
+        meals_count = month['orders']
+        # Потрачено: суммарно по платежам пользователя за месяц, исключая 'recharge'
+        spent_sum = month['spent']
+        order_sum = month['order_sum']
+        last_meal = month['last_meal']
 
     # Средняя стоимость по заказам (по заказам из orders)
     avg_cost = 0
     if meals_count > 0:
-        avg_cost = round(sum(o.get('price', 0) for o in user_orders) / meals_count)
+        avg_cost = round(order_sum / meals_count)
 
     # Последнее питание
-    all_user_orders = [o for o in load_json(ORDERS_FILE).get('orders', []) if o.get('student_id') == user_id]
     last_meal_display = 'Нет данных'
-    if all_user_orders:
-        # Составляем datetime для сортировки
-        def _order_dt(o):
-            try:
-                return datetime.strptime(f"{o.get('date')} {o.get('time')}", "%Y-%m-%d %H:%M")
-            except Exception:
-                return datetime.min
-
-        last_order = max(all_user_orders, key=_order_dt)
-        last_dt = _order_dt(last_order)
-        if last_dt.date() == reference_date.date():
-            last_meal_display = f"Сегодня, {last_dt.strftime('%H:%M')}"
+    if last_meal is None:
+        # В этом месяце заказов ещё не было — последний заказ по индексу времени
+        last_order = db.latest('orders', student_id=user_id)
+        if last_order is not None:
+            last_meal = (last_order.get('date'), last_order.get('time'))
+    if last_meal is not None:
+        last_ts = timestamp({'date': last_meal[0], 'time': last_meal[1]})
+        if last_ts is not None and to_datetime(last_ts).date() == reference_date.date():
+            last_meal_display = f"Сегодня, {to_datetime(last_ts).strftime('%H:%M')}"
         else:
-            last_meal_display = f"{last_order.get('date')}, {last_order.get('time')}"
+            last_meal_display = f"{last_meal[0]}, {last_meal[1]}"
 
     return {
         'meals_this_month': meals_count,
@@ -303,197 +414,404 @@ def get_user_nutrition_stats(user_id, reference_date=None):
 
 
 def get_user_active_subscriptions_count(user_id, days: int = 30):
-    """Считает количество оплаченных абонементов пользователя за последние `days` дней."""
-    payments_data = load_json('data/payments.json')
+    """Считает количество оплаченных абонементов пользователя за последние `days` дней.
+    Даты оплат берутся из итогов месяцев (rollups.py) — только месяцы этого окна."""
     now = datetime.now()
+    first = now - timedelta(days=days)
+    db = get_backend()
     count = 0
-    for p in payments_data.get('payments', []):
-        if p.get('user_id') != user_id or p.get('type') != 'subscription':
-            continue
-        try:
-            pd = datetime.fromisoformat(p.get('date'))
-        except Exception:
-            continue
-        if (now - pd).days < days:
-            count += 1
+    year, month = first.year, first.month
+    while (year, month) <= (now.year, now.month):
+        for paid_at in rollups.user_month(db, user_id, f"{year}-{month:02d}")['subscriptions']:
+            try:
+                pd = datetime.fromisoformat(paid_at)
+            except Exception:
+                continue
+            if (now - pd).days < days:
+                count += 1
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
     return count
 
 
 # Функция для пополнения баланса
 def recharge_balance(user_id, amount):
     """Пополняет баланс пользователя"""
-    user = get_user_by_id(user_id)
-    if not user:
-        return False
+    with get_backend().transaction('users', 'payments') as tx:
+        user = get_user_by_id(user_id)
+        if not user:
+            return False
+
+        new_balance = user.get('balance', 0) + amount
+        tx.patch('users', user_id, {'balance': new_balance})
 
-    new_balance = user.get('balance', 0) + amount
-    update_user(user_id, {'balance': new_balance})
+        # Записываем платеж
+        _stage_payment(tx, user_id, amount, 'recharge', 'Пополнение баланса')
 
-    # Записываем платеж
-    add_payment(user_id, amount, 'recharge', 'Пополнение баланса')
+        return True
 
-    return True
+
+def pay_from_balance(user_id, amount, payment_type, description) -> bool:
+    """Списывает сумму с баланса и записывает платеж.
+    Возвращает False, если пользователь не найден или средств недостаточно."""
+    with get_backend().transaction('users', 'payments') as tx:
+        user = get_user_by_id(user_id)
+        if not user or user.get('balance', 0) < amount:
+            return False
+
+        tx.patch('users', user_id, {'balance': user['balance'] - amount})
+        _stage_payment(tx, user_id, amount, payment_type, description)
+        return True
 
 
 # Функция для получения заказов пользователя
 def get_user_orders(user_id, date=None):
-    """Получает заказы пользователя"""
-    orders_data = load_json('data/orders.json')
+    """Получает заказы пользователя (за дату — в порядке времени)"""
+    db = get_backend()
+    if date:
+        return clone(list(db.scan('orders', date_prefix=date, student_id=user_id)))
+    return clone(db.query('orders', student_id=user_id))
 
-    if 'orders' not in orders_data:
-        return []
 
-    orders = [order for order in orders_data['orders'] if order.get('student_id') == user_id]
+def get_orders(date: str = None) -> List[Dict]:
+    """Все заказы (или только за указанную дату — в порядке времени)"""
+    db = get_backend()
+    orders = list(db.scan('orders', date_prefix=date)) if date else db.all('orders')
+    return clone(orders)
 
-    if date:
-        orders = [order for order in orders if order.get('date') == date]
 
-    return orders
+def iter_orders(date_prefix: str = None):
+    """Проход по заказам (или за день/месяц по началу даты) без загрузки
+    всей истории в один список. Записи только для чтения."""
+    return get_backend().scan('orders', date_prefix=date_prefix)
 
 
-def _find_inventory_item_by_name(name: str):
-    """Находит элемент инвентаря по имени (поиск по подстроке, нечувствительно к регистру).
-    Возвращает индекс и сам элемент или (None, None) если не найдено."""
-    inventory_data = load_json(INVENTORY_FILE)
-    for i, item in enumerate(inventory_data.get('inventory', [])):
-        if name.lower() in item.get('name', '').lower() or item.get('name', '').lower() in name.lower():
-            return i, item
-    return None, None
+def get_order_by_id(order_id) -> Optional[Dict]:
+    """Находит заказ по ID"""
+    order = get_backend().get('orders', order_id)
+    return clone(order) if order is not None else None
 
 
-def consume_ingredients_for_menu_item(menu_item_id: int, servings: int = 1):
-    """Списывает ингредиенты из инвентаря для указанного блюда.
-    - Ищет ингредиенты по полю `contains` у блюда
-    - Списывает `servings` единиц (снижение по умолчанию зависит от единицы измерения)
-    - Возвращает список изменений для логирования
-    """
-    menu_item = get_menu_item_by_id(menu_item_id)
-    if not menu_item or not menu_item.get('contains'):
-        return []
-
-    inventory_data = load_json(INVENTORY_FILE)
-    if 'inventory' not in inventory_data:
-        inventory_data['inventory'] = []
-
-    changes = []
-    for ing in menu_item.get('contains', []):
-        idx, inv_item = _find_inventory_item_by_name(ing)
-        if idx is None:
-            # ингредиент не найден в инвентаре — пропускаем
-            changes.append({'ingredient': ing, 'found': False})
-            continue
+def add_order(order: Dict) -> int:
+    """Добавляет заказ (например, выдачу питания поваром) и возвращает его ID"""
+    return get_backend().append('orders', order)
 
-        # Определяем количество списания по единице измерения
-        unit = inv_item.get('unit', '')
-        if 'кг' in unit or 'л' in unit:
-            consume_amount = 0.1 * servings
-        elif 'г' in unit or 'мл' in unit:
-            consume_amount = 100 * servings
-        else:
-            # единицы (шт, уп и т.п.)
-            consume_amount = 1 * servings
 
-        before = inv_item.get('quantity', 0)
-        after = max(0, round(before - consume_amount, 2))
-        inventory_data['inventory'][idx]['quantity'] = after
+def update_order(order_id, updates: Dict) -> bool:
+    """Обновляет поля заказа (статус, кто и когда приготовил/выдал).
+    В JSON-хранилище изменение дописывается в журнал раздела за месяц
+    заказа, а не переписывает файл целиком."""
+    return get_backend().patch('orders', order_id, updates)
+
+
+# Функции для инвентаря
+def get_inventory() -> List[Dict]:
+    """Все продукты инвентаря"""
+    return clone(get_backend().all('inventory'))
+
+
+def add_inventory_item(item: Dict) -> int:
+    """Добавляет продукт в инвентарь и возвращает его ID.
+    Количество продукта записывается в журнал как поступление."""
+    return get_backend().append('inventory', item)
+
+
+def update_inventory_item(item_id, updates: Dict, reason: str = None) -> bool:
+    """Изменяет поля продукта (количество, срок годности, комментарий).
+    reason — вид движения в журнале продуктов, если меняется количество
+    (stock_ledger.RECEIPT, WRITE_OFF, ...; по умолчанию — корректировка)."""
+    db = get_backend()
+    with db.transaction('inventory') as tx:
+        return tx.patch('inventory', item_id, updates, reason=reason)
+
+
+def seed_inventory(items: List[Dict]) -> bool:
+    """Заполняет пустой инвентарь тестовыми данными.
+    Возвращает True, если данные были добавлены."""
+    db = get_backend()
+    with db.transaction('inventory') as tx:
+        if db.all('inventory'):
+            return False
+        for item in items:
+            tx.append('inventory', item)
+        return True
+
+
+# Журнал движений продуктов (stock_ledger.py)
+def get_stock_at(moment: str) -> Dict[int, float]:
+    """Остатки продуктов {id: количество} на момент: 'YYYY-MM-DD' — на
+    конец дня, дата-время ISO — на эту секунду"""
+    ts = stock_ledger.moment_ts(moment)
+    if ts is None:
+        raise ValueError(f'Некорректная дата: {moment}')
+    return stock_ledger.stock_at(get_backend(), ts)
+
+
+def get_stock_movements(start: str = None, end: str = None, item_id: int = None) -> List[Dict]:
+    """Движения продуктов за период (границы 'YYYY-MM-DD' включительно)"""
+    return clone(stock_ledger.movements(get_backend(), start, end, item_id))
+
+
+def get_ingredient_costs(start: str = None, end: str = None) -> Dict[str, Dict[str, float]]:
+    """Затраты на продукты по дням: {день: {вид движения: сумма}}"""
+    return stock_ledger.daily_costs(get_backend(), start, end)
+
+
+# Функции для заявок на закупку
+def get_purchase_requests() -> List[Dict]:
+    """Все заявки на закупку"""
+    return clone(get_backend().all('purchase_requests'))
+
+
+def add_purchase_request(purchase_request: Dict) -> int:
+    """Добавляет заявку на закупку и возвращает её ID"""
+    return get_backend().append('purchase_requests', purchase_request)
+
 
-        low = after < inventory_data['inventory'][idx].get('minimum', 10)
+def update_purchase_request(request_id, updates: Dict) -> bool:
+    """Изменяет поля заявки (статус, кто и когда согласовал)"""
+    return get_backend().patch('purchase_requests', request_id, updates)
+
+
+def delete_purchase_request(request_id) -> bool:
+    """Удаляет заявку (черновик по прогнозу, который повар отклонил)"""
+    return get_backend().delete('purchase_requests', request_id)
+
+
+def forecast_purchases(days: int = None) -> Dict:
+    """Прогноз расхода продуктов на days дней и черновики заявок на
+    закупку для продуктов, которые опустятся ниже минимума (forecast.py)"""
+    return forecast.run(get_backend(), days)
+
+
+def consume_for_menu_items(servings: Dict[int, int], allow_shortfall: bool = True) -> Dict:
+    """Списывает продукты на несколько блюд сразу: servings = {menu_item_id: порций}
+    (например, все заказы на обед). Количества берутся из рецептур блюд
+    (recipes.py), потребность суммируется по продуктам, инвентарь читается
+    один раз, все остатки записываются одной транзакцией.
+    Возвращает отчёт recipes.plan(). Если продуктов не хватает и
+    allow_shortfall=False, ничего не списывается и выбрасывается
+    recipes.InsufficientStockError с этим отчётом; иначе остаток
+    недостающих продуктов становится нулевым."""
+    db = get_backend()
+    with db.transaction('inventory') as tx:
+        return _consume(db, tx, servings, allow_shortfall)
+
+
+def _consume(db, tx, servings: Dict[int, int], allow_shortfall: bool) -> Dict:
+    """Списание продуктов внутри уже открытой транзакции, заблокировавшей inventory"""
+    entries = db.get_many('menu', servings)
+    inventory = db.all('inventory')
+    report = recipes.plan(ingredients.resolution(inventory), entries, servings, inventory)
+    if report['shortfalls'] and not allow_shortfall:
+        raise recipes.InsufficientStockError(report)
+    for line in report['items']:
+        if line['consumed']:
+            tx.patch('inventory', line['item_id'], {'quantity': line['after']}, reason=stock_ledger.CONSUMPTION)
+    return report
+
+
+def consume_ingredients_for_menu_item(menu_item_id: int, servings: int = 1):
+    """Списывает ингредиенты из инвентаря для указанного блюда
+    (consume_for_menu_items для одного блюда).
+    Возвращает список изменений для сообщений повару: по одному на продукт
+    и по одному на каждый не сопоставленный с продуктом ингредиент.
+    """
+    report = consume_for_menu_items({menu_item_id: servings})
+    changes = [{'ingredient': item['ingredient'], 'found': False} for item in report['unresolved']
+               if item['ingredient'] is not None]
+    for line in report['items']:
         changes.append({
-            'ingredient': ing,
+            'ingredient': ', '.join(line['ingredients']),
             'found': True,
-            'item_id': inv_item.get('id'),
-            'name': inv_item.get('name'),
-            'unit': unit,
-            'before': before,
-            'after': after,
-            'consumed': round(before - after, 2),
-            'low_stock': low
+            'item_id': line['item_id'],
+            'name': line['name'],
+            'unit': line['unit'],
+            'before': line['before'],
+            'after': line['after'],
+            'consumed': line['consumed'],
+            'low_stock': line['low_stock']
         })
-
-    save_json(INVENTORY_FILE, inventory_data)
     return changes
 
-# Функция для создания заказа
-def create_order(student_id, menu_item_id):
-    """Создает новый заказ"""
-    menu_item = get_menu_item_by_id(menu_item_id)
-    if not menu_item:
-        return False
-
-    orders_data = load_json('data/orders.json')
-
-    if 'orders' not in orders_data:
-        orders_data['orders'] = []
-
-    # Проверяем, не заказывал ли уже сегодня это блюдо
-    today = datetime.now().strftime('%Y-%m-%d')
-    existing_order = any(
-        order.get('student_id') == student_id and
-        order.get('menu_item_id') == menu_item_id and
-        order.get('date') == today
-        for order in orders_data['orders']
-    )
-
-    if existing_order:
-        return False
-
-    new_order = {
-        'id': len(orders_data['orders']) + 1,
-        'student_id': student_id,
-        'menu_item_id': menu_item_id,
-        'menu_item_name': menu_item['name'],
-        'date': today,
-        'time': datetime.now().strftime('%H:%M'),
-        'type': menu_item['type'],
-        'price': menu_item['price'],
-        'status': 'ordered'
-    }
 
-    orders_data['orders'].append(new_order)
-    save_json('data/orders.json', orders_data)
+# Приготовление и выдача сразу всех заказов блюда, типа питания или класса.
+# Статусы всех заказов (и остатки продуктов при выдаче) записываются одной
+# транзакцией, а не по запросу на каждый заказ.
+
+def _orders_for_batch(db, date: str, statuses, menu_item_id=None, meal_type=None, class_name=None) -> List[Dict]:
+    """Заказы дня с данными статусами, отобранные по блюду, типу питания и классу ученика"""
+    orders = [order for order in db.scan('orders', date_prefix=date)
+              if order.get('status', 'ordered') in statuses
+              and (menu_item_id is None or order.get('menu_item_id') == menu_item_id)
+              and (not meal_type or (order.get('type') or order.get('meal_type')) == meal_type)]
+    if class_name:
+        students = db.get_many('users', {order.get('student_id') for order in orders})
+        orders = [order for order in orders
+                  if students.get(order.get('student_id'), {}).get('class') == class_name]
+    return orders
 
-    # Списываем средства
-    user = get_user_by_id(student_id)
-    if user:
-        new_balance = user['balance'] - menu_item['price']
-        update_user(student_id, {'balance': new_balance})
 
-        # Записываем платеж
-        add_payment(student_id, menu_item['price'], 'meal_purchase',
-                    f"Покупка: {menu_item['name']}")
-
-    # Обновляем количество питаний в профиле пользователя (за текущий месяц)
-    try:
-        month_prefix = datetime.now().strftime('%Y-%m')
-        monthly_meals = len([
-            o for o in orders_data.get('orders', [])
-            if o.get('student_id') == student_id and o.get('date', '').startswith(month_prefix)
-        ])
-        # Сохраняем поле meals_this_month в users.json
-        update_user(student_id, {'meals_this_month': monthly_meals})
-    except Exception:
-        # Не критично — не прерываем выполнение при ошибке обновления счётчика
-        pass
-
-    return True
+def prepare_orders(cook_id, date: str, menu_item_id: int = None, meal_type: str = None,
+                   class_name: str = None) -> Dict:
+    """Отмечает приготовленными все заказы дня со статусом 'ordered'
+    (с фильтрами — только заказы блюда, типа питания или класса).
+    Возвращает {'orders': сколько заказов, 'by_menu_item': {id блюда: заказов}}."""
+    db = get_backend()
+    prepared_at = datetime.now().strftime('%H:%M')
+    with db.transaction('orders') as tx:
+        orders = _orders_for_batch(db, date, ('ordered',), menu_item_id, meal_type, class_name)
+        for order in orders:
+            tx.patch('orders', order['id'], {'status': 'prepared', 'prepared_by': cook_id,
+                                             'prepared_at': prepared_at})
+    return {'orders': len(orders), 'by_menu_item': _count_by_menu_item(orders)}
+
+
+def serve_orders(cook_id, date: str, menu_item_id: int = None, meal_type: str = None,
+                 class_name: str = None) -> Dict:
+    """Отмечает выданными все заказы дня со статусом 'ordered' или
+    'prepared' (с фильтрами, как у prepare_orders) и списывает продукты на
+    все выданные порции сразу (consume_for_menu_items).
+    Блюда уже выданы, поэтому нехватка продуктов не прерывает выдачу —
+    она есть в отчёте. Возвращает {'orders', 'by_menu_item', 'consumption':
+    отчёт recipes.plan()}."""
+    db = get_backend()
+    served_at = datetime.now().strftime('%H:%M')
+    with db.transaction('orders', 'inventory') as tx:
+        orders = _orders_for_batch(db, date, ('ordered', 'prepared'), menu_item_id, meal_type, class_name)
+        for order in orders:
+            tx.patch('orders', order['id'], {'status': 'served', 'served_by': cook_id, 'served_at': served_at})
+        servings = _count_by_menu_item(orders)
+        consumption = _consume(db, tx, servings, allow_shortfall=True)
+    return {'orders': len(orders), 'by_menu_item': servings, 'consumption': consumption}
+
+
+def _count_by_menu_item(orders) -> Dict[int, int]:
+    counts = {}
+    for order in orders:
+        if order.get('menu_item_id') is not None:
+            counts[order['menu_item_id']] = counts.get(order['menu_item_id'], 0) + 1
+    return counts
+
+
+# Сводные показатели для администратора
+def get_report_aggregates() -> Dict:
+    """Сводные показатели: ученики, сумма балансов, заявки и отзывы на
+    рассмотрении, заказы по дням и классам, платежи по дням и типам.
+    Читается одна запись, а не все данные (см. aggregates.py)."""
+    db = get_backend()
+    record = db.get('aggregates', aggregates.AGGREGATES_ID)
+    if record is None:
+        # Показатели ещё не пересчитаны (python rebuild_aggregates.py) —
+        # считаем по данным, ничего не записывая
+        record = aggregates.compute(db)
+    return aggregates.unpack(record)
+
+
+def get_orders_summary(start_date=None, end_date=None) -> Dict:
+    """Заказы за период по дням, классам и блюдам и их количество.
+    Закрытые дни берутся из итогов (rollups.py), поэтому стоимость не
+    зависит от числа заказов за период."""
+    return rollups.orders_summary(get_backend(), start_date, end_date)
+
+
+def rebuild_aggregates() -> Dict:
+    """Пересчитывает сводные показатели по всем данным"""
+    return aggregates.unpack(aggregates.rebuild(get_backend()))
+
+
+def get_student_counters(user_id) -> Dict:
+    """Счётчики питания пользователя на текущий месяц: meals_this_month,
+    order_sum_this_month, spent_this_month, orders_total, last_meal.
+    Читается одна запись (см. student_counters.py)"""
+    db = get_backend()
+    record = db.get('student_counters', user_id)
+    if record is None:
+        # Заказов и платежей после появления счётчиков ещё не было —
+        # считаем по данным, ничего не записывая
+        record = student_counters.compute(db, user_id)
+    return clone(student_counters.current(record))
+
+
+def rebuild_student_counters() -> int:
+    """Пересчитывает счётчики питания всех пользователей"""
+    return student_counters.rebuild(get_backend())
 
 
-def init_all_data():
-    """Инициализация всех данных системы"""
-    init_data_dir()
+# Функция для создания заказа
+def create_order(student_id, menu_item_id):
+    """Создает новый заказ"""
+    db = get_backend()
+    with db.transaction('orders', 'users', 'payments') as tx:
+        menu_item = get_menu_item_by_id(menu_item_id)
+        if not menu_item:
+            return False
+
+        # Проверяем, не заказывал ли уже сегодня это блюдо
+        today = datetime.now().strftime('%Y-%m-%d')
+        if db.query('orders', student_id=student_id, menu_item_id=menu_item_id, date=today):
+            return False
+
+        new_order = {
+            'id': tx.next_id('orders'),
+            'student_id': student_id,
+            'menu_item_id': menu_item_id,
+            'menu_item_name': menu_item['name'],
+            'date': today,
+            'time': datetime.now().strftime('%H:%M'),
+            'type': menu_item['type'],
+            'price': menu_item['price'],
+            'status': 'ordered'
+        }
 
-    # Создаем все необходимые файлы
-    create_data_file(USERS_FILE, {"users": []})
-    create_data_file(MENU_FILE, {"menu": []})
-    create_data_file(ORDERS_FILE, {"orders": []})
-    create_data_file(INVENTORY_FILE, {"inventory": []})
-    create_data_file(PURCHASE_REQUESTS_FILE, {"requests": []})
-    create_data_file(REVIEWS_FILE, {"reviews": []})
-    create_data_file('data/payments.json', {"payments": []})
+        # Заказ, списание, платеж и счётчик питаний накапливаются в транзакции
+        # и записываются при выходе из неё — по одной записи на файл
+        tx.append('orders', new_order)
+
+        user = get_user_by_id(student_id)
+        if user:
+            # Списываем средства. Счётчик питаний за месяц обновится в той же
+            # транзакции (student_counters.py)
+            tx.patch('users', student_id, {'balance': user['balance'] - menu_item['price']})
+
+            # Записываем платеж
+            _stage_payment(tx, student_id, menu_item['price'], 'meal_purchase',
+                           f"Покупка: {menu_item['name']}")
+
+        return True
+
+
+def init_all_data(users: bool = True, menu: bool = True):
+    """Инициализация всех данных системы: коллекции, тестовые пользователи,
+    перевод меню на каталог блюд и меню на неделю. Повторный запуск ничего не дублирует.
+    Вызывается из bootstrap.py, а не при импорте модуля."""
+    # Несколько процессов могут запустить заполнение одновременно — проверка
+    # и создание коллекций выполняются под блокировкой
+    with get_backend().transaction(*COLLECTIONS):
+        init_data_dir()
+        created = {'users': 0, 'menu': 0}
+        if users:
+            created['users'] = seed_test_users()
+        # Меню в старом формате переводится на каталог блюд
+        created['normalized'] = normalize_menu()
+        if menu:
+            created['menu'] = seed_menu()
+        # Сводные показатели считаются один раз, дальше обновляются при записи
+        if get_backend().get('aggregates', aggregates.AGGREGATES_ID) is None:
+            rebuild_aggregates()
+    # Метки времени записям, сохранённым до их появления (migrate_timestamps.py).
+    # Разделы блокируются по одному, после общей транзакции
+    created['stamped'] = sum(get_backend().add_timestamps(collection) for collection in PARTITIONS)
+    return created
+
+
+def seed_test_users() -> int:
+    """Создает тестовых пользователей, которых ещё нет.
+    Возвращает количество созданных."""
+    db = get_backend()
+    created = 0
 
     # Создаем тестовых пользователей
-    users_data = load_json(USERS_FILE)
-    existing_usernames = [user.get('username') for user in users_data.get('users', [])]
+    existing_usernames = [user.get('username') for user in db.all('users')]
 
     test_users = [
         {
@@ -537,7 +855,7 @@ def init_all_data():
         if test_user['username'] not in existing_usernames:
             # Создаем пользователя
             new_user = {
-                'id': len(users_data.get('users', [])) + 1,
+                'id': db.next_id('users'),
                 'username': test_user['username'],
                 'password': hash_password(test_user['password']),
                 'role': test_user['role'],
@@ -549,16 +867,19 @@ def init_all_data():
                 'created_at': test_user['created_at']
             }
 
-            if 'users' not in users_data:
-                users_data['users'] = []
+            db.append('users', new_user)
+            created += 1
+
+    return created
 
-            users_data['users'].append(new_user)
 
-    save_json(USERS_FILE, users_data)
+def seed_menu() -> int:
+    """Создает тестовое меню на неделю, если меню пустое.
+    Возвращает количество созданных блюд."""
+    db = get_backend()
 
     # Создаем тестовое меню
-    menu_data = load_json(MENU_FILE)
-    if not menu_data.get('menu'):
+    if not db.all('menu'):
         today = datetime.now()
         menu_items = []
 
@@ -645,11 +966,13 @@ def init_all_data():
                 }
             ])
 
-        menu_data['menu'] = menu_items
-        save_json(MENU_FILE, menu_data)
-
-    return True
-
+        # Одинаковые блюда разных дней попадают в каталог один раз
+        with db.transaction('dishes', 'menu') as tx:
+            added = []
+            # id внутри одного extend совпадали — нумеруем пункты заново
+            for number, item in enumerate(menu_items, start=1):
+                item['id'] = number
+                tx.append('menu', _schedule_entry(item, _find_or_add_dish(tx, item, added)))
+        return len(menu_items)
 
-# Инициализируем все данные при импорте
-init_all_data()
\ No newline at end of file
+    return 0
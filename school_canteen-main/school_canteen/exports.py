@@ -0,0 +1,298 @@
+"""Выгрузка отчётов столовой в CSV и XLSX.
+
+Отчёт — последовательность строк: заказы, платежи, посещаемость по
+классам, заявки на закупку, движения продуктов или затраты на продукты
+за период. Заказы и платежи читаются из
+хранилища по одному месяцу (Backend.scan_partition), и строки сразу
+записываются в файл, который отдаётся по частям генератором. Поэтому
+память не растёт с длиной периода, а первые байты уходят клиенту ещё до
+чтения истории.
+
+XLSX собирается без сторонних библиотек: это zip-архив с XML-листом,
+а zipfile умеет писать архив в поток без перемотки. Строки записываются
+как встроенные строки листа (inlineStr), без общей таблицы строк, —
+иначе её пришлось бы держать в памяти до конца выгрузки.
+
+Границы периода — строки 'YYYY-MM-DD', обе включительно; без границ
+выгружается вся история.
+"""
+import csv
+import io
+import re
+import zipfile
+from functools import lru_cache
+from typing import Dict, Iterator, Optional
+from xml.sax.saxutils import escape
+
+import backends
+import stock_ledger
+from backends import UNDATED
+
+# Сколько строк накапливать перед отправкой очередной части файла
+CHUNK_ROWS = 500
+
+# Заголовок Content-Type файла по формату (целиком, с кодировкой)
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+
+def _in_period(value, start: Optional[str], end: Optional[str]) -> bool:
+    day = str(value or '')[:10]
+    return (not start or day >= start) and (not end or day <= end)
+
+
+def _records(backend, collection: str, start: Optional[str], end: Optional[str]) -> Iterator[Dict]:
+    """Записи коллекции из PARTITIONS за период — месяц за месяцем"""
+    for partition in sorted(backend.partition_versions(collection)):
+        if partition == UNDATED:
+            # Записи без даты в период не попадают
+            if start or end:
+                continue
+        elif (start and partition < start[:7]) or (end and partition > end[:7]):
+            continue
+        for record in backend.scan_partition(collection, partition):
+            if _in_period(record.get('date'), start, end):
+                yield record
+
+
+def _users(backend) -> Dict:
+    return {user['id']: user for user in backend.all('users')}
+
+
+def _orders(backend, start, end):
+    users = _users(backend)
+    for order in _records(backend, 'orders', start, end):
+        student = users.get(order.get('student_id'), {})
+        yield (order.get('id'), order.get('date'), order.get('time'),
+               student.get('full_name'), student.get('class'), order.get('menu_item_name'),
+               order.get('type') or order.get('meal_type'), order.get('price'), order.get('status'))
+
+
+def _payments(backend, start, end):
+    users = _users(backend)
+    for payment in _records(backend, 'payments', start, end):
+        user = users.get(payment.get('user_id'), {})
+        yield (payment.get('id'), str(payment.get('date') or '')[:19].replace('T', ' '),
+               user.get('full_name'), user.get('class'), payment.get('type'), payment.get('amount'),
+               payment.get('description'), payment.get('status'))
+
+
+def _attendance(backend, start, end):
+    """Заказы по дням и классам. Считается по месяцу за раз: в памяти
+    только счётчики одного месяца"""
+    users = _users(backend)
+    month, counts = None, {}
+    for order in _records(backend, 'orders', start, end):
+        date = order.get('date')
+        if date is None:
+            continue
+        if date[:7] != month:
+            yield from _attendance_rows(counts)
+            month, counts = date[:7], {}
+        class_name = users.get(order.get('student_id'), {}).get('class') or ''
+        row = counts.setdefault((date, class_name), [0, 0, 0])
+        meal_type = order.get('type') or order.get('meal_type')
+        if meal_type == 'breakfast':
+            row[0] += 1
+        elif meal_type == 'lunch':
+            row[1] += 1
+        row[2] += 1
+    yield from _attendance_rows(counts)
+
+
+def _attendance_rows(counts):
+    for (date, class_name), (breakfasts, lunches, total) in sorted(counts.items()):
+        yield date, class_name, breakfasts, lunches, total
+
+
+def _purchase_requests(backend, start, end):
+    users = _users(backend)
+    for purchase_request in backend.all('purchase_requests'):
+        # Черновики по прогнозу расхода (forecast.py) — ещё не заявки
+        if purchase_request.get('status') == 'draft' or not _in_period(purchase_request.get('created_at'), start, end):
+            continue
+        decided_by = purchase_request.get('approved_by') or purchase_request.get('rejected_by')
+        decided_at = purchase_request.get('approved_at') or purchase_request.get('rejected_at')
+        yield (purchase_request.get('id'), str(purchase_request.get('created_at') or '')[:10],
+               purchase_request.get('product'), purchase_request.get('quantity'), purchase_request.get('reason'),
+               purchase_request.get('status'), users.get(purchase_request.get('created_by'), {}).get('full_name'),
+               users.get(decided_by, {}).get('full_name'), str(decided_at or '')[:10])
+
+
+def _stock_movements(backend, start, end):
+    products = {item['id']: item for item in backend.all('inventory')}
+    for movement in _records(backend, 'stock_movements', start, end):
+        yield (movement.get('id'), str(movement.get('date') or '')[:19].replace('T', ' '),
+               products.get(movement.get('item_id'), {}).get('name'),
+               stock_ledger.KINDS.get(movement.get('kind'), movement.get('kind')), movement.get('delta'),
+               movement.get('balance'), movement.get('unit'), movement.get('price'))
+
+
+def _ingredient_costs(backend, start, end):
+    kinds = (stock_ledger.CONSUMPTION, stock_ledger.WRITE_OFF, stock_ledger.RECEIPT, stock_ledger.ADJUSTMENT)
+    for day, costs in sorted(stock_ledger.daily_costs(backend, start, end).items()):
+        yield (day,) + tuple(costs.get(kind, 0) for kind in kinds)
+
+
+# Отчёт -> (название листа, заголовки столбцов, функция строк)
+REPORTS = {
+    'orders': ('Заказы',
+               ('ID', 'Дата', 'Время', 'Ученик', 'Класс', 'Блюдо', 'Приём пищи', 'Цена', 'Статус'),
+               _orders),
+    'payments': ('Платежи',
+                 ('ID', 'Дата', 'Пользователь', 'Класс', 'Тип', 'Сумма', 'Описание', 'Статус'),
+                 _payments),
+    'attendance': ('Посещаемость по классам',
+                   ('Дата', 'Класс', 'Завтраков', 'Обедов', 'Всего'),
+                   _attendance),
+    'purchase_requests': ('Заявки на закупку',
+                          ('ID', 'Создана', 'Продукт', 'Количество', 'Причина', 'Статус', 'Автор',
+                           'Решение принял', 'Дата решения'),
+                          _purchase_requests),
+    'stock_movements': ('Движения продуктов',
+                        ('ID', 'Дата', 'Продукт', 'Движение', 'Изменение', 'Остаток', 'Ед. изм.', 'Цена'),
+                        _stock_movements),
+    'ingredient_costs': ('Затраты на продукты',
+                         ('Дата', 'Расход на блюда', 'Списание', 'Поступление', 'Корректировка'),
+                         _ingredient_costs),
+}
+
+
+# --- CSV ---
+
+def _csv(headers, rows) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # BOM — чтобы Excel открыл файл как UTF-8, а не в кодировке системы
+    buffer.write('\ufeff')
+    writer.writerow(headers)
+
+    def take() -> bytes:
+        data = buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+        return data
+
+    # Заголовок уходит сразу, до чтения данных
+    yield take()
+    for count, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if count % CHUNK_ROWS == 0:
+            yield take()
+    yield take()
+
+
+# --- XLSX ---
+
+_XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="xl/workbook.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+        '</Relationships>'),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="{title}" sheetId="1" r:id="rId1"/></sheets></workbook>'),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="worksheets/sheet1.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+        '</Relationships>'),
+}
+_SHEET_START = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>')
+_SHEET_END = '</sheetData></worksheet>'
+# Управляющие символы недопустимы в XML
+_XML_ILLEGAL = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+class _Output:
+    """Поток для zipfile: записанное забирается генератором по частям"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def take(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+@lru_cache(maxsize=4096)
+def _text_cell(value: str) -> str:
+    # Строки в отчётах сильно повторяются (классы, блюда, статусы),
+    # поэтому готовая ячейка запоминается
+    text = escape(_XML_ILLEGAL.sub('', value))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _cell(value) -> str:
+    if value is None or value == '':
+        return '<c/>'
+    if type(value) in (int, float):
+        return f'<c><v>{value}</v></c>'
+    return _text_cell(str(value))
+
+
+def _row(values) -> str:
+    return '<row>' + ''.join(map(_cell, values)) + '</row>'
+
+
+def _xlsx(title, headers, rows) -> Iterator[bytes]:
+    output = _Output()
+    # Имя листа: до 31 символа, без []:*?/\
+    sheet_name = escape(re.sub(r'[\[\]:*?/\\]', ' ', title)[:31], {'"': '&quot;'})
+    with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, content in _XLSX_PARTS.items():
+            archive.writestr(name, content.replace('{title}', sheet_name))
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write((_SHEET_START + _row(headers)).encode('utf-8'))
+            yield output.take()
+            lines = []
+            for row in rows:
+                lines.append(_row(row))
+                if len(lines) == CHUNK_ROWS:
+                    sheet.write(''.join(lines).encode('utf-8'))
+                    lines = []
+                    yield output.take()
+            sheet.write((''.join(lines) + _SHEET_END).encode('utf-8'))
+    yield output.take()
+
+
+def export(report: str, file_format: str, start: str = None, end: str = None) -> Iterator[bytes]:
+    """Генератор частей файла отчёта report в формате file_format ('csv'
+    или 'xlsx'). Данные читаются по мере выдачи частей."""
+    title, headers, rows = REPORTS[report]
+    records = rows(backends.get_backend(), start, end)
+    if file_format == 'xlsx':
+        return _xlsx(title, headers, records)
+    return _csv(headers, records)
+
+
+def filename(report: str, file_format: str, start: str = None, end: str = None) -> str:
+    """Имя файла выгрузки: orders_2026-09-01_2026-09-30.xlsx"""
+    parts = [report] + [value for value in (start, end) if value]
+    return '_'.join(parts) + '.' + file_format
@@ -0,0 +1,236 @@
+"""Прогноз расхода продуктов и черновики заявок на закупку.
+
+Заявки на закупку повар составлял вручную, а о нехватке продукта узнавал
+только после выдачи блюда (сообщение «Низкий остаток»). Здесь расход
+продуктов на ближайшие дни считается заранее:
+1. спрос: сколько порций блюда заказывают в этот день недели — заказы
+   за config.FORECAST_HISTORY_DAYS дней (столбцы analytics.py), делённые
+   на число дней, когда блюдо было в меню в этот день недели. Если в этот
+   день недели блюда не было — среднее по блюду за все дни, если блюда
+   не было вовсе — среднее по всем записям меню;
+2. порции: на каждую запись меню ближайших дней — прогноз спроса, но не
+   меньше уже сделанных заказов; порции уже выданных заказов не
+   считаются: продукты на них списаны;
+3. расход: порции, умноженные на рецептуру (recipes.entry_portions), по
+   дням; остаток на конец каждого дня — текущий минус накопленный расход.
+
+Дни без опубликованного меню расхода не дают. Все шаги — операции над
+массивами NumPy: заказы года — столбцы analytics, меню и рецептуры —
+матрицы «запись меню × продукт», поэтому время прогноза почти не зависит
+от длины истории и числа продуктов (python benchmarks/bench_forecast.py).
+
+Продукты, остаток которых опустится ниже минимума (minimum), получают
+черновик заявки на закупку (статус DRAFT) — столько, чтобы к концу
+прогноза остаток был не ниже минимума. Черновик видит только повар: он
+отправляет его администратору или удаляет. Открытый черновик продукта
+обновляется, а если по продукту уже есть заявка на рассмотрении, новый не
+создаётся.
+
+Прогноз считается каждую ночь (rollups.nightly), с панели повара или
+командой python forecast_purchases.py.
+"""
+from datetime import date, datetime
+from typing import Dict, List
+
+import numpy as np
+
+import analytics
+import backends
+import config
+import ingredients
+import recipes
+from analytics import NO_DAY, day_number, day_string
+
+DRAFT = 'draft'
+WEEK = 7
+# Минимальный остаток продукта, если он не указан (как в recipes.plan)
+DEFAULT_MINIMUM = 10
+# Точность количеств — как в recipes.py
+_DIGITS = 3
+
+
+def _number(value) -> float:
+    return value if isinstance(value, (int, float)) and not isinstance(value, bool) else 0.0
+
+
+def weekday(days):
+    """День недели (0 — понедельник) по номеру дня: 1970-01-01 — четверг"""
+    return (days + 3) % WEEK
+
+
+def _demand(menu: List[Dict], today: int, history_days: int):
+    """Спрос по блюдам: ({id блюда: строка}, матрица порций на запись меню
+    [блюдо × день недели], среднее по всем записям)"""
+    dish_ids = sorted({entry.get('dish_id') for entry in menu if isinstance(entry.get('dish_id'), int)})
+    codes = {dish_id: code for code, dish_id in enumerate(dish_ids)}
+    count = len(menu)
+    entry_ids = np.fromiter((entry.get('id') or 0 for entry in menu), np.int64, count)
+    entry_days = np.fromiter((day_number(entry.get('date')) for entry in menu), np.int64, count)
+    entry_dishes = np.fromiter((codes.get(entry.get('dish_id'), -1) for entry in menu), np.int64, count)
+    available = np.fromiter((entry.get('available', True) is not False for entry in menu), bool, count)
+    first = today - history_days
+
+    # Сколько раз блюдо было в меню в каждый день недели
+    past = (entry_days != NO_DAY) & (entry_days >= first) & (entry_days < today) & (entry_dishes >= 0) & available
+    cells = len(dish_ids) * WEEK
+    served_days = np.bincount(entry_dishes[past] * WEEK + weekday(entry_days[past]),
+                              minlength=cells).reshape(-1, WEEK)
+
+    # Заказы по блюдам и дням недели: menu_item_id -> блюдо через таблицу
+    lookup = np.full(int(entry_ids.max(initial=0)) + 1, -1, dtype=np.int64)
+    lookup[entry_ids[entry_ids >= 0]] = entry_dishes[entry_ids >= 0]
+    orders = analytics.columns('orders')
+    days, items = orders['day'].astype(np.int64), orders['menu_item_id']
+    mask = (days != NO_DAY) & (days >= first) & (days < today) & (items > 0) & (items < len(lookup))
+    dishes = lookup[items[mask]]
+    known = dishes >= 0
+    ordered = np.bincount(dishes[known] * WEEK + weekday(days[mask][known]),
+                          minlength=cells).reshape(-1, WEEK)
+
+    overall = ordered.sum() / served_days.sum() if served_days.sum() else 0.0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        by_dish = np.where(served_days.sum(axis=1) > 0, ordered.sum(axis=1) / served_days.sum(axis=1), overall)
+        rate = np.where(served_days > 0, ordered / served_days, by_dish[:, None])
+    return codes, rate, float(overall)
+
+
+def _placed(backend, horizon: List[str]):
+    """Уже сделанные и уже выданные заказы на дни прогноза: {menu_item_id: количество}"""
+    placed: Dict[int, int] = {}
+    served: Dict[int, int] = {}
+    for day in horizon:
+        for order in backend.scan('orders', date_prefix=day):
+            menu_item_id = order.get('menu_item_id')
+            if menu_item_id is None:
+                continue
+            placed[menu_item_id] = placed.get(menu_item_id, 0) + 1
+            if order.get('status') == 'served':
+                served[menu_item_id] = served.get(menu_item_id, 0) + 1
+    return placed, served
+
+
+def project(backend=None, days: int = None, today: date = None) -> Dict:
+    """Прогноз остатков продуктов на days дней, начиная с today.
+    Возвращает:
+        days       — даты прогноза;
+        servings   — {menu_item_id: ожидаемых порций} по записям меню;
+        items      — продукты с расходом или ниже минимума: item_id, name,
+                     unit, quantity, minimum, consumption (за весь прогноз),
+                     projected (остаток в конце), below_on (первый день
+                     ниже минимума или None), order (сколько заказать);
+        at_risk    — продукты из items, которые опустятся ниже минимума;
+        unresolved — ингредиенты, расход которых не считается (как в recipes.plan)."""
+    backend = backend or backends.get_backend()
+    days = days or config.FORECAST_DAYS
+    start = day_number((today or date.today()).isoformat())
+    horizon = [day_string(start + offset) for offset in range(days)]
+
+    menu = backend.all('menu')
+    codes, rate, overall = _demand(menu, start, config.FORECAST_HISTORY_DAYS)
+    wanted = set(horizon)
+    entries = [entry for entry in menu if entry.get('date') in wanted and entry.get('available', True) is not False]
+
+    inventory = backend.all('inventory')
+    products = {item.get('id'): item for item in inventory}
+    item_ids = list(products)
+    columns = {item_id: position for position, item_id in enumerate(item_ids)}
+
+    # Рецептуры: продукт на порцию, строка — запись меню, столбец — продукт
+    resolution = ingredients.resolution(inventory)
+    per_portion = np.zeros((len(entries), len(item_ids)))
+    unresolved = []
+    for row, entry in enumerate(entries):
+        lines, missing = recipes.entry_portions(resolution, entry, products, entry.get('id'))
+        unresolved += missing
+        for _, item_id, amount in lines:
+            per_portion[row, columns[item_id]] += amount
+
+    # Порции: прогноз по дню недели, не меньше сделанных заказов, без выданных
+    count = len(entries)
+    offsets = np.fromiter((day_number(entry['date']) - start for entry in entries), np.int64, count)
+    dish_rows = np.fromiter((codes.get(entry.get('dish_id'), -1) for entry in entries), np.int64, count)
+    expected = np.full(count, overall)
+    with_history = dish_rows >= 0
+    expected[with_history] = rate[dish_rows[with_history], weekday(start + offsets[with_history])]
+    placed, served = _placed(backend, horizon)
+    placed = np.fromiter((placed.get(entry.get('id'), 0) for entry in entries), np.float64, count)
+    served = np.fromiter((served.get(entry.get('id'), 0) for entry in entries), np.float64, count)
+    servings = np.maximum(np.maximum(expected, placed) - served, 0)
+
+    # Расход по дням и остаток на конец каждого дня
+    daily = np.zeros((days, len(item_ids)))
+    np.add.at(daily, offsets, per_portion * servings[:, None])
+    quantity = np.fromiter((_number(products[item_id].get('quantity')) for item_id in item_ids),
+                           np.float64, len(item_ids))
+    minimum = np.fromiter((_number(products[item_id].get('minimum', DEFAULT_MINIMUM)) for item_id in item_ids),
+                          np.float64, len(item_ids))
+    projected = quantity[None, :] - np.cumsum(daily, axis=0)
+    below = np.round(projected, _DIGITS) < minimum[None, :]
+    at_risk = below.any(axis=0)
+    first_below = below.argmax(axis=0)
+    order = np.maximum(minimum - projected[-1], 0)
+    consumption = daily.sum(axis=0)
+
+    items = []
+    for column in np.flatnonzero((consumption > 0) | at_risk):
+        product = products[item_ids[column]]
+        items.append({
+            'item_id': item_ids[column],
+            'name': product.get('name'),
+            'unit': product.get('unit', ''),
+            'quantity': float(quantity[column]),
+            'minimum': float(minimum[column]),
+            'consumption': round(float(consumption[column]), _DIGITS),
+            'projected': round(float(projected[-1, column]), _DIGITS),
+            'below_on': horizon[first_below[column]] if at_risk[column] else None,
+            'order': round(float(order[column]), _DIGITS),
+        })
+    return {
+        'days': horizon,
+        'servings': {entry.get('id'): round(float(value), 1) for entry, value in zip(entries, servings)},
+        'items': items,
+        'at_risk': [line for line in items if line['below_on'] is not None],
+        'unresolved': unresolved,
+    }
+
+
+def draft_purchase_requests(backend, report: Dict) -> Dict[str, int]:
+    """Черновики заявок на закупку для продуктов из report['at_risk'].
+    Возвращает {'created': новых черновиков, 'updated': обновлённых}."""
+    result = {'created': 0, 'updated': 0}
+    now = datetime.now().isoformat()
+    with backend.transaction('purchase_requests') as tx:
+        # Открытые заявки — по продукту или, для заявок повара, по названию
+        open_requests: Dict[object, Dict] = {}
+        for purchase_request in backend.all('purchase_requests'):
+            if purchase_request.get('status') in (DRAFT, 'pending'):
+                open_requests[purchase_request.get('item_id')
+                              or ingredients.normalize(purchase_request.get('product'))] = purchase_request
+        for line in report['at_risk']:
+            if line['order'] <= 0:
+                continue
+            existing = open_requests.get(line['item_id']) or open_requests.get(ingredients.normalize(line['name']))
+            fields = {
+                'quantity': line['order'],
+                'unit': line['unit'],
+                'needed_by': line['below_on'],
+                'reason': (f"Прогноз: остаток ниже минимума ({line['minimum']:g} {line['unit']}) "
+                           f"с {line['below_on']}, расход за {len(report['days'])} дн. "
+                           f"{line['consumption']:g} {line['unit']}"),
+            }
+            if existing is None:
+                tx.append('purchase_requests', dict(fields, product=line['name'], item_id=line['item_id'],
+                                                    status=DRAFT, created_at=now))
+                result['created'] += 1
+            elif existing.get('status') == DRAFT and any(existing.get(k) != v for k, v in fields.items()):
+                tx.patch('purchase_requests', existing['id'], fields)
+                result['updated'] += 1
+    return result
+
+
+def run(backend=None, days: int = None) -> Dict:
+    """Прогноз и черновики заявок: отчёт project() и счётчики черновиков"""
+    backend = backend or backends.get_backend()
+    report = project(backend, days)
+    report['drafts'] = draft_purchase_requests(backend, report)
+    return report
@@ -0,0 +1,47 @@
+"""Прогноз расхода продуктов и черновики заявок на закупку (forecast.py).
+
+Прогноз считается каждую ночь в процессе приложения (config.ROLLUP_TIME);
+команда нужна, если приложение ночью не работает, или чтобы посмотреть
+прогноз. Выводит расход и остаток в конце прогноза по каждому продукту.
+Код возврата 1, если какой-то продукт опустится ниже минимума.
+
+Запуск из каталога school_canteen:
+    python forecast_purchases.py                 # прогноз и черновики заявок
+    python forecast_purchases.py --days 14
+    python forecast_purchases.py --dry-run       # только прогноз, без заявок
+"""
+import argparse
+import sys
+
+import backends
+import config
+import forecast
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--days', type=int, default=config.FORECAST_DAYS, help='на сколько дней вперёд')
+    parser.add_argument('--dry-run', action='store_true', help='не создавать черновики заявок')
+    args = parser.parse_args()
+    if args.days <= 0:
+        parser.error('--days должно быть больше нуля')
+
+    backend = backends.get_backend()
+    report = forecast.project(backend, args.days)
+    print(f"Прогноз на {report['days'][0]} — {report['days'][-1]}, записей меню: {len(report['servings'])}, "
+          f"порций: {sum(report['servings'].values()):g}")
+    for line in report['items']:
+        warning = f", ниже минимума с {line['below_on']}, заказать {line['order']:g}" if line['below_on'] else ''
+        print(f"  {line['name']}: остаток {line['quantity']:g}, расход {line['consumption']:g}, "
+              f"в конце {line['projected']:g} {line['unit']}{warning}")
+    missing = sorted({item['ingredient'] for item in report['unresolved'] if item['ingredient']})
+    if missing:
+        print('Расход не считается для ингредиентов: ' + ', '.join(missing) + ' (python check_ingredients.py)')
+    if not args.dry_run:
+        drafts = forecast.draft_purchase_requests(backend, report)
+        print(f"Черновиков заявок: новых {drafts['created']}, обновлено {drafts['updated']}")
+    return 1 if report['at_risk'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
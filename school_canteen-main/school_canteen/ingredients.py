@@ -0,0 +1,168 @@
+"""Сопоставление ингредиентов блюд с продуктами инвентаря.
+
+Состав блюда (поле contains каталога dishes) — свободные названия:
+'молоко', 'курица', 'овощи'. Раньше при выдаче блюда каждый ингредиент
+искался перебором всего инвентаря по подстроке в обе стороны, так что
+'лук' находился в 'Лукошко ягод', а результат зависел от порядка продуктов.
+
+Теперь карта «блюдо -> [(ингредиент, id продукта)]» строится один раз и
+хранится в памяти процесса, пока не изменятся названия продуктов или
+каталог блюд. Ингредиент сопоставляется с продуктом:
+1. по явной ссылке блюда: 'ingredient_links': {'курица': 2} — id продукта
+   для ингредиента (если продукта с таким id нет, ингредиент не найден);
+2. по названию или псевдониму продукта ('aliases': ['куриное филе']) —
+   после нормализации: регистр, ё/е, знаки препинания, лишние пробелы;
+3. по словам: все слова ингредиента есть в названии продукта ('масло' —
+   'Масло сливочное') или наоборот. Если так подходят несколько
+   продуктов, ингредиент считается неоднозначным и не списывается.
+
+Если у блюда есть рецептура (recipe, см. recipes.py), сопоставляются
+ингредиенты рецептуры, иначе — состав contains.
+
+Несопоставленные ингредиенты выводит python check_ingredients.py.
+"""
+import re
+import threading
+from collections.abc import Mapping
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import backends
+
+# Как найден продукт (третий элемент сопоставления)
+BY_LINK = 'link'
+BY_NAME = 'name'
+BY_WORDS = 'words'
+# Почему не найден
+MISSING = 'missing'
+AMBIGUOUS = 'ambiguous'
+BROKEN_LINK = 'broken_link'
+
+# Сопоставление: (ингредиент, id продукта или None, способ или причина)
+Match = Tuple[str, Optional[int], str]
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def normalize(name) -> str:
+    """'  Масло  сливочное, 82%' -> 'масло сливочное 82'"""
+    return ' '.join(re.findall(r'\w+', str(name or '').lower().replace('ё', 'е')))
+
+
+def _names_signature(inventory: Iterable[Dict]) -> tuple:
+    """От чего зависит карта в инвентаре: id, названия и псевдонимы продуктов"""
+    return tuple(sorted((item.get('id'), str(item.get('name') or ''), tuple(item.get('aliases') or ()))
+                        for item in inventory))
+
+
+class Resolution:
+    """Карта сопоставления для одной версии инвентаря и каталога блюд"""
+
+    __slots__ = ('backend', 'versions', 'names', 'product_ids', 'exact', 'words', 'dishes', 'portions')
+
+    def __init__(self, backend, versions, inventory: List[Dict], dishes: List[Dict]):
+        self.backend = backend
+        self.versions = versions
+        self.names = _names_signature(inventory)
+        self.product_ids = {item.get('id') for item in inventory}
+        # нормализованное название или псевдоним -> {id продуктов}
+        self.exact: Dict[str, set] = {}
+        # (слова названия, id продукта)
+        self.words: List[Tuple[frozenset, int]] = []
+        for item in inventory:
+            names = [item.get('name')] + list(item.get('aliases') or ())
+            for name in names:
+                key = normalize(name)
+                if key:
+                    self.exact.setdefault(key, set()).add(item.get('id'))
+                    self.words.append((frozenset(key.split()), item.get('id')))
+        self.dishes: Dict[int, Tuple[Match, ...]] = {}
+        # id блюда -> {ингредиент: (количество на порцию, единица)} по рецептуре
+        self.portions: Dict[int, Dict[str, tuple]] = {}
+        for dish in dishes:
+            names, portions = composition(dish)
+            self.dishes[dish.get('id')] = tuple(self.resolve(name, dish.get('ingredient_links')) for name in names)
+            if portions:
+                self.portions[dish.get('id')] = portions
+
+    def resolve(self, ingredient: str, links: Optional[Dict] = None) -> Match:
+        """Продукт для ингредиента: (ингредиент, id или None, способ или причина)"""
+        if links and ingredient in links:
+            product_id = links[ingredient]
+            if product_id in self.product_ids:
+                return ingredient, product_id, BY_LINK
+            return ingredient, None, BROKEN_LINK
+        key = normalize(ingredient)
+        found = self.exact.get(key, ())
+        if len(found) == 1:
+            return ingredient, next(iter(found)), BY_NAME
+        if len(found) > 1:
+            return ingredient, None, AMBIGUOUS
+        words = frozenset(key.split())
+        if not words:
+            return ingredient, None, MISSING
+        found = {product_id for names, product_id in self.words if words <= names or names <= words}
+        if len(found) == 1:
+            return ingredient, next(iter(found)), BY_WORDS
+        return ingredient, None, AMBIGUOUS if found else MISSING
+
+    def for_menu_entry(self, entry: Dict) -> Tuple[Match, ...]:
+        """Сопоставления для записи меню: по её блюду из каталога или, для
+        записей старого формата, по составу в самой записи"""
+        dish_id = entry.get('dish_id')
+        if dish_id is not None:
+            return self.dishes.get(dish_id, ())
+        return tuple(self.resolve(name, entry.get('ingredient_links')) for name in composition(entry)[0])
+
+    def portions_for_entry(self, entry: Dict) -> Dict[str, tuple]:
+        """Рецептура записи меню: {ингредиент: (количество на порцию, единица)};
+        пустой словарь, если рецептуры нет"""
+        dish_id = entry.get('dish_id')
+        if dish_id is not None:
+            return self.portions.get(dish_id, {})
+        return composition(entry)[1]
+
+
+def composition(record: Dict) -> Tuple[List[str], Dict[str, tuple]]:
+    """Ингредиенты блюда (или записи меню старого формата) и количества на
+    порцию: из рецептуры recipe, если она есть, иначе из состава contains
+    (без количеств)"""
+    recipe = [line for line in record.get('recipe') or () if isinstance(line, Mapping) and line.get('ingredient')]
+    if recipe:
+        return ([line['ingredient'] for line in recipe],
+                {line['ingredient']: (line.get('quantity'), line.get('unit')) for line in recipe})
+    return list(record.get('contains') or ()), {}
+
+
+def resolution(inventory: List[Dict] = None) -> Resolution:
+    """Актуальная карта сопоставления. inventory — уже прочитанные продукты
+    (чтобы не читать инвентарь второй раз).
+    Списание меняет остатки, а с ними и версию инвентаря, но не названия —
+    в этом случае карта не перестраивается."""
+    global _cache
+    backend = backends.get_backend()
+    versions = (backend.version('inventory'), backend.version('dishes'))
+    with _cache_lock:
+        cached = _cache
+    if cached is not None and cached.backend is backend and cached.versions == versions:
+        return cached
+    # Версии взяты до чтения: если данные изменятся во время построения,
+    # следующий вызов построит карту заново
+    if inventory is None:
+        inventory = backend.all('inventory')
+    if (cached is not None and cached.backend is backend and cached.versions[1] == versions[1]
+            and cached.names == _names_signature(inventory)):
+        with _cache_lock:
+            cached.versions = versions
+        return cached
+    result = Resolution(backend, versions, inventory, backend.all('dishes'))
+    with _cache_lock:
+        _cache = result
+    return result
+
+
+def invalidate() -> None:
+    """Забывает построенную карту"""
+    global _cache
+    with _cache_lock:
+        _cache = None
@@ -0,0 +1,40 @@
+"""Однократный перенос данных столовой между хранилищами.
+
+Запуск из каталога school_canteen:
+    python migrate_storage.py --to sqlite             # JSON-файлы -> SQLite
+    python migrate_storage.py --from sqlite --to json # обратно
+
+После переноса укажите хранилище в переменной окружения CANTEEN_STORAGE.
+Содержимое коллекций в целевом хранилище заменяется.
+"""
+import argparse
+import sys
+
+import backends
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--from', dest='source', default='json', choices=['json', 'sqlite'])
+    parser.add_argument('--to', dest='target', required=True, choices=['json', 'sqlite'])
+    args = parser.parse_args()
+
+    if args.source == args.target:
+        parser.error('исходное и целевое хранилища совпадают')
+
+    copied = backends.migrate(args.source, args.target)
+
+    # Сверяем количество записей в целевом хранилище
+    target = backends.get_backend(args.target)
+    ok = True
+    print(f"{'коллекция':<20} {'записей':>8}  проверка")
+    for collection, count in copied.items():
+        actual = len(target.all(collection))
+        status = 'OK' if actual == count else f'ОШИБКА: в целевом хранилище {actual}'
+        ok = ok and actual == count
+        print(f'{collection:<20} {count:>8}  {status}')
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,33 @@
+"""Проставление меток времени ts заказам и платежам, сохранённым до их появления.
+
+Хранилище проставляет ts только новым записям — при записи. Старые записи
+без ts в выборки за период (Backend.between) не попадают, пока команда не
+проставит им метки; её же выполняет bootstrap.py. Повторный запуск ничего
+не меняет.
+
+Запуск из каталога school_canteen:
+    python migrate_timestamps.py
+"""
+import argparse
+import sys
+import time
+
+import backends
+from backends import PARTITIONS
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.parse_args()
+
+    backend = backends.get_backend()
+    started = time.perf_counter()
+    for collection in PARTITIONS:
+        print(f'{collection}: метки времени проставлены {backend.add_timestamps(collection)} записям')
+    backend.compact()
+    print(f'Готово за {time.perf_counter() - started:.1f} с')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
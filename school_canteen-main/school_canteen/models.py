@@ -0,0 +1,408 @@
+"""Типизированные записи основных коллекций.
+
+Хранилище держит разобранные документы в памяти процесса (кэш storage),
+в том числе заказы и платежи за всю историю. Пока записи были словарями,
+каждый заказ занимал хэш-таблицу на десяток ключей и собственные копии
+одних и тех же строк: даты, времени, типа, статуса, названия блюда.
+
+Здесь описаны классы записей — User, MenuItem, Order, Payment,
+InventoryItem, StockMovement, StockSnapshot, PurchaseRequest, Review.
+Поля схемы хранятся в __slots__, повторяющиеся строки интернируются
+(одна копия на процесс), а редкие поля вне схемы (prepared_by,
+served_at, ...) — в небольшом словаре _extra.
+Замер памяти на 100 тыс. заказов: python benchmarks/bench_records.py.
+
+Запись — словарь только для чтения (Mapping): get, [], in, items работают
+как раньше, поэтому код чтения не меняется. Отсутствующее поле остаётся
+отсутствующим (get вернёт значение по умолчанию), None — сохраняется как
+None, так что запись возвращается в JSON ровно такой, какой была прочитана.
+Копия записи (storage.clone, pickle) — обычный словарь.
+
+Типы полей проверяются один раз:
+- при разборе документа (load): запись, не прошедшая проверку, остаётся
+  словарём, а в журнал приложения пишется предупреждение — из-за одной
+  испорченной записи не перестаёт открываться весь месяц заказов;
+  найти такие записи — python check_records.py;
+- при записи (validate, вызывается из UnitOfWork): некорректная запись
+  не попадает в хранилище, а транзакция прерывается InvalidRecordError.
+"""
+import logging
+import re
+import sys
+from collections.abc import ItemsView, Mapping
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+_DATE_RE = re.compile(r'\d{4}-\d{2}-\d{2}')
+_MISSING = object()
+# Сколько различных значений одного поля запоминать для интернирования
+_INTERN_LIMIT = 10000
+
+
+class InvalidRecordError(ValueError):
+    """Запись не соответствует схеме своей коллекции"""
+
+
+class Field:
+    """Описание поля записи.
+    types — допустимые типы значения (float допускает и int, bool не
+    считается числом); required — поле обязательно и не может быть None;
+    intern — значения повторяются между записями (даты, статусы) и хранятся
+    в одном экземпляре; check — дополнительная проверка значения."""
+
+    __slots__ = ('types', 'required', 'intern', 'check')
+
+    def __init__(self, *types, required: bool = False, intern: bool = False, check=None):
+        accepted = set()
+        for kind in types:
+            accepted.update((int, float) if kind is float else (kind,))
+        if not required:
+            accepted.add(type(None))
+        self.types = frozenset(accepted)
+        self.required = required
+        self.intern = intern
+        self.check = check
+
+
+def _is_date(value) -> bool:
+    """Дата 'YYYY-MM-DD' или дата-время ISO, начинающаяся с неё"""
+    return _DATE_RE.match(value) is not None
+
+
+class _Items(ItemsView):
+    """items() записи: пары берутся прямо из слотов, без сборки словаря"""
+
+    def __iter__(self):
+        return self._mapping._pairs()
+
+
+class Record(Mapping):
+    """Базовый класс записей. Подкласс задаёт collection и SCHEMA
+    ({поле: Field}), а __slots__ = tuple(SCHEMA)."""
+
+    __slots__ = ('_extra',)
+
+    collection: str = None
+    SCHEMA: Dict[str, Field] = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._fields = frozenset(cls.SCHEMA)
+        # Таблицы интернирования: {поле: {значение: единственный экземпляр}}
+        cls._memos = {name: {} for name, field in cls.SCHEMA.items() if field.intern}
+        # Схема для decode: {поле: (типы, таблица интернирования или None, проверка)}
+        cls._layout = {name: (field.types, cls._memos.get(name), field.check) for name, field in cls.SCHEMA.items()}
+        cls._required = tuple(name for name, field in cls.SCHEMA.items() if field.required)
+        if cls.collection:
+            RECORD_TYPES[cls.collection] = cls
+
+    @classmethod
+    def decode(cls, data: Dict) -> 'Record':
+        """Запись из словаря JSON; InvalidRecordError, если он не
+        соответствует схеме"""
+        if type(data) is not dict:
+            raise InvalidRecordError(f'{cls.__name__}: ожидался объект, получено {type(data).__name__}')
+        record = object.__new__(cls)
+        layout = cls._layout
+        extra = None
+        for name, value in data.items():
+            spec = layout.get(name)
+            if spec is None:
+                if extra is None:
+                    extra = {}
+                extra[name] = value
+                continue
+            types, memo, check = spec
+            if type(value) not in types:
+                _wrong_type(cls, data, name, value)
+            if value is not None:
+                if memo is not None:
+                    canonical = memo.get(value)
+                    value = canonical if canonical is not None else cls._admit(name, value, data)
+                elif check is not None and not check(value):
+                    _invalid(cls, data, f'некорректное значение поля {name}: {value!r}')
+            # setattr, а не record.name: поле может называться ключевым словом ('class')
+            setattr(record, name, value)
+        for name in cls._required:
+            if name not in data:
+                _invalid(cls, data, f'нет обязательного поля {name}')
+        record._extra = extra
+        return record
+
+    def to_dict(self) -> Dict:
+        """Поля записи в виде словаря: сначала поля схемы, затем остальные"""
+        result = {}
+        for name in self.SCHEMA:
+            value = getattr(self, name, _MISSING)
+            if value is not _MISSING:
+                result[name] = value
+        if self._extra is not None:
+            result.update(self._extra)
+        return result
+
+    def _pairs(self):
+        """Пары (поле, значение) по порядку to_dict, без сборки словаря"""
+        for name in self.SCHEMA:
+            value = getattr(self, name, _MISSING)
+            if value is not _MISSING:
+                yield name, value
+        if self._extra is not None:
+            yield from self._extra.items()
+
+    @classmethod
+    def _admit(cls, name: str, value, data: Dict):
+        """Проверяет новое значение интернируемого поля и запоминает его"""
+        check = cls.SCHEMA[name].check
+        if check is not None and not check(value):
+            _invalid(cls, data, f'некорректное значение поля {name}: {value!r}')
+        if isinstance(value, str):
+            value = sys.intern(value)
+        memo = cls._memos[name]
+        if len(memo) < _INTERN_LIMIT:
+            memo[value] = value
+        return value
+
+    @classmethod
+    def load(cls, data):
+        """Запись из документа на диске: как decode, но запись, не прошедшая
+        проверку, возвращается без изменений (словарём)"""
+        try:
+            return cls.decode(data)
+        except InvalidRecordError as e:
+            logger.warning('Запись не прошла проверку и оставлена словарём: %s', e)
+            return data
+
+    # --- Словарь только для чтения ---
+
+    def get(self, key, default=None):
+        if key in self._fields:
+            return getattr(self, key, default)
+        extra = self._extra
+        return extra.get(key, default) if extra is not None else default
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __iter__(self):
+        for name in self.SCHEMA:
+            if hasattr(self, name):
+                yield name
+        if self._extra is not None:
+            yield from self._extra
+
+    def __len__(self):
+        count = len(self._extra) if self._extra is not None else 0
+        for name in self.SCHEMA:
+            if hasattr(self, name):
+                count += 1
+        return count
+
+    def items(self):
+        return _Items(self)
+
+    def __eq__(self, other):
+        if isinstance(other, Record):
+            return self.to_dict() == other.to_dict()
+        if isinstance(other, Mapping):
+            return self.to_dict() == dict(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.to_dict()!r})'
+
+    def copy(self) -> Dict:
+        return self.to_dict()
+
+    def __reduce__(self):
+        # Копия записи через pickle (кэш storage, load_json) — обычный словарь
+        return dict, (self.to_dict(),)
+
+
+def _invalid(cls, data: Dict, problem: str):
+    raise InvalidRecordError(f'{cls.__name__} {data.get("id")!r}: {problem}')
+
+
+def _wrong_type(cls, data: Dict, name: str, value):
+    if value is None:
+        _invalid(cls, data, f'нет обязательного поля {name}')
+    _invalid(cls, data, f'поле {name} не может быть {type(value).__name__} ({value!r})')
+
+
+# Коллекция -> класс записей; заполняется при объявлении классов
+RECORD_TYPES: Dict[str, type] = {}
+
+
+class User(Record):
+    collection = 'users'
+    SCHEMA = {
+        'id': Field(int, required=True),
+        'username': Field(str, required=True),
+        'password': Field(str),
+        'role': Field(str, required=True, intern=True),
+        'full_name': Field(str),
+        'email': Field(str),
+        'class': Field(str, intern=True),
+        'allergies': Field(list),
+        'balance': Field(float),
+        'created_at': Field(str),
+        'preferences': Field(list),
+    }
+    __slots__ = tuple(SCHEMA)
+
+
+class MenuItem(Record):
+    collection = 'menu'
+    SCHEMA = {
+        'id': Field(int, required=True),
+        'date': Field(str, intern=True, check=_is_date),
+        'type': Field(str, intern=True),
+        'price': Field(float),
+        'available': Field(bool),
+        'dish_id': Field(int),
+    }
+    __slots__ = tuple(SCHEMA)
+
+
+class Order(Record):
+    collection = 'orders'
+    SCHEMA = {
+        'id': Field(int, required=True),
+        'student_id': Field(int, required=True),
+        'meal_type': Field(str, intern=True),
+        'date': Field(str, required=True, intern=True, check=_is_date),
+        'time': Field(str, intern=True),
+        'issued_by': Field(int),
+        'status': Field(str, intern=True),
+        'ts': Field(int),
+        'menu_item_id': Field(int),
+        'menu_item_name': Field(str, intern=True),
+        'type': Field(str, intern=True),
+        'price': Field(float),
+    }
+    __slots__ = tuple(SCHEMA)
+
+
+class Payment(Record):
+    collection = 'payments'
+    SCHEMA = {
+        'id': Field(int, required=True),
+        'user_id': Field(int, required=True),
+        'amount': Field(float, required=True),
+        'type': Field(str, intern=True),
+        'description': Field(str, intern=True),
+        'date': Field(str, required=True, check=_is_date),
+        'status': Field(str, intern=True),
+        'ts': Field(int),
+    }
+    __slots__ = tuple(SCHEMA)
+
+
+class InventoryItem(Record):
+    collection = 'inventory'
+    SCHEMA = {
+        'id': Field(int, required=True),
+        'name': Field(str, required=True),
+        'category': Field(str, intern=True),
+        'quantity': Field(float),
+        'unit': Field(str, intern=True),
+        'minimum': Field(float),
+        'expires': Field(str),
+        'description': Field(str),
+        # Другие названия продукта в составе блюд (ingredients.py)
+        'aliases': Field(list),
+        # Цена за единицу продукта — для затрат на продукты (stock_ledger.py)
+        'price': Field(float),
+    }
+    __slots__ = tuple(SCHEMA)
+
+
+class StockMovement(Record):
+    collection = 'stock_movements'
+    SCHEMA = {
+        'id': Field(int, required=True),
+        'item_id': Field(int, required=True),
+        'kind': Field(str, required=True, intern=True),
+        'delta': Field(float, required=True),
+        # Остаток продукта после движения
+        'balance': Field(float),
+        'unit': Field(str, intern=True),
+        'price': Field(float),
+        'date': Field(str, required=True, check=_is_date),
+        'ts': Field(int),
+    }
+    __slots__ = tuple(SCHEMA)
+
+
+class StockSnapshot(Record):
+    collection = 'stock_snapshots'
+    SCHEMA = {
+        'id': Field(int, required=True),
+        # Последнее движение, вошедшее в снимок, и его время
+        'movement_id': Field(int, required=True),
+        'date': Field(str, required=True, check=_is_date),
+        'ts': Field(int),
+        # {id продукта (строкой): остаток}
+        'stock': Field(dict, required=True),
+    }
+    __slots__ = tuple(SCHEMA)
+
+
+class PurchaseRequest(Record):
+    collection = 'purchase_requests'
+    SCHEMA = {
+        'id': Field(int, required=True),
+        'product': Field(str),
+        # Количество вводится в форме вместе с единицей измерения ('10 кг')
+        'quantity': Field(float, str),
+        'reason': Field(str),
+        'status': Field(str, intern=True),
+        'created_by': Field(int),
+        'created_at': Field(str),
+        'approved_by': Field(int),
+        'approved_at': Field(str),
+        'rejected_by': Field(int),
+        'rejected_at': Field(str),
+        # Черновики по прогнозу расхода (forecast.py): продукт, единица и
+        # день, когда остаток опустится ниже минимума
+        'item_id': Field(int),
+        'unit': Field(str, intern=True),
+        'needed_by': Field(str),
+    }
+    __slots__ = tuple(SCHEMA)
+
+
+class Review(Record):
+    collection = 'reviews'
+    SCHEMA = {
+        'id': Field(int, required=True),
+        'student_id': Field(int, required=True),
+        'menu_item_id': Field(int),
+        'rating': Field(int),
+        'comment': Field(str),
+        'date': Field(str),
+        'approved': Field(bool),
+        'approved_at': Field(str),
+    }
+    __slots__ = tuple(SCHEMA)
+
+
+def record_type(collection: str) -> Optional[type]:
+    """Класс записей коллекции или None, если для неё схемы нет"""
+    return RECORD_TYPES.get(collection)
+
+
+def validate(collection: str, record: Dict) -> None:
+    """Проверяет запись перед сохранением; InvalidRecordError, если она не
+    соответствует схеме коллекции"""
+    cls = RECORD_TYPES.get(collection)
+    if cls is not None:
+        cls.decode(record)
@@ -0,0 +1,30 @@
+"""Пересчёт сводных показателей администратора и счётчиков учеников с нуля.
+
+Показатели (aggregates.py) и счётчики питания учеников (student_counters.py)
+обновляются при каждой записи, пересчёт нужен после переноса данных между
+хранилищами, ручной правки файлов или чтобы уточнить счётчики заказов по
+классам после перевода учеников.
+
+Запуск из каталога school_canteen:
+    python rebuild_aggregates.py
+"""
+import argparse
+import sys
+
+import data_manager
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.parse_args()
+
+    totals = data_manager.rebuild_aggregates()
+    print(f"Учеников: {totals['students']}, сумма балансов: {totals['balance_total']}")
+    print(f"Заказов: {totals['orders_total']} за {len(totals['orders_by_day'])} дн.")
+    print(f"Заявок на рассмотрении: {totals['pending_requests']}, отзывов: {totals['pending_reviews']}")
+    print(f"Счётчики питания пересчитаны для {data_manager.rebuild_student_counters()} пользователей")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,139 @@
+"""Рецептуры блюд и расчёт списания продуктов.
+
+Рецептура — поле recipe блюда каталога (dishes): сколько продукта уходит
+на одну порцию, в любой единице, которая пересчитывается в единицу
+продукта (units.py):
+
+    'recipe': [
+        {'ingredient': 'молоко', 'quantity': 150, 'unit': 'мл'},
+        {'ingredient': 'манка', 'quantity': 30, 'unit': 'г'},
+    ]
+
+Для блюд без рецептуры списывается прежняя условная порция
+(units.default_portion): 100 г, 100 мл или одна штука каждого продукта из
+состава contains.
+
+plan() считает списание сразу для нескольких блюд ({menu_item_id: порций},
+например весь обед): потребность по каждому продукту суммируется за один
+проход, а результат записывается одной транзакцией (см.
+data_manager.consume_for_menu_items). Если продукта не хватает, в отчёте
+есть нехватка (shortfall); строгое списание в этом случае ничего не
+меняет и прерывается InsufficientStockError с тем же отчётом.
+"""
+from numbers import Real
+from typing import Dict, List
+
+import units
+
+# Причины, по которым ингредиент не списан (дополняют причины ingredients.py)
+NO_MENU_ITEM = 'no_menu_item'
+BAD_RECIPE = 'bad_recipe'
+UNIT_MISMATCH = 'unit_mismatch'
+
+# Точность остатков: тысячные доли единицы (граммы в килограммах)
+_DIGITS = 3
+
+
+class InsufficientStockError(Exception):
+    """Продуктов на складе меньше, чем нужно. report — отчёт plan() с
+    нехваткой по каждому продукту (report['shortfalls'])."""
+
+    def __init__(self, report: Dict):
+        names = ', '.join(f"{line['name']} ({line['shortfall']} {line['unit']})" for line in report['shortfalls'])
+        super().__init__(f'Не хватает продуктов: {names}')
+        self.report = report
+
+
+def portion(recipe_line, unit) -> float:
+    """Количество продукта с единицей unit на одну порцию.
+    recipe_line — (количество, единица) из рецептуры или None (рецептуры нет).
+    UnitError, если количество из рецептуры не пересчитывается в unit."""
+    if recipe_line is None:
+        return units.default_portion(unit)
+    quantity, recipe_unit = recipe_line
+    if not isinstance(quantity, Real) or isinstance(quantity, bool) or quantity < 0:
+        raise ValueError(f'некорректное количество в рецептуре: {quantity!r}')
+    return units.convert(quantity, recipe_unit, unit)
+
+
+def entry_portions(resolution, entry: Dict, products: Dict[int, Dict], menu_item_id=None):
+    """Продукты на одну порцию записи меню entry.
+    products — продукты инвентаря {id: запись}.
+    Возвращает (строки [(ингредиент, id продукта, количество в единице
+    продукта)], несписываемые ингредиенты в формате plan()['unresolved'])."""
+    lines = []
+    unresolved = []
+    portions = resolution.portions_for_entry(entry)
+    for ingredient, item_id, how in resolution.for_menu_entry(entry):
+        product = products.get(item_id)
+        if product is None:
+            unresolved.append({'menu_item_id': menu_item_id, 'ingredient': ingredient, 'reason': how,
+                               'detail': None})
+            continue
+        try:
+            amount = portion(portions.get(ingredient), product.get('unit'))
+        except units.UnitError as e:
+            unresolved.append({'menu_item_id': menu_item_id, 'ingredient': ingredient,
+                               'reason': UNIT_MISMATCH, 'detail': str(e)})
+            continue
+        except ValueError as e:
+            unresolved.append({'menu_item_id': menu_item_id, 'ingredient': ingredient,
+                               'reason': BAD_RECIPE, 'detail': str(e)})
+            continue
+        lines.append((ingredient, item_id, amount))
+    return lines, unresolved
+
+
+def plan(resolution, entries: Dict, servings: Dict[int, int], inventory: List[Dict]) -> Dict:
+    """Списание продуктов на servings = {menu_item_id: порций}.
+    entries — записи меню {menu_item_id: запись}, resolution — карта
+    ingredients.resolution(), inventory — текущие продукты.
+    Возвращает отчёт:
+        items      — по продукту: item_id, name, unit, before, required,
+                     consumed, after, shortfall, low_stock, ingredients;
+        shortfalls — продукты из items, которых не хватает (shortfall > 0);
+        unresolved — ингредиенты, которые не списываются:
+                     {'menu_item_id', 'ingredient', 'reason', 'detail'}."""
+    products = {item.get('id'): item for item in inventory}
+    required: Dict[int, float] = {}
+    sources: Dict[int, List[str]] = {}
+    unresolved = []
+    for menu_item_id, count in servings.items():
+        if count <= 0:
+            continue
+        entry = entries.get(menu_item_id)
+        if entry is None:
+            unresolved.append({'menu_item_id': menu_item_id, 'ingredient': None, 'reason': NO_MENU_ITEM,
+                               'detail': 'пункт меню не найден'})
+            continue
+        lines, missing = entry_portions(resolution, entry, products, menu_item_id)
+        unresolved += missing
+        for ingredient, item_id, amount in lines:
+            required[item_id] = required.get(item_id, 0) + amount * count
+            names = sources.setdefault(item_id, [])
+            if ingredient not in names:
+                names.append(ingredient)
+
+    items = []
+    for item_id, amount in required.items():
+        product = products[item_id]
+        before = product.get('quantity') or 0
+        amount = round(amount, _DIGITS)
+        after = max(0, round(before - amount, _DIGITS))
+        items.append({
+            'item_id': item_id,
+            'name': product.get('name'),
+            'unit': product.get('unit', ''),
+            'before': before,
+            'required': amount,
+            'consumed': round(before - after, _DIGITS),
+            'after': after,
+            'shortfall': round(max(0, amount - before), _DIGITS),
+            'low_stock': after < product.get('minimum', 10),
+            'ingredients': sources[item_id],
+        })
+    return {
+        'items': items,
+        'shortfalls': [line for line in items if line['shortfall'] > 0],
+        'unresolved': unresolved,
+    }
@@ -0,0 +1,256 @@
+"""Фоновые отчёты администратора.
+
+Тяжёлые отчёты — посещаемость классов за год, расходы классов на питание,
+популярность блюд по месяцам — считаются не в обработчике запроса, а в
+пуле concurrent.futures. По умолчанию это пул процессов: расчёт не
+занимает GIL воркера, который в это время обслуживает учеников.
+Администратор ставит отчёт в очередь и следит за ним на странице состояния.
+
+Задание вместе с результатом хранится файлом в config.REPORTS_DIR. Имя
+файла строится по отчёту, параметрам и версии данных, поэтому повторный
+запрос с теми же параметрами, пока данные не изменились, получает уже
+готовый (или ещё считающийся) результат. В версию данных входят только
+месяцы периода отчёта: сегодняшние заказы не сбрасывают отчёт за прошлый
+год. Файлы заданий видны всем воркерам приложения.
+"""
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import threading
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import analytics
+import backends
+import config
+import storage
+from backends import PARTITIONS, UNDATED
+from data_manager import get_menu_items_by_ids
+
+_KEY_RE = re.compile(r'[a-z_]+-[0-9a-f]{12}-[0-9a-f]{16}')
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+# --- Отчёты ---
+# Результат отчёта — таблица: {'columns': [...], 'rows': [[...], ...]}
+
+def _student_classes() -> Dict[int, str]:
+    return {user['id']: user.get('class') for user in backends.get_backend().all('users')
+            if user.get('role') == 'student'}
+
+
+def _monthly_table(first_column: str, by_month: Dict, labels: Dict = None) -> Dict:
+    """{группа: {месяц: значение}} -> таблица: строка на группу, столбец на месяц и итог"""
+    months = sorted({month for values in by_month.values() for month in values})
+    rows = []
+    for group, values in by_month.items():
+        row = [labels.get(group, group) if labels else group]
+        row += [values.get(month, 0) for month in months]
+        row.append(sum(values.values()))
+        rows.append(row)
+    return {'columns': [first_column] + months + ['Итого'], 'rows': rows}
+
+
+def _attendance(start: Optional[str], end: Optional[str]) -> Dict:
+    table = _monthly_table('Класс', analytics.orders_by_class_and_month(_student_classes(), start, end))
+    table['rows'].sort(key=lambda row: row[0])
+    return table
+
+
+def _class_spending(start: Optional[str], end: Optional[str]) -> Dict:
+    spending = analytics.orders_by_class_and_month(_student_classes(), start, end, spending=True)
+    table = _monthly_table('Класс', spending)
+    table['rows'].sort(key=lambda row: row[0])
+    return table
+
+
+def _dish_trends(start: Optional[str], end: Optional[str]) -> Dict:
+    by_month = analytics.orders_by_dish_and_month(start, end, limit=10)
+    names = {item_id: item.get('name') for item_id, item in get_menu_items_by_ids(by_month).items()}
+    table = _monthly_table('Блюдо', by_month, names)
+    table['rows'].sort(key=lambda row: -row[-1])
+    return table
+
+
+# Отчёт -> (название, коллекции, от которых зависит результат, функция)
+REPORTS = {
+    'attendance': ('Посещаемость классов по месяцам', ('orders', 'users'), _attendance),
+    'class_spending': ('Расходы классов на питание по месяцам', ('orders', 'users'), _class_spending),
+    'dish_trends': ('Популярность блюд по месяцам', ('orders', 'menu', 'dishes'), _dish_trends),
+}
+
+
+# --- Задания ---
+
+def _in_period(partition: str, start: Optional[str], end: Optional[str]) -> bool:
+    # Заказы без даты в отчёты по месяцам не входят
+    return (partition != UNDATED
+            and (not start or partition >= start[:7]) and (not end or partition <= end[:7]))
+
+
+def data_version(collections, start: str = None, end: str = None) -> str:
+    """Версия данных, от которых зависит отчёт за период: для коллекций
+    по месяцам учитываются только месяцы периода"""
+    backend = backends.get_backend()
+    parts = []
+    for collection in collections:
+        if collection in PARTITIONS:
+            versions = backend.partition_versions(collection)
+            parts.append((collection, sorted((partition, version) for partition, version in versions.items()
+                                             if _in_period(partition, start, end))))
+        else:
+            parts.append((collection, backend.version(collection)))
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()[:16]
+
+
+def _params_hash(params: Dict) -> str:
+    return hashlib.sha1(json.dumps(params, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+
+
+def _path(key: str) -> str:
+    return os.path.join(config.REPORTS_DIR, key + '.json')
+
+
+def _now() -> str:
+    return datetime.now().isoformat()
+
+
+def _is_lost(job: Dict) -> bool:
+    """Задание не завершится: расчёт упал или воркер, который его вёл, перезапущен"""
+    if job['status'] == 'failed':
+        return True
+    if job['status'] in ('queued', 'running'):
+        submitted = datetime.fromisoformat(job['submitted_at'])
+        return (datetime.now() - submitted).total_seconds() > config.REPORT_JOB_TIMEOUT
+    return False
+
+
+def _executor():
+    """Пул, в котором считаются отчёты. После fork создаётся заново:
+    пул родительского процесса в дочернем не работает"""
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            if config.REPORT_POOL == 'thread':
+                _pool = ThreadPoolExecutor(max_workers=config.REPORT_WORKERS, thread_name_prefix='report')
+            else:
+                # spawn, а не fork: приложение многопоточное, и копия чужой
+                # захваченной блокировки в дочернем процессе не освободится
+                _pool = ProcessPoolExecutor(max_workers=config.REPORT_WORKERS,
+                                            mp_context=multiprocessing.get_context('spawn'))
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def _reset_executor() -> None:
+    global _pool
+    with _pool_lock:
+        _pool = None
+
+
+def submit(report: str, start: str = None, end: str = None) -> str:
+    """Ставит отчёт за период в очередь и возвращает ключ задания.
+    Если такой отчёт по тем же данным уже посчитан или считается,
+    возвращается ключ существующего задания."""
+    if report not in REPORTS:
+        raise ValueError(f'Неизвестный отчет: {report}')
+    params = {'start': start, 'end': end}
+    key = f'{report}-{_params_hash(params)}-{data_version(REPORTS[report][1], start, end)}'
+    path = _path(key)
+    os.makedirs(config.REPORTS_DIR, exist_ok=True)
+    with storage.transaction(path):
+        job = storage.load_json(path)
+        if job and not _is_lost(job):
+            return key
+        storage.save_json(path, {
+            'key': key,
+            'report': report,
+            'title': REPORTS[report][0],
+            'params': params,
+            'status': 'queued',
+            'submitted_at': _now(),
+        })
+    try:
+        _executor().submit(run, key)
+    except Exception as e:
+        # Пул сломан (например, процесс пула убит) — следующий запрос создаст новый
+        _reset_executor()
+        _finish(key, {'status': 'failed', 'error': f'Не удалось запустить расчет: {e}'})
+    return key
+
+
+def _finish(key: str, fields: Dict) -> None:
+    path = _path(key)
+    with storage.transaction(path):
+        job = storage.load_json(path)
+        job.update(fields, finished_at=_now())
+        storage.save_json(path, job)
+
+
+def run(key: str) -> None:
+    """Считает отчёт задания key. Выполняется в пуле (или вручную)."""
+    path = _path(key)
+    with storage.transaction(path):
+        job = storage.load_json(path)
+        if not job or job['status'] != 'queued':
+            # Задание уже взял другой исполнитель
+            return
+        job.update(status='running', started_at=_now())
+        storage.save_json(path, job)
+
+    started = time.perf_counter()
+    try:
+        build = REPORTS[job['report']][2]
+        result = build(job['params'].get('start'), job['params'].get('end'))
+        fields = {'status': 'done', 'result': result}
+    except Exception:
+        fields = {'status': 'failed', 'error': traceback.format_exc()}
+    fields['seconds'] = round(time.perf_counter() - started, 3)
+    _finish(key, fields)
+    if fields['status'] == 'done':
+        _prune(key)
+
+
+def _prune(key: str) -> None:
+    """Удаляет результаты того же отчёта с теми же параметрами по
+    устаревшим версиям данных"""
+    prefix = key.rsplit('-', 1)[0] + '-'
+    for name in os.listdir(config.REPORTS_DIR):
+        other = name[:-len('.json')]
+        if name.endswith('.json') and other.startswith(prefix) and other != key:
+            job = get(other)
+            if job is not None and job['status'] in ('done', 'failed'):
+                storage.remove_document(_path(other))
+
+
+def get(key: str) -> Optional[Dict]:
+    """Задание по ключу или None"""
+    if not _KEY_RE.fullmatch(key):
+        return None
+    job = storage.load_json(_path(key))
+    return job or None
+
+
+def jobs(limit: int = 50) -> List[Dict]:
+    """Последние задания (без результатов), новые первыми"""
+    try:
+        names = os.listdir(config.REPORTS_DIR)
+    except FileNotFoundError:
+        return []
+    found = []
+    for name in names:
+        if name.endswith('.json'):
+            job = get(name[:-len('.json')])
+            if job is not None:
+                job.pop('result', None)
+                found.append(job)
+    found.sort(key=lambda job: job['submitted_at'], reverse=True)
+    return found[:limit]
@@ -0,0 +1,257 @@
+"""Снимок данных на время одного запроса Flask.
+
+Страница обычно вызывает несколько функций data_manager, и каждая из них
+читает одни и те же коллекции заново (панель ученика — около десятка
+чтений). Во время запроса data_manager работает через RequestSnapshot
+из flask.g: одинаковые чтения выполняются один раз, а более узкие выборки
+(платежи ученика за месяц после всех платежей ученика) отбираются из уже
+прочитанных записей, так что все функции видят одни и те же данные. Изменения идут напрямую в хранилище, после них
+запомненные чтения изменённых коллекций сбрасываются.
+
+Внутри транзакции чтения идут мимо снимка — под блокировкой нужны
+актуальные данные.
+
+Снимок также отмечает, какие коллекции читал и менял каждый endpoint —
+статистика доступна через endpoint_stats().
+
+Отключить: переменная окружения CANTEEN_REQUEST_SNAPSHOT=0.
+"""
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from flask import g, has_request_context, request
+
+import config
+from backends import DERIVED, PARTITIONS, Backend, get_backend as _get_backend
+from timestamps import date_range
+
+_stats: Dict[str, Dict] = {}
+_stats_lock = threading.Lock()
+_MISSING = object()
+
+
+class RequestSnapshot:
+    """Хранилище с запоминанием чтений на время запроса.
+    Повторяет интерфейс Backend; результаты чтения, как и у Backend,
+    изменять нельзя."""
+
+    def __init__(self, backend: Backend):
+        self.backend = backend
+        self.name = backend.name
+        # коллекция -> запомненные выборки (поля, начало даты, записи)
+        self._slices: Dict[str, List[tuple]] = {}
+        self._records: Dict[tuple, Optional[Dict]] = {}    # (коллекция, id) -> запись
+        self.reads: Dict[str, int] = {}     # коллекция -> обращений к хранилищу
+        self.hits: Dict[str, int] = {}      # коллекция -> чтений из снимка
+        self.writes: Dict[str, int] = {}    # коллекция -> изменений
+        self._depth = 0                     # открытые транзакции
+
+    def _count(self, counter: Dict[str, int], collection: str) -> None:
+        counter[collection] = counter.get(collection, 0) + 1
+
+    @staticmethod
+    def _matches(record: Dict, fields: Dict, date_prefix: Optional[str]) -> bool:
+        return (all(record.get(name) == value for name, value in fields.items())
+                and (not date_prefix or str(record.get('date') or '').startswith(date_prefix)))
+
+    def _cached(self, collection: str, fields: Dict, date_prefix: Optional[str]) -> Optional[List[Dict]]:
+        """Ответ из запомненной выборки, которая включает все нужные записи:
+        например, платежи ученика за месяц — из всех платежей ученика"""
+        wanted_date = date_prefix or (fields.get('date') if isinstance(fields.get('date'), str) else '')
+        for cached_fields, cached_prefix, records in self._slices.get(collection, ()):
+            if cached_prefix and not wanted_date.startswith(cached_prefix):
+                continue
+            if any(fields.get(name, _MISSING) != value for name, value in cached_fields.items()):
+                continue
+            if cached_fields == fields and cached_prefix == date_prefix:
+                return records
+            period = (date_range(date_prefix) if date_prefix and collection in PARTITIONS
+                      and 'date' not in fields else None)
+            if period is None:
+                return [r for r in records if self._matches(r, fields, date_prefix)]
+            # Хранилище отдаёт выборку за день, месяц или год через between —
+            # по возрастанию ts, а не id; запомненная выборка (все заказы
+            # ученика) идёт по id, поэтому отобранные записи сортируются
+            start, end = period
+            return sorted((r for r in records if self._matches(r, fields, None)
+                           and isinstance(r.get('ts'), int) and start <= r['ts'] < end),
+                          key=lambda r: (r['ts'], r.get('id')))
+        return None
+
+    def _select(self, collection: str, fields: Dict, date_prefix: Optional[str], load) -> List[Dict]:
+        if self._depth:
+            # Под блокировкой транзакции читаем актуальные данные, а не
+            # запомненные до её начала: иначе списание с баланса могло бы
+            # опираться на устаревшее значение
+            self._count(self.reads, collection)
+            return load()
+        records = self._cached(collection, fields, date_prefix)
+        if records is not None:
+            self._count(self.hits, collection)
+            return records
+        self._count(self.reads, collection)
+        records = load()
+        self._slices.setdefault(collection, []).append((dict(fields), date_prefix, records))
+        return records
+
+    def _changed(self, collections) -> None:
+        for collection in collections:
+            self._count(self.writes, collection)
+        # Вместе с данными могли измениться и производные данные
+        # (сводные показатели, счётчики учеников)
+        dropped = set(collections) | {target for _, target in DERIVED}
+        for collection in dropped:
+            self._slices.pop(collection, None)
+        self._records = {key: value for key, value in self._records.items() if key[0] not in dropped}
+
+    # --- Чтение ---
+
+    def all(self, collection: str) -> List[Dict]:
+        return self._select(collection, {}, None, lambda: self.backend.all(collection))
+
+    def get(self, collection: str, record_id) -> Optional[Dict]:
+        if self._depth:
+            self._count(self.reads, collection)
+            return self.backend.get(collection, record_id)
+        key = (collection, record_id)
+        if key in self._records:
+            self._count(self.hits, collection)
+            return self._records[key]
+        self._count(self.reads, collection)
+        record = self._records[key] = self.backend.get(collection, record_id)
+        return record
+
+    def get_many(self, collection: str, record_ids) -> Dict:
+        if self._depth:
+            self._count(self.reads, collection)
+            return self.backend.get_many(collection, record_ids)
+        wanted = set(record_ids)
+        missing = [record_id for record_id in wanted if (collection, record_id) not in self._records]
+        if missing:
+            self._count(self.reads, collection)
+            found = self.backend.get_many(collection, missing)
+            for record_id in missing:
+                self._records[(collection, record_id)] = found.get(record_id)
+        else:
+            self._count(self.hits, collection)
+        return {record_id: self._records[(collection, record_id)] for record_id in wanted
+                if self._records[(collection, record_id)] is not None}
+
+    def query(self, collection: str, **fields) -> List[Dict]:
+        return self._select(collection, fields, None, lambda: self.backend.query(collection, **fields))
+
+    def scan(self, collection: str, date_prefix: str = None, **fields):
+        if date_prefix is None and not fields:
+            # Полный проход по истории не запоминается — он для того и
+            # нужен, чтобы не держать всю коллекцию в памяти
+            self._count(self.reads, collection)
+            return self.backend.scan(collection)
+        return iter(self._select(collection, fields, date_prefix,
+                                 lambda: list(self.backend.scan(collection, date_prefix, **fields))))
+
+    def between(self, collection: str, start: int = None, end: int = None, reverse: bool = False, **fields):
+        # Выборки по времени не запоминаются: границы и так ищутся по индексу
+        self._count(self.reads, collection)
+        return self.backend.between(collection, start, end, reverse, **fields)
+
+    def latest(self, collection: str, **fields) -> Optional[Dict]:
+        return next(self.between(collection, reverse=True, **fields), None)
+
+    def next_id(self, collection: str) -> int:
+        return self.backend.next_id(collection)
+
+    def version(self, collection: str):
+        return self.backend.version(collection)
+
+    def partition_versions(self, collection: str):
+        return self.backend.partition_versions(collection)
+
+    def exists(self, collection: str) -> bool:
+        return self.backend.exists(collection)
+
+    # --- Изменения — напрямую в хранилище ---
+
+    @contextmanager
+    def transaction(self, *collections: str):
+        self._depth += 1
+        try:
+            with self.backend.transaction(*collections) as tx:
+                yield tx
+        finally:
+            self._depth -= 1
+            self._changed(collections)
+
+    def append(self, collection: str, record: Dict) -> int:
+        with self.transaction(collection) as tx:
+            return tx.append(collection, record)
+
+    def put(self, collection: str, record: Dict) -> None:
+        with self.transaction(collection) as tx:
+            tx.put(collection, record)
+
+    def patch(self, collection: str, record_id, fields: Dict) -> bool:
+        with self.transaction(collection) as tx:
+            return tx.patch(collection, record_id, fields)
+
+    def delete(self, collection: str, record_id) -> bool:
+        with self.transaction(collection) as tx:
+            return tx.delete(collection, record_id)
+
+    def create(self, collection: str) -> None:
+        try:
+            self.backend.create(collection)
+        finally:
+            self._changed((collection,))
+
+    def replace_all(self, collection: str, records: List[Dict]) -> None:
+        try:
+            self.backend.replace_all(collection, records)
+        finally:
+            self._changed((collection,))
+
+
+def get_backend():
+    """Хранилище для data_manager: внутри запроса — снимок запроса,
+    вне запроса (команды, бенчмарки) — обычное хранилище"""
+    if not config.REQUEST_SNAPSHOT or not has_request_context():
+        return _get_backend()
+    snapshot = g.get('data_snapshot')
+    if snapshot is None:
+        snapshot = g.data_snapshot = RequestSnapshot(_get_backend())
+    return snapshot
+
+
+def _record_request(exc=None) -> None:
+    """Добавляет в статистику endpoint коллекции, которые затронул запрос"""
+    snapshot = g.pop('data_snapshot', None)
+    if snapshot is None:
+        return
+    endpoint = request.endpoint or request.path
+    with _stats_lock:
+        stats = _stats.setdefault(endpoint, {'requests': 0, 'reads': {}, 'hits': {}, 'writes': {}})
+        stats['requests'] += 1
+        for field in ('reads', 'hits', 'writes'):
+            for collection, count in getattr(snapshot, field).items():
+                stats[field][collection] = stats[field].get(collection, 0) + count
+
+
+def init_app(app) -> None:
+    """Подключает сбор статистики по endpoint к приложению"""
+    app.teardown_request(_record_request)
+
+
+def endpoint_stats() -> Dict[str, Dict]:
+    """Для каждого endpoint: число запросов и по коллекциям — сколько раз
+    они читались из хранилища (reads), из снимка (hits) и изменялись (writes)"""
+    with _stats_lock:
+        return {endpoint: {'requests': stats['requests'],
+                           'reads': dict(stats['reads']),
+                           'hits': dict(stats['hits']),
+                           'writes': dict(stats['writes'])}
+                for endpoint, stats in _stats.items()}
+
+
+def reset_endpoint_stats() -> None:
+    with _stats_lock:
+        _stats.clear()
@@ -0,0 +1,392 @@
+"""Итоги закрытых дней: заказы и платежи, сведённые по месяцам.
+
+Статистика ученика (питания и траты за месяц, абонементы за 30 дней) и
+отчёты администратора за период считались заново по всем заказам и
+платежам периода. Здесь каждый прошедший день «закрывается»: его заказы
+и платежи сводятся в компактные записи коллекции rollups:
+
+    kind='day'   — итоги дня: завтраки, обеды и всего, заказы по классам
+                   и по блюдам, платежи по типам;
+    kind='user'  — итоги месяца по пользователю: заказов и их сумма,
+                   потрачено (без пополнений), последнее питание,
+                   даты оплаты абонементов;
+    kind='month' — closed_until: последний закрытый день месяца.
+
+Запросы берут закрытые дни из итогов, а остальные (обычно только
+сегодняшний) — из самих заказов и платежей, поэтому запрос за месяц или
+за год читает одно и то же число записей, сколько бы заказов ни было.
+
+Если после закрытия изменился заказ или платёж прошедшего дня, сводные
+показатели отмечают его месяц (aggregates.ROLLUP_DIRTY). До следующего
+закрытия такой месяц считается по исходным данным, а закрытие его
+пересчитывает. Класс заказа — класс ученика на момент закрытия.
+
+Закрытие выполняется каждую ночь в одном из процессов приложения
+(config.ROLLUP_TIME, start_scheduler) вместе с обслуживанием хранилища или
+командой (например, из cron, если планировщик выключен):
+    python close_days.py
+Массовые операции (replace_all, перенос между хранилищами) отметок не
+ставят — после них: python close_days.py --rebuild
+"""
+import calendar
+import logging
+import os
+import re
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, Iterable, List, Optional
+
+import backends
+import config
+import forecast
+import stock_ledger
+import storage
+from aggregates import AGGREGATES_ID, ROLLUP_DIRTY
+from backends import UNDATED
+from timestamps import period_range
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+KIND_MONTH = 'month'
+KIND_DAY = 'day'
+KIND_USER = 'user'
+MEAL_TYPES = ('breakfast', 'lunch')
+_DAY_RE = re.compile(r'\d{4}-\d{2}-\d{2}')
+_TIME_RE = re.compile(r'\d{2}:\d{2}')
+
+logger = logging.getLogger(__name__)
+_scheduler: Optional[threading.Thread] = None
+_scheduler_lock = threading.Lock()
+
+
+def _day(record: Dict) -> Optional[str]:
+    day = str(record.get('date') or '')[:10]
+    return day if _DAY_RE.fullmatch(day) else None
+
+
+def _month_end(month: str) -> str:
+    year, number = map(int, month.split('-'))
+    return f'{month}-{calendar.monthrange(year, number)[1]:02d}'
+
+
+def _next_day(day: str) -> str:
+    return (date.fromisoformat(day) + timedelta(days=1)).isoformat()
+
+
+# --- Свёртка заказов и платежей ---
+# totals — {'days': {день: итоги дня}, 'users': {id пользователя: итоги месяца}}
+
+def _new_day(day: str) -> Dict:
+    return {'kind': KIND_DAY, 'month': day[:7], 'day': day, 'breakfast': 0, 'lunch': 0, 'total': 0, 'classes': {}, 'dishes': {}, 'revenue': {}}
+
+
+def _new_user(user_id, month: str) -> Dict:
+    return {'kind': KIND_USER, 'month': month, 'user_id': user_id, 'orders': 0, 'order_sum': 0,
+            'spent': 0, 'last_meal': None, 'subscriptions': []}
+
+
+def _add(counter: Dict, name: str, value=1) -> None:
+    counter[name] = counter.get(name, 0) + value
+
+
+def _meal_key(meal) -> str:
+    # Питание с некорректным временем — самое раннее, как и раньше
+    return f'{meal[0]} {meal[1]}' if meal and _TIME_RE.fullmatch(str(meal[1])) else ''
+
+
+def _user(totals: Dict, user_id, day: str) -> Optional[Dict]:
+    if user_id is None:
+        return None
+    user = totals['users'].get(user_id)
+    if user is None:
+        user = totals['users'][user_id] = _new_user(user_id, day[:7])
+    return user
+
+
+def _add_order(totals: Dict, order: Dict, student_class: Callable) -> None:
+    day = _day(order)
+    stats = totals['days'].get(day) or totals['days'].setdefault(day, _new_day(day))
+    meal_type = order.get('type')
+    if meal_type in MEAL_TYPES:
+        stats[meal_type] += 1
+    stats['total'] += 1
+    class_name = student_class(order.get('student_id'))
+    if class_name:
+        _add(stats['classes'], class_name)
+    if order.get('menu_item_id'):
+        _add(stats['dishes'], str(order['menu_item_id']))
+
+    user = _user(totals, order.get('student_id'), day)
+    if user is not None:
+        user['orders'] += 1
+        user['order_sum'] += order.get('price', 0) or 0
+        meal = [day, order.get('time')]
+        if user['last_meal'] is None or _meal_key(meal) > _meal_key(user['last_meal']):
+            user['last_meal'] = meal
+
+
+def _add_payment(totals: Dict, payment: Dict) -> None:
+    day = _day(payment)
+    payment_type = payment.get('type')
+    amount = payment.get('amount', 0) or 0
+    stats = totals['days'].get(day) or totals['days'].setdefault(day, _new_day(day))
+    _add(stats['revenue'], str(payment_type), amount)
+
+    user = _user(totals, payment.get('user_id'), day)
+    if user is not None:
+        # Пополнение баланса — не трата
+        if payment_type != 'recharge':
+            user['spent'] += amount
+        if payment_type == 'subscription':
+            user['subscriptions'].append(payment.get('date'))
+
+
+def _fold(totals: Dict, orders: Iterable[Dict], payments: Iterable[Dict], student_class: Callable,
+          keep: Callable[[str], bool]) -> Dict:
+    """Добавляет в totals заказы и платежи с корректной датой, для которой keep(день)"""
+    for order in orders:
+        day = _day(order)
+        if day and keep(day):
+            _add_order(totals, order, student_class)
+    for payment in payments:
+        day = _day(payment)
+        if day and keep(day):
+            _add_payment(totals, payment)
+    return totals
+
+
+def _student_classes(backend) -> Callable:
+    classes = {user['id']: user.get('class') for user in backend.all('users') if user.get('role') == 'student'}
+    return classes.get
+
+
+# --- Закрытие дней ---
+
+def _summary(backend, month: str) -> Optional[Dict]:
+    found = backend.query('rollups', kind=KIND_MONTH, month=month)
+    return found[0] if found else None
+
+
+def _months(backend) -> List[str]:
+    """Месяцы, в которых есть заказы или платежи"""
+    months = set(backend.partition_versions('orders')) | set(backend.partition_versions('payments'))
+    return sorted(months - {UNDATED})
+
+
+def _close_month(backend, month: str, last: str, student_class: Callable, dirty) -> None:
+    totals = _fold({'days': {}, 'users': {}},
+                   backend.scan_partition('orders', month), backend.scan_partition('payments', month),
+                   student_class, lambda day: day <= last)
+    records = {(KIND_MONTH, month): {'kind': KIND_MONTH, 'month': month, 'closed_until': last}}
+    records.update(((KIND_DAY, day), stats) for day, stats in totals['days'].items())
+    records.update(((KIND_USER, user_id), user) for user_id, user in totals['users'].items())
+
+    with backend.transaction('rollups', 'aggregates') as tx:
+        existing = {}
+        for kind, field in ((KIND_MONTH, 'month'), (KIND_DAY, 'day'), (KIND_USER, 'user_id')):
+            existing.update(((kind, record[field]), record) for record in backend.query('rollups', kind=kind, month=month))
+        next_id = backend.next_id('rollups')
+        for key, record in records.items():
+            old = existing.pop(key, None)
+            if old is None:
+                record['id'] = next_id
+                next_id += 1
+                tx.append('rollups', record)
+            elif dict(record, id=old['id']) != old:
+                # Неизменившиеся итоги не переписываются: каждую ночь в журнал
+                # попадают новый день и пользователи, у которых были заказы
+                tx.put('rollups', dict(record, id=old['id']))
+        for old in existing.values():
+            tx.delete('rollups', old['id'])
+        if dirty:
+            # Снимаем только отметки, учтённые этим пересчётом: изменение,
+            # записанное во время пересчёта, оставит месяц отмеченным
+            marks = backend.get('aggregates', AGGREGATES_ID)
+            if marks is not None:
+                tx.patch('aggregates', AGGREGATES_ID,
+                         {ROLLUP_DIRTY + month: marks.get(ROLLUP_DIRTY + month, 0) - dirty})
+
+
+def close_days(backend=None, today: date = None, rebuild: bool = False) -> List[str]:
+    """Закрывает прошедшие дни: пересчитывает итоги месяцев, в которых есть
+    незакрытые или изменённые после закрытия дни (rebuild=True — всех
+    месяцев). Возвращает пересчитанные месяцы."""
+    backend = backend or backends.get_backend()
+    yesterday = ((today or date.today()) - timedelta(days=1)).isoformat()
+    # Закрытия из нескольких процессов выполняются по очереди: второе
+    # увидит, что всё уже закрыто. Блокировка — через хранилище (в SQLite
+    # файловая блокировка данные не защищает), сразу с коллекциями, которые
+    # пишет _close_month: вложенная транзакция их только повторно захватит
+    with backend.transaction('rollups', 'aggregates'):
+        marks = backend.get('aggregates', AGGREGATES_ID) or {}
+        student_class = None
+        closed = []
+        for month in _months(backend):
+            if month > yesterday[:7]:
+                break
+            last = min(_month_end(month), yesterday)
+            dirty = marks.get(ROLLUP_DIRTY + month, 0)
+            summary = _summary(backend, month)
+            if not rebuild and not dirty and summary is not None and summary['closed_until'] >= last:
+                continue
+            if student_class is None:
+                student_class = _student_classes(backend)
+            _close_month(backend, month, last, student_class, dirty)
+            closed.append(month)
+        return closed
+
+
+def nightly(backend=None) -> List[str]:
+    """Ночное обслуживание: закрытие дней, снимок остатков продуктов
+    (stock_ledger.py), черновики заявок на закупку по прогнозу расхода
+    (forecast.py) и сворачивание журналов хранилища"""
+    backend = backend or backends.get_backend()
+    started = time.perf_counter()
+    closed = close_days(backend)
+    stock_ledger.take_snapshot(backend)
+    forecast.run(backend)
+    backend.compact()
+    logger.info('Закрыты итоги за %d мес., обслуживание заняло %.1f с', len(closed), time.perf_counter() - started)
+    return closed
+
+
+def _next_run(hour: int, minute: int) -> datetime:
+    now = datetime.now()
+    run_at = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    return run_at if run_at > now else run_at + timedelta(days=1)
+
+
+def _claim_nightly():
+    """Право выполнять ночное обслуживание: блокировка файла, которую процесс
+    держит до завершения. Возвращает открытый файл блокировки или None, если
+    её держит другой процесс (другой воркер gunicorn)."""
+    if fcntl is None:
+        # Windows: блокировок между процессами нет, приложение — один процесс
+        return True
+    handle = open(storage.lock_path(os.path.join(config.DATA_DIR, 'nightly')), 'a')
+    try:
+        fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        handle.close()
+        return None
+    return handle
+
+
+def start_scheduler(at: str = None) -> Optional[threading.Thread]:
+    """Запускает поток, который каждую ночь в at ('ЧЧ:ММ', по умолчанию
+    config.ROLLUP_TIME) выполняет nightly().
+
+    При старте поток ничего не делает и не пишет: первый запуск — в
+    ближайшее at, дни, не закрытые за время простоя, закрываются тогда же
+    (до этого запросы берут их из заказов и платежей). Поток запускается в
+    каждом воркере, но обслуживание выполняет только один процесс — первый,
+    захвативший блокировку nightly.lock в каталоге данных; остальные
+    проверяют её каждую ночь и заменяют его, если он завершился."""
+    global _scheduler
+    at = config.ROLLUP_TIME if at is None else at
+    if not at:
+        return None
+    hour, minute = map(int, at.split(':'))
+
+    def loop():
+        claim = None
+        while True:
+            run_at = _next_run(hour, minute)
+            while datetime.now() < run_at:
+                time.sleep(max(0.0, (run_at - datetime.now()).total_seconds()))
+            claim = claim or _claim_nightly()
+            if claim is None:
+                continue
+            try:
+                nightly()
+            except Exception:
+                logger.exception('Ошибка ночного закрытия дней')
+
+    with _scheduler_lock:
+        if _scheduler is None or not _scheduler.is_alive():
+            _scheduler = threading.Thread(target=loop, name='rollups', daemon=True)
+            _scheduler.start()
+        return _scheduler
+
+
+# --- Запросы: закрытые дни из итогов, остальные из исходных данных ---
+
+def _closed_summary(backend, month: str, marks: Optional[Dict]) -> Optional[Dict]:
+    """Итоги месяца, если им можно верить: месяц не менялся после закрытия"""
+    if marks is None or marks.get(ROLLUP_DIRTY + month, 0):
+        # Без сводных показателей изменения после закрытия не отслеживаются
+        return None
+    return _summary(backend, month)
+
+
+def user_month(backend, user_id, month: str) -> Dict:
+    """Итоги пользователя за месяц 'YYYY-MM': orders, order_sum, spent,
+    last_meal ([дата, время] или None), subscriptions (даты оплат абонементов)"""
+    summary = _closed_summary(backend, month, backend.get('aggregates', AGGREGATES_ID))
+    closed = summary['closed_until'] if summary is not None else ''
+    result = _new_user(user_id, month)
+    if closed:
+        found = backend.query('rollups', user_id=user_id, month=month)
+        if found:
+            result.update(found[0], subscriptions=list(found[0]['subscriptions']))
+    # Незакрытые дни — по заказам и платежам пользователя за месяц (по индексу)
+    return _fold({'days': {}, 'users': {user_id: result}},
+                 backend.scan('orders', date_prefix=month, student_id=user_id),
+                 backend.scan('payments', date_prefix=month, user_id=user_id),
+                 lambda student_id: None, lambda day: day > closed)['users'][user_id]
+
+
+def period_totals(backend, start: str = None, end: str = None) -> Dict[str, Dict]:
+    """Итоги по дням за период (границы 'YYYY-MM-DD' включительно):
+    {день: {'breakfast', 'lunch', 'total', 'classes', 'dishes', 'revenue', ...}}.
+    Результат изменять нельзя: закрытые дни — общие объекты итогов."""
+    marks = backend.get('aggregates', AGGREGATES_ID)
+    student_class = None
+    days: Dict[str, Dict] = {}
+
+    def in_period(day):
+        return (not start or day >= start) and (not end or day <= end)
+
+    for month in _months(backend):
+        if (start and month < start[:7]) or (end and month > end[:7]):
+            continue
+        if student_class is None:
+            student_class = _student_classes(backend)
+        summary = _closed_summary(backend, month, marks)
+        if summary is None:
+            _fold({'days': days, 'users': {}},
+                  backend.scan('orders', date_prefix=month), backend.scan('payments', date_prefix=month),
+                  student_class, in_period)
+            continue
+        for stats in backend.query('rollups', kind=KIND_DAY, month=month):
+            if in_period(stats['day']):
+                days[stats['day']] = stats
+        # После закрытого — записи этих дней, границы по индексу времени
+        closed = summary['closed_until']
+        last = min(_month_end(month), end) if end else _month_end(month)
+        first = max(_next_day(closed), start) if start else _next_day(closed)
+        if first <= last:
+            period = period_range(first, last)
+            _fold({'days': days, 'users': {}},
+                  backend.between('orders', *period), backend.between('payments', *period),
+                  student_class, in_period)
+    return dict(sorted(days.items()))
+
+
+def orders_summary(backend, start: str = None, end: str = None) -> Dict:
+    """Заказы за период для отчётов: по дням ({день: {'breakfast', 'lunch',
+    'total'}}), по классам, по блюдам (menu_item_id) и всего"""
+    by_day, by_class, by_dish = {}, {}, {}
+    for day, stats in period_totals(backend, start, end).items():
+        if stats['total']:
+            by_day[day] = {'breakfast': stats['breakfast'], 'lunch': stats['lunch'], 'total': stats['total']}
+        for class_name, count in stats['classes'].items():
+            _add(by_class, class_name, count)
+        for item_id, count in stats['dishes'].items():
+            _add(by_dish, int(item_id), count)
+    return {'orders_by_day': by_day, 'orders_by_class': by_class, 'orders_by_dish': by_dish,
+            'orders_total': sum(stats['total'] for stats in by_day.values())}
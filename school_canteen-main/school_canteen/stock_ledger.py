@@ -0,0 +1,210 @@
+"""Движения продуктов и остатки на любой момент.
+
+Остаток продукта хранится в поле quantity записи инвентаря, и раньше оно
+просто перезаписывалось: ни «сколько было в понедельник», ни сверки
+списаний по нему не получить. Теперь каждое изменение остатка
+записывается в коллекцию stock_movements — журнал, в который только
+добавляются записи:
+    item_id, kind  — продукт и вид движения (RECEIPT, CONSUMPTION, ...);
+    delta          — изменение остатка (списание — отрицательное);
+    balance        — остаток после движения;
+    unit, price    — единица и цена за единицу на момент движения;
+    date, ts       — время движения.
+
+Движения пишутся как сводные показатели (aggregates.py): по изменениям
+инвентаря в транзакции вычисляется разница, и она записывается в той же
+транзакции. Вид движения передаёт код, который меняет инвентарь
+(tx.patch(..., reason=CONSUMPTION)); без него новый продукт — поступление,
+удалённый — списание, остальное — корректировка. Первая запись журнала
+фиксирует остатки всех продуктов движениями OPENING: история начинается
+с этого момента.
+
+Раз в сутки (rollups.nightly) или командой python stock_snapshot.py
+остатки сохраняются снимком (коллекция stock_snapshots): остатки всех
+продуктов после движения movement_id. Остаток на любой момент — последний
+снимок до него плюс движения после снимка (stock_at), то есть не больше
+суток журнала; последний снимок и движения находятся по упорядоченному
+индексу ts. Поле quantity инвентаря меняется в той же транзакции, что и
+движение, поэтому совпадает с остатком по журналу; сверка —
+python stock_snapshot.py --check.
+
+Затраты на продукты по дням (daily_costs) — движения, умноженные на цену
+продукта на момент движения.
+"""
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from aggregates import record_states
+from timestamps import DAY, day_start, period_range, stamp, timestamp
+
+# Виды движений
+OPENING = 'opening'
+RECEIPT = 'receipt'
+CONSUMPTION = 'consumption'
+ADJUSTMENT = 'adjustment'
+WRITE_OFF = 'write_off'
+KINDS = {
+    OPENING: 'Начальный остаток',
+    RECEIPT: 'Поступление',
+    CONSUMPTION: 'Расход на блюда',
+    ADJUSTMENT: 'Корректировка',
+    WRITE_OFF: 'Списание',
+}
+
+# Коллекции, от которых зависит журнал
+TRACKED = ('inventory',)
+
+# Точность остатков — как в recipes.py
+_DIGITS = 3
+
+
+def _quantity(record: Optional[Dict]) -> float:
+    if record is None:
+        return 0
+    quantity = record.get('quantity')
+    return quantity if isinstance(quantity, (int, float)) and not isinstance(quantity, bool) else 0
+
+
+def _movement(record_id: int, item: Dict, kind: str, delta: float, balance: float, moment: str) -> Dict:
+    return stamp({
+        'id': record_id,
+        'item_id': item['id'],
+        'kind': kind,
+        'delta': delta,
+        'balance': balance,
+        'unit': item.get('unit'),
+        'price': item.get('price'),
+        'date': moment,
+    })
+
+
+def changes(backend, ops: List[Dict]) -> List[Dict]:
+    """Движения для изменений инвентаря в транзакции.
+    Вызывается под блокировкой транзакции, до записи ops."""
+    states = record_states(backend, ops, TRACKED)
+    if not states:
+        return []
+    # Вид движения — причина последней операции над продуктом
+    reasons = {}
+    for op in ops:
+        if op['collection'] in TRACKED and op.get('reason'):
+            reasons[op['record'].get('id') if op['op'] in ('add', 'put') else op['id']] = op['reason']
+
+    changed = []
+    for (_, item_id), (before, after) in states.items():
+        delta = round(_quantity(after) - _quantity(before), _DIGITS)
+        if delta:
+            kind = reasons.get(item_id) or (RECEIPT if before is None else WRITE_OFF if after is None else ADJUSTMENT)
+            changed.append((after if after is not None else before, kind, delta, round(_quantity(after), _DIGITS)))
+    if not changed:
+        return []
+
+    moment = datetime.now().isoformat(timespec='seconds')
+    next_id = backend.next_id('stock_movements')
+    if next_id == 1:
+        # Журнал пуст — сначала начальные остатки (до этой транзакции)
+        changed[:0] = [(item, OPENING, _quantity(item), _quantity(item))
+                       for item in backend.all('inventory') if _quantity(item)]
+    return [{'op': 'add', 'collection': 'stock_movements',
+             'record': _movement(next_id + offset, item, kind, delta, balance, moment)}
+            for offset, (item, kind, delta, balance) in enumerate(changed)]
+
+
+# --- Остатки по журналу ---
+
+def moment_ts(moment: str) -> Optional[int]:
+    """Метка времени момента: 'YYYY-MM-DD' — конец дня, дата-время ISO —
+    эта секунда. None, если строка не дата."""
+    if len(moment) == 10:
+        try:
+            return day_start(moment) + DAY - 1
+        except ValueError:
+            return None
+    return timestamp({'date': moment})
+
+
+def latest_snapshot(backend, ts: int = None) -> Optional[Dict]:
+    """Последний снимок остатков не позже ts (None — самый последний)"""
+    return next(backend.between('stock_snapshots', end=ts + 1 if ts is not None else None, reverse=True), None)
+
+
+def _tail(backend, snapshot: Optional[Dict], ts: int = None):
+    """Движения после снимка (до ts включительно) по порядку"""
+    start = snapshot['ts'] if snapshot is not None else None
+    last = snapshot['movement_id'] if snapshot is not None else 0
+    for movement in backend.between('stock_movements', start, ts + 1 if ts is not None else None):
+        if movement['id'] > last:
+            yield movement
+
+
+def _apply(stock: Dict[int, float], movements) -> Optional[Dict]:
+    """Прибавляет движения к остаткам; возвращает последнее движение"""
+    movement = None
+    for movement in movements:
+        item_id = movement['item_id']
+        stock[item_id] = round(stock.get(item_id, 0) + movement['delta'], _DIGITS)
+    return movement
+
+
+def stock_at(backend, ts: int = None) -> Dict[int, float]:
+    """Остатки продуктов {id продукта: количество} на момент ts (None —
+    текущие): последний снимок до ts плюс движения после него"""
+    snapshot = latest_snapshot(backend, ts)
+    stock = {int(item_id): quantity for item_id, quantity in snapshot['stock'].items()} if snapshot else {}
+    _apply(stock, _tail(backend, snapshot, ts))
+    return stock
+
+
+def take_snapshot(backend) -> Optional[Dict]:
+    """Сохраняет снимок текущих остатков. None, если после последнего
+    снимка движений не было."""
+    with backend.transaction('stock_snapshots') as tx:
+        snapshot = latest_snapshot(backend)
+        stock = {int(item_id): quantity for item_id, quantity in snapshot['stock'].items()} if snapshot else {}
+        last = _apply(stock, _tail(backend, snapshot))
+        if last is None:
+            return None
+        record = {
+            'movement_id': last['id'],
+            'date': last['date'],
+            'stock': {str(item_id): quantity for item_id, quantity in stock.items()},
+        }
+        tx.append('stock_snapshots', record)
+    return record
+
+
+def movements(backend, start: str = None, end: str = None, item_id: int = None) -> List[Dict]:
+    """Движения за период с границами 'YYYY-MM-DD' включительно по порядку"""
+    fields = {'item_id': item_id} if item_id is not None else {}
+    return list(backend.between('stock_movements', *period_range(start, end), **fields))
+
+
+def daily_costs(backend, start: str = None, end: str = None) -> Dict[str, Dict[str, float]]:
+    """Стоимость движений по дням: {день: {вид движения: сумма}}.
+    Расход и списание — стоимость ушедших продуктов, поступление и
+    корректировка — стоимость изменения остатка (со знаком).
+    Движения продуктов без цены не учитываются."""
+    costs: Dict[str, Dict[str, float]] = {}
+    for movement in backend.between('stock_movements', *period_range(start, end)):
+        price = movement.get('price')
+        if not price or movement['kind'] == OPENING:
+            continue
+        cost = movement['delta'] * price
+        if movement['kind'] in (CONSUMPTION, WRITE_OFF):
+            cost = -cost
+        day = costs.setdefault(movement['date'][:10], {})
+        day[movement['kind']] = round(day.get(movement['kind'], 0) + cost, 2)
+    return costs
+
+
+def reconcile(backend) -> List[Dict]:
+    """Продукты, у которых остаток в инвентаре расходится с журналом:
+    [{'item_id', 'name', 'quantity', 'ledger'}]"""
+    stock = stock_at(backend)
+    result = []
+    for item in backend.all('inventory'):
+        ledger = stock.get(item['id'], 0)
+        if round(_quantity(item) - ledger, _DIGITS):
+            result.append({'item_id': item['id'], 'name': item.get('name'), 'quantity': _quantity(item),
+                           'ledger': ledger})
+    return result
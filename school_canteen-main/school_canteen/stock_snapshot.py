@@ -0,0 +1,59 @@
+"""Снимок остатков продуктов по журналу движений (stock_ledger.py).
+
+Снимок сохраняется каждую ночь в процессе приложения (config.ROLLUP_TIME);
+команда нужна, если приложение ночью не работает. Она же показывает
+остатки на прошедший момент и сверяет остатки инвентаря с журналом.
+Код возврата 1, если при сверке найдены расхождения.
+
+Запуск из каталога school_canteen:
+    python stock_snapshot.py                     # сохранить снимок
+    python stock_snapshot.py --at 2026-10-12     # остатки на конец дня
+    python stock_snapshot.py --check             # сверка с инвентарём
+"""
+import argparse
+import sys
+
+import backends
+import stock_ledger
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--at', metavar='ДАТА', help="остатки на момент: 'YYYY-MM-DD' или 'YYYY-MM-DDTHH:MM'")
+    parser.add_argument('--check', action='store_true', help='сверить остатки инвентаря с журналом')
+    args = parser.parse_args()
+
+    backend = backends.get_backend()
+    if backend.next_id('stock_movements') == 1:
+        print('Журнал движений пуст: он начнётся с первого изменения инвентаря')
+        return 0
+
+    if args.at:
+        ts = stock_ledger.moment_ts(args.at)
+        if ts is None:
+            parser.error(f'некорректная дата: {args.at}')
+        products = {item['id']: item for item in backend.all('inventory')}
+        for item_id, quantity in sorted(stock_ledger.stock_at(backend, ts).items()):
+            product = products.get(item_id, {})
+            print(f"{product.get('name', f'продукт {item_id} (удалён)')}: {quantity:g} {product.get('unit', '')}")
+        return 0
+
+    if args.check:
+        mismatches = stock_ledger.reconcile(backend)
+        for line in mismatches:
+            print(f"{line['name']} (id {line['item_id']}): в инвентаре {line['quantity']:g}, "
+                  f"по журналу {line['ledger']:g}")
+        print('Остатки совпадают с журналом' if not mismatches else f'Расхождений: {len(mismatches)}')
+        return 1 if mismatches else 0
+
+    snapshot = stock_ledger.take_snapshot(backend)
+    if snapshot is None:
+        print('После последнего снимка движений не было')
+    else:
+        print(f"Снимок на {snapshot['date']}: продуктов {len(snapshot['stock'])}, "
+              f"движений до {snapshot['movement_id']}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
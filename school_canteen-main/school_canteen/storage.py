@@ -0,0 +1,1149 @@
+import json
+import os
+import pickle
+from bisect import bisect_left, insort
+import tempfile
+import threading
+import time
+from collections.abc import Mapping
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+import config
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: блокировки работают только между потоками одного процесса
+    fcntl = None
+
+
+# Кэш разобранных JSON-документов (общий для всего процесса).
+# Ключ — абсолютный путь к файлу. Документ перечитывается с диска только
+# если у файла изменилась сигнатура (mtime_ns, размер, inode).
+class _CacheEntry:
+    __slots__ = ('signature', 'data', 'blob', 'journal_offset', 'journal_lines', 'positions', 'indexes')
+
+    def __init__(self, signature, data=None, blob=None, journal_offset=0, journal_lines=0, positions=None,
+                 indexes=None):
+        self.signature = signature
+        self.data = data    # разобранный документ (общий, только для чтения)
+        self.blob = blob    # pickle-снимок документа для быстрой выдачи копий
+        self.journal_offset = journal_offset  # до какого байта журнал уже применён
+        self.journal_lines = journal_lines    # сколько записей журнала уже применено
+        self.positions = positions or {}      # {коллекция: {id: индекс}}, строится по требованию
+        # Вторичные индексы: {(коллекция, поля): {значения полей: [id, ...]}},
+        # упорядоченные по времени — {(коллекция, поля, 'ts'): {значения полей:
+        # [(ts, id), ...] по возрастанию}}. Строятся при первом поиске и
+        # переносятся в следующую версию документа
+        self.indexes = indexes or {}
+
+    def get_data(self):
+        if self.data is None:
+            self.data = pickle.loads(self.blob)
+        return self.data
+
+    def get_copy(self):
+        if self.blob is None:
+            self.blob = pickle.dumps(self.data, protocol=pickle.HIGHEST_PROTOCOL)
+        return pickle.loads(self.blob)
+
+    def position(self, key, record_id):
+        """Индекс записи с данным id в коллекции key (или None)"""
+        index = self.positions.get(key)
+        if index is None:
+            index = _build_positions(self.get_data().get(key))
+            self.positions[key] = index
+        return index.get(record_id)
+
+    def record(self, key, record_id):
+        """Запись коллекции key с данным id (общая, только для чтения) или None"""
+        pos = self.position(key, record_id)
+        return self.get_data()[key][pos] if pos is not None else None
+
+    def lookup(self, key, fields, values):
+        """Записи коллекции key, у которых поля fields равны values"""
+        name = (key, fields)
+        index = self.indexes.get(name)
+        if index is None:
+            index = _build_index(self.get_data().get(key), fields)
+            self.indexes[name] = index
+        ids = index.get(values)
+        if not ids:
+            return []
+        # Возвращаем записи в порядке документа, как при полном просмотре
+        found = sorted(pos for pos in (self.position(key, record_id) for record_id in ids) if pos is not None)
+        records = self.get_data()[key]
+        return [records[pos] for pos in found]
+
+    def between(self, key, fields, values, start, end, reverse=False):
+        """Записи коллекции key с полями fields, равными values, и меткой
+        времени ts в [start, end) (None — без границы), в порядке ts.
+        Границы ищутся двоичным поиском по упорядоченному индексу."""
+        name = (key, fields, 'ts')
+        timeline = self.indexes.get(name)
+        if timeline is None:
+            timeline = _build_timeline(self.get_data().get(key), fields)
+            self.indexes[name] = timeline
+        entries = timeline.get(values)
+        if not entries:
+            return
+        # (ts,) меньше любой пары (ts, id) с тем же ts
+        first = bisect_left(entries, (start,)) if start is not None else 0
+        last = bisect_left(entries, (end,)) if end is not None else len(entries)
+        positions = range(last - 1, first - 1, -1) if reverse else range(first, last)
+        for pos in positions:
+            record = self.record(key, entries[pos][1])
+            if record is not None:
+                yield record
+
+
+_cache: Dict[str, _CacheEntry] = {}
+_cache_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'parses': {}, 'replays': 0, 'writes': 0, 'flushes': 0}
+
+
+class CorruptDocumentError(ValueError):
+    """Файл данных существует, но не является корректным JSON.
+    Раньше такой файл читался как пустой документ, и следующая запись
+    стирала коллекцию — теперь операция прерывается."""
+
+
+def _cache_key(file_path: str) -> str:
+    return os.path.abspath(file_path)
+
+
+def _file_signature(file_path: str) -> Optional[tuple]:
+    """Сигнатура файла для проверки актуальности кэша"""
+    try:
+        st = os.stat(file_path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size, st.st_ino
+
+
+def clone(data: Any) -> Any:
+    """Глубокая копия JSON-структуры (словари, списки и скаляры).
+    Записи с декодером (models.Record) копируются в обычные словари."""
+    if isinstance(data, dict):
+        return {key: clone(value) for key, value in data.items()}
+    if isinstance(data, list):
+        return [clone(value) for value in data]
+    if isinstance(data, Mapping):
+        return {key: clone(value) for key, value in data.items()}
+    return data
+
+
+def json_default(value: Any) -> Any:
+    """Параметр default для json.dump: записи models.Record пишутся как словари"""
+    if isinstance(value, Mapping):
+        return dict(value.items())
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+# --- Декодеры записей ---
+
+# Путь к документу или каталогу документов -> {ключ коллекции: декодер}.
+# Декодер превращает словарь записи, прочитанный с диска, в объект записи
+# (models.Record.load); в кэше хранятся уже декодированные записи.
+_decoders: Dict[str, Dict[str, Callable]] = {}
+
+
+def register_decoder(path: str, key: str, decoder: Callable) -> None:
+    """Назначает декодер записям коллекции key документа path (или всех
+    документов каталога path). Действует на документы, разобранные после
+    регистрации."""
+    _decoders.setdefault(_cache_key(path), {})[key] = decoder
+
+
+def _decoders_for(file_path: str) -> Optional[Dict[str, Callable]]:
+    if not _decoders:
+        return None
+    key = _cache_key(file_path)
+    return _decoders.get(key) or _decoders.get(os.path.dirname(key))
+
+
+def _decode_document(data: Dict, decoders: Optional[Dict[str, Callable]]) -> Dict:
+    """Декодирует записи коллекций документа на месте"""
+    if decoders and isinstance(data, dict):
+        for key, decode in decoders.items():
+            records = data.get(key)
+            if isinstance(records, list):
+                data[key] = [decode(r) if type(r) is dict else r for r in records]
+    return data
+
+
+# --- Блокировки и транзакции ---
+
+# Блокировки, которые держит текущий поток: {путь: [дескриптор, глубина]}.
+# Повторный захват того же файла в одном потоке не блокируется.
+_local = threading.local()
+_thread_locks: Dict[str, threading.Lock] = {}
+
+
+def _held_locks() -> Dict:
+    held = getattr(_local, 'locks', None)
+    if held is None:
+        held = _local.locks = {}
+    return held
+
+
+def lock_path(file_path: str) -> str:
+    """Файл блокировки документа: data/users.json -> data/users.json.lock"""
+    return _cache_key(file_path) + '.lock'
+
+
+def _acquire(file_path: str) -> bool:
+    """Захватывает эксклюзивную блокировку файла.
+    Возвращает True, если блокировка взята впервые (а не повторно)."""
+    key = _cache_key(file_path)
+    held = _held_locks()
+    if key in held:
+        held[key][1] += 1
+        return False
+
+    if fcntl is not None:
+        # flock действует и между процессами (воркеры gunicorn), и между потоками,
+        # так как каждый захват открывает свой дескриптор
+        os.makedirs(os.path.dirname(key), exist_ok=True)
+        handle = open(lock_path(key), 'a')
+        fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+    else:
+        with _cache_lock:
+            handle = _thread_locks.setdefault(key, threading.Lock())
+        handle.acquire()
+    held[key] = [handle, 1]
+    return True
+
+
+def _release(file_path: str) -> None:
+    key = _cache_key(file_path)
+    held = _held_locks()
+    held[key][1] -= 1
+    if held[key][1] > 0:
+        return
+    handle, _ = held.pop(key)
+    if fcntl is not None:
+        fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+        handle.close()
+    else:
+        handle.release()
+
+    if not held:
+        # Все блокировки отпущены — можно ждать записи пакетов на диск,
+        # не мешая другим потокам добавлять в них свои изменения
+        _await_group_commit()
+
+
+@contextmanager
+def _locked(file_path: str):
+    _acquire(file_path)
+    try:
+        yield
+    finally:
+        _release(file_path)
+
+
+class Transaction:
+    """Операция чтение-изменение-запись над набором заблокированных файлов.
+    Пока транзакция открыта, другие потоки и процессы не могут изменить эти
+    файлы, поэтому прочитанные данные остаются актуальными до записи.
+
+    Изменения можно не записывать сразу, а накопить через append/patch:
+    при успешном выходе из блока они записываются по одной записи на файл,
+    при исключении — отбрасываются. Накопленные изменения не видны через
+    read/load до конца транзакции."""
+
+    def __init__(self, file_paths):
+        self.file_paths = [_cache_key(p) for p in file_paths]
+        self._ops: Dict[str, List[Dict]] = {}   # путь -> записи, ожидающие фиксации
+
+    def _check(self, file_path: str) -> None:
+        if _cache_key(file_path) not in self.file_paths:
+            raise ValueError(f'Файл {file_path} не заблокирован этой транзакцией')
+
+    def read(self, file_path: str) -> Dict:
+        """Актуальный документ только для чтения"""
+        self._check(file_path)
+        return load_json_shared(file_path)
+
+    def load(self, file_path: str) -> Dict:
+        """Актуальный документ в виде копии, которую можно изменять"""
+        self._check(file_path)
+        return load_json(file_path)
+
+    def _staged(self, file_path: str) -> List[Dict]:
+        self._check(file_path)
+        return self._ops.setdefault(_cache_key(file_path), [])
+
+    def next_id(self, file_path: str, key: str) -> int:
+        """Следующий id коллекции с учётом уже накопленных в транзакции записей:
+        максимальный id + 1, поэтому id удалённых записей не повторяются"""
+        ids = [r.get('id') for r in self.read(file_path).get(key, [])]
+        ids += [op['record'].get('id') for op in self._ops.get(_cache_key(file_path), ())
+                if op['op'] == 'add' and op['key'] == key]
+        return max((record_id for record_id in ids if isinstance(record_id, int)), default=0) + 1
+
+    def append(self, file_path: str, key: str, record: Dict) -> None:
+        """Добавляет запись в коллекцию при фиксации транзакции"""
+        self._staged(file_path).append({'op': 'add', 'key': key, 'record': clone(record)})
+
+    def patch(self, file_path: str, key: str, record_id, fields: Dict) -> bool:
+        """Изменяет поля записи при фиксации транзакции.
+        Возвращает False, если записи с таким id нет."""
+        ops = self._staged(file_path)
+        entry = _get_entry(file_path)
+        if ((entry is None or entry.position(key, record_id) is None)
+                and not any(op['op'] == 'add' and op['key'] == key and op['record'].get('id') == record_id
+                            for op in ops)):
+            return False
+        ops.append({'op': 'set', 'key': key, 'id': record_id, 'fields': clone(fields)})
+        return True
+
+    def put(self, file_path: str, key: str, record: Dict) -> None:
+        """Добавляет запись или заменяет запись с тем же id при фиксации"""
+        # 'add' с уже существующим id заменяет запись целиком
+        self._staged(file_path).append({'op': 'add', 'key': key, 'record': clone(record)})
+
+    def delete(self, file_path: str, key: str, record_id) -> bool:
+        """Удаляет запись по id при фиксации транзакции.
+        Возвращает False, если записи с таким id нет."""
+        ops = self._staged(file_path)
+        entry = _get_entry(file_path)
+        if entry is None or entry.position(key, record_id) is None:
+            return False
+        ops.append({'op': 'del', 'key': key, 'id': record_id})
+        return True
+
+    def commit(self) -> None:
+        """Записывает накопленные изменения: одна запись на каждый файл"""
+        ops_by_file, self._ops = self._ops, {}
+        for file_path, ops in ops_by_file.items():
+            if not ops:
+                continue
+            if is_journaled(file_path):
+                _append_journal(file_path, ops)
+            else:
+                _rewrite_with(file_path, ops)
+
+
+@contextmanager
+def transaction(*file_paths: str):
+    """Блокирует файлы на время операции чтение-изменение-запись.
+
+        with transaction(USERS_FILE, PAYMENTS_FILE) as tx:
+            users_data = tx.load(USERS_FILE)
+            ...
+            save_json(USERS_FILE, users_data)
+
+    Вместо save_json изменения можно накопить через tx.append/tx.patch —
+    тогда они будут записаны вместе при выходе из блока.
+
+    Файлы блокируются в отсортированном порядке, поэтому две транзакции
+    с пересекающимися наборами файлов не могут заблокировать друг друга.
+    Все нужные файлы следует перечислить сразу: вложенная транзакция может
+    повторно захватить уже заблокированные файлы, но новые файлы берёт
+    вне общего порядка."""
+    keys = sorted({_cache_key(p) for p in file_paths})
+    acquired = []
+    try:
+        for key in keys:
+            # Кэш под блокировкой не сбрасывается: каждая запись меняет
+            # сигнатуру файла (_atomic_write), поэтому устаревший документ
+            # будет перечитан при первом чтении
+            _acquire(key)
+            acquired.append(key)
+        tx = Transaction(keys)
+        yield tx
+        tx.commit()
+    finally:
+        for key in reversed(acquired):
+            _release(key)
+
+
+# --- Журнал (append-only JSONL) ---
+
+def is_journaled(file_path: str) -> bool:
+    """Ведётся ли для файла журнал изменений"""
+    if not config.JOURNAL_ENABLED:
+        return False
+    key = _cache_key(file_path)
+    return (key in {_cache_key(p) for p in config.JOURNAL_FILES}
+            or os.path.dirname(key) in {_cache_key(d) for d in config.JOURNAL_DIRS})
+
+
+def journal_path(file_path: str) -> str:
+    """Путь к журналу документа: data/orders.json -> data/orders.jsonl"""
+    return os.path.splitext(file_path)[0] + '.jsonl'
+
+
+def _document_signature(file_path: str) -> Optional[tuple]:
+    """Сигнатура документа: снимок плюс журнал (если он есть)"""
+    snapshot = _file_signature(file_path)
+    journal = _file_signature(journal_path(file_path))
+    if snapshot is None and journal is None:
+        return None
+    return snapshot, journal
+
+
+def document_version(file_path: str) -> Optional[tuple]:
+    """Версия документа на диске: меняется при каждой записи снимка или
+    журнала. None — документа нет."""
+    return _document_signature(file_path)
+
+
+def _read_journal(file_path: str, offset: int = 0):
+    """Читает записи журнала начиная с байтового смещения.
+    Возвращает записи и смещение конца последней полной строки: строка,
+    которую другой процесс ещё дописывает, будет прочитана в следующий раз."""
+    try:
+        with open(journal_path(file_path), 'rb') as f:
+            f.seek(offset)
+            chunk = f.read()
+    except FileNotFoundError:
+        return [], offset
+
+    end = chunk.rfind(b'\n') + 1
+    ops = []
+    for line in chunk[:end].splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            ops.append(json.loads(line))
+        except json.JSONDecodeError:
+            # Оборванная строка (сбой во время записи) — пропускаем
+            continue
+    return ops, offset + end
+
+
+def _build_positions(records) -> Dict:
+    if not isinstance(records, list):
+        return {}
+    return {r.get('id'): i for i, r in enumerate(records) if isinstance(r, Mapping)}
+
+
+def _index_values(record: Dict, fields: tuple) -> tuple:
+    return tuple(record.get(field) for field in fields)
+
+
+def _build_index(records, fields: tuple) -> Dict:
+    index = {}
+    if isinstance(records, list):
+        for record in records:
+            if isinstance(record, Mapping):
+                index.setdefault(_index_values(record, fields), []).append(record.get('id'))
+    return index
+
+
+def _time_entry(record: Dict):
+    ts = record.get('ts')
+    return (ts, record.get('id')) if isinstance(ts, int) else None
+
+
+def _build_timeline(records, fields: tuple) -> Dict:
+    """Упорядоченный индекс: {значения полей: [(ts, id), ...] по возрастанию}.
+    Записи без метки времени в него не входят."""
+    timeline = {}
+    if isinstance(records, list):
+        for record in records:
+            if isinstance(record, Mapping):
+                entry = _time_entry(record)
+                if entry is not None:
+                    timeline.setdefault(_index_values(record, fields), []).append(entry)
+    for entries in timeline.values():
+        entries.sort()
+    return timeline
+
+
+def _retime(timeline: Dict, fields: tuple, before: Optional[Dict], after: Optional[Dict]) -> None:
+    """Обновляет упорядоченный индекс после изменения записи.
+    Списки заменяются копиями: старую версию индекса могут читать другие потоки."""
+    if before is not None:
+        values, entry = _index_values(before, fields), _time_entry(before)
+        entries = timeline.get(values)
+        if entry is not None and entries:
+            pos = bisect_left(entries, entry)
+            if pos < len(entries) and entries[pos] == entry:
+                entries = entries[:pos] + entries[pos + 1:]
+                if entries:
+                    timeline[values] = entries
+                else:
+                    timeline.pop(values)
+    if after is not None:
+        entry = _time_entry(after)
+        if entry is not None:
+            values = _index_values(after, fields)
+            entries = list(timeline.get(values, ()))
+            insort(entries, entry)
+            timeline[values] = entries
+
+
+def _replay(data: Dict, ops: List[Dict], positions: Optional[Dict], copy_on_write: bool,
+            indexes: Optional[Dict] = None, decoders: Optional[Dict[str, Callable]] = None):
+    """Применяет записи журнала к документу.
+    При copy_on_write исходные списки и записи не изменяются (на них могут
+    ссылаться другие потоки) — затронутые части копируются.
+    Повторное применение записи безопасно: 'add' с уже существующим id
+    заменяет запись, 'set' и 'del' идемпотентны.
+    Построенные вторичные индексы (и упорядоченные по времени) обновляются
+    по каждой записи, а не перестраиваются заново. Новые версии записей
+    проходят через decoders (register_decoder). Возвращает (документ,
+    позиции, индексы)."""
+    positions = dict(positions or {})
+    indexes = dict(indexes or {})
+    copied_indexes = set()
+
+    def reindex(key, before, after):
+        for name in indexes:
+            if name[0] != key:
+                continue
+            fields = name[1]
+            if len(name) == 3:
+                old = (_index_values(before, fields), _time_entry(before)) if before is not None else None
+                new = (_index_values(after, fields), _time_entry(after)) if after is not None else None
+            else:
+                old = _index_values(before, fields) if before is not None else None
+                new = _index_values(after, fields) if after is not None else None
+            if old == new:
+                continue
+            if name not in copied_indexes:
+                indexes[name] = dict(indexes[name])
+                copied_indexes.add(name)
+            if len(name) == 3:
+                _retime(indexes[name], fields, before, after)
+                continue
+            index = indexes[name]
+            # Списки id заменяются целиком: старую версию индекса могут читать другие потоки
+            if old is not None:
+                bucket = [record_id for record_id in index.get(old, ()) if record_id != before.get('id')]
+                if bucket:
+                    index[old] = bucket
+                else:
+                    index.pop(old, None)
+            if new is not None:
+                index[new] = index.get(new, []) + [after.get('id')]
+    if copy_on_write:
+        data = dict(data)
+    copied = set()
+
+    def collection(key):
+        if key not in copied:
+            records = data.get(key)
+            data[key] = list(records) if isinstance(records, list) else []
+            if key in positions:
+                positions[key] = dict(positions[key])
+            copied.add(key)
+        if key not in positions:
+            positions[key] = _build_positions(data[key])
+        return data[key]
+
+    decoders = decoders or {}
+    for op in ops:
+        key = op.get('key')
+        records = collection(key)
+        index = positions[key]
+        decode = decoders.get(key)
+        kind = op.get('op')
+        if kind == 'add':
+            record = op.get('record', {})
+            if decode is not None and type(record) is dict:
+                record = decode(record)
+            pos = index.get(record.get('id'))
+            if pos is None:
+                index[record.get('id')] = len(records)
+                records.append(record)
+                reindex(key, None, record)
+            else:
+                reindex(key, records[pos], record)
+                records[pos] = record
+        elif kind == 'set':
+            pos = index.get(op.get('id'))
+            if pos is not None:
+                before = records[pos]
+                record = dict(before.items())
+                record.update(op.get('fields', {}))
+                if decode is not None:
+                    record = decode(record)
+                records[pos] = record
+                reindex(key, before, record)
+        elif kind == 'put':
+            pos = index.get(op.get('id'))
+            if pos is not None:
+                record = op.get('record', {})
+                if decode is not None and type(record) is dict:
+                    record = decode(record)
+                reindex(key, records[pos], record)
+                records[pos] = record
+        elif kind == 'del':
+            pos = index.pop(op.get('id'), None)
+            if pos is not None:
+                reindex(key, records[pos], None)
+                del records[pos]
+                positions.pop(key)
+    return data, positions, indexes
+
+
+def _get_entry(file_path: str) -> Optional[_CacheEntry]:
+    """Возвращает актуальную запись кэша, при необходимости перечитывая файл"""
+    key = _cache_key(file_path)
+    with _cache_lock:
+        # Документ с ещё не записанными на диск изменениями (групповая запись)
+        pending = _pending.get(key)
+        if pending is not None:
+            _stats['hits'] += 1
+            return pending
+
+    signature = _document_signature(file_path)
+    if signature is None:
+        with _cache_lock:
+            _cache.pop(key, None)
+        return None
+
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is not None and entry.signature == signature:
+            _stats['hits'] += 1
+            return entry
+
+    snapshot_sig, journal_sig = signature
+
+    # Снимок не менялся, а журнал только дописан — применяем лишь новые записи
+    if (entry is not None and journal_sig is not None and entry.signature[0] == snapshot_sig
+            and (entry.signature[1] is None or entry.signature[1][2] == journal_sig[2])
+            and entry.journal_offset <= journal_sig[1]):
+        ops, offset = _read_journal(file_path, offset=entry.journal_offset)
+        data, positions, indexes = _replay(entry.get_data(), ops, entry.positions, copy_on_write=True,
+                                           indexes=entry.indexes, decoders=_decoders_for(file_path))
+        new_entry = _CacheEntry(signature, data=data, journal_offset=offset,
+                                journal_lines=entry.journal_lines + len(ops), positions=positions,
+                                indexes=indexes)
+        with _cache_lock:
+            _stats['replays'] += 1
+            _cache[key] = new_entry
+        return new_entry
+
+    data = {}
+    if snapshot_sig is not None:
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        except json.JSONDecodeError as e:
+            raise CorruptDocumentError(f'Повреждён файл данных {file_path}: {e}') from e
+
+    decoders = _decoders_for(file_path)
+    _decode_document(data, decoders)
+    ops, offset = _read_journal(file_path) if journal_sig is not None else ([], 0)
+    positions = None
+    if ops:
+        data, positions, _ = _replay(data, ops, None, copy_on_write=False, decoders=decoders)
+
+    entry = _CacheEntry(signature, data=data, journal_offset=offset, journal_lines=len(ops),
+                        positions=positions)
+    with _cache_lock:
+        _stats['misses'] += 1
+        _stats['parses'][key] = _stats['parses'].get(key, 0) + 1
+        _cache[key] = entry
+    return entry
+
+
+def load_json(file_path: str) -> Dict:
+    """Загружает данные из JSON файла.
+    Возвращает независимую копию документа: изменять её можно без риска
+    испортить общий кэш."""
+    entry = _get_entry(file_path)
+    if entry is None:
+        return {}
+    return entry.get_copy()
+
+
+def load_json_shared(file_path: str) -> Dict:
+    """Загружает документ без копирования.
+    Возвращаемый объект общий для всего процесса — его нельзя изменять.
+    Используется внутри data_manager для быстрых операций чтения."""
+    entry = _get_entry(file_path)
+    if entry is None:
+        return {}
+    return entry.get_data()
+
+
+def find_record(file_path: str, key: str, record_id) -> Optional[Dict]:
+    """Запись коллекции по id без просмотра всего списка.
+    Возвращаемый объект общий — его нельзя изменять."""
+    entry = _get_entry(file_path)
+    if entry is None:
+        return None
+    return entry.record(key, record_id)
+
+
+def find_records(file_path: str, key: str, **fields) -> List[Dict]:
+    """Записи коллекции с заданными значениями полей, через хэш-индекс.
+    Индекс по набору полей строится при первом поиске и дальше
+    поддерживается при записи. Возвращаемые объекты общие — их нельзя изменять."""
+    entry = _get_entry(file_path)
+    if entry is None:
+        return []
+    names = tuple(sorted(fields))
+    return entry.lookup(key, names, tuple(fields[name] for name in names))
+
+
+def find_between(file_path: str, key: str, start: Optional[int] = None, end: Optional[int] = None,
+                 reverse: bool = False, **fields):
+    """Записи коллекции с заданными значениями полей и меткой времени ts
+    в [start, end), по возрастанию ts (reverse — по убыванию); проход без
+    сборки списка. Упорядоченный индекс по набору полей строится при первом
+    поиске и дальше поддерживается при записи. Записи без ts не возвращаются.
+    Возвращаемые объекты общие — их нельзя изменять."""
+    entry = _get_entry(file_path)
+    if entry is None:
+        return iter(())
+    names = tuple(sorted(fields))
+    return entry.between(key, names, tuple(fields[name] for name in names), start, end, reverse)
+
+
+# --- Запись на диск ---
+
+def _fsync_dir(directory: str) -> None:
+    """Сбрасывает на диск запись каталога (переименование файла)"""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        # Windows не позволяет открыть каталог — os.replace там и так атомарен
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _atomic_write(file_path: str, data: Dict) -> None:
+    """Пишет документ во временный файл рядом с целевым и заменяет его
+    через os.replace. Читатель видит либо старую, либо новую версию файла,
+    но никогда не обрезанную."""
+    directory = os.path.dirname(file_path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(file_path) + '.',
+                                    suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2, default=json_default)
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            current = os.stat(file_path)
+        except OSError:
+            current = None
+        if current is not None:
+            # mkstemp создает файл с правами 0600 — сохраняем права исходного файла
+            os.chmod(tmp_path, current.st_mode & 0o777)
+            # Новая версия получает mtime больше прежней, даже если запись
+            # пришлась на тот же тик часов: тогда сигнатура кэша не совпадёт
+            # со старой версией, даже если новой достался её номер inode
+            written = os.stat(tmp_path)
+            if written.st_mtime_ns <= current.st_mtime_ns:
+                os.utime(tmp_path, ns=(written.st_atime_ns, current.st_mtime_ns + 1))
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    _fsync_dir(directory)
+
+
+def _write_journal_lines(file_path: str, ops: List[Dict]) -> None:
+    """Дописывает записи в журнал одним fsync"""
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    text = ''.join(json.dumps(op, ensure_ascii=False, separators=(',', ':'), default=json_default) + '\n'
+                   for op in ops)
+    with open(journal_path(file_path), 'a+b') as f:
+        # Если предыдущая запись оборвалась на середине строки, начинаем с новой
+        # строки, чтобы не склеить её с нашей записью
+        if f.seek(0, os.SEEK_END) > 0:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b'\n':
+                text = '\n' + text
+        f.write(text.encode('utf-8'))
+        f.flush()
+        os.fsync(f.fileno())
+
+
+# --- Групповая запись (group commit) ---
+#
+# При CANTEEN_GROUP_COMMIT_MS > 0 записи в один файл, пришедшие в пределах
+# окна, объединяются в одну физическую запись: для снимка пишется только
+# последняя версия документа, записи журнала дописываются одним fsync.
+# Изменения сразу видны в кэше процесса, а вызывающий поток возвращается
+# только после того, как пакет с его изменениями записан на диск.
+# Режим рассчитан на один процесс с несколькими потоками: другие процессы
+# увидят изменения только после записи пакета.
+
+class _Batch:
+    __slots__ = ('key', 'deadline', 'leader', 'snapshot', 'drop_journal', 'ops', 'entry',
+                 'writes', 'flushed', 'error')
+
+    def __init__(self, key, deadline, leader):
+        self.key = key
+        self.deadline = deadline
+        self.leader = leader        # поток, который запишет пакет на диск
+        self.snapshot = None        # последняя версия документа целиком
+        self.drop_journal = False
+        self.ops = []               # записи журнала после снимка
+        self.entry = None           # запись кэша с итоговым состоянием документа
+        self.writes = 0
+        self.flushed = False
+        self.error = None
+
+
+_pending: Dict[str, _CacheEntry] = {}       # документы с незаписанными изменениями
+_open_batches: Dict[str, _Batch] = {}       # пакеты, принимающие новые записи
+_flush_locks: Dict[str, threading.Lock] = {}
+_batch_done = threading.Condition(_cache_lock)
+
+
+def _group_commit_enabled() -> bool:
+    return config.GROUP_COMMIT_MS > 0
+
+
+def _thread_batches() -> List[_Batch]:
+    batches = getattr(_local, 'batches', None)
+    if batches is None:
+        batches = _local.batches = []
+    return batches
+
+
+def _stage(file_path: str, entry: _CacheEntry, snapshot: Dict = None,
+           drop_journal: bool = False, ops: List[Dict] = None) -> None:
+    """Добавляет изменение в текущий пакет файла"""
+    key = _cache_key(file_path)
+    with _cache_lock:
+        batch = _open_batches.get(key)
+        if batch is None:
+            batch = _Batch(key, time.monotonic() + config.GROUP_COMMIT_MS / 1000.0, threading.get_ident())
+            _open_batches[key] = batch
+            _flush_locks.setdefault(key, threading.Lock())
+        if snapshot is not None:
+            # Новый снимок уже содержит все предыдущие изменения пакета
+            batch.snapshot = snapshot
+            batch.drop_journal = batch.drop_journal or drop_journal
+            batch.ops = []
+        if ops:
+            batch.ops.extend(ops)
+        batch.entry = entry
+        batch.writes += 1
+        _pending[key] = entry
+        _stats['writes'] += 1
+    batches = _thread_batches()
+    if batch not in batches:
+        batches.append(batch)
+
+
+def _flush_batch(batch: _Batch) -> None:
+    """Записывает пакет на диск (вызывается потоком-лидером пакета)"""
+    # Пакеты одного файла записываются строго по очереди: следующий пакет
+    # не откроется, пока этот не закрыт, а закрывается он под _flush_locks
+    with _flush_locks[batch.key]:
+        with _cache_lock:
+            if _open_batches.get(batch.key) is batch:
+                del _open_batches[batch.key]
+        try:
+            if batch.snapshot is not None:
+                _atomic_write(batch.key, batch.snapshot)
+                if batch.drop_journal:
+                    _remove_journal(batch.key)
+            if batch.ops:
+                _write_journal_lines(batch.key, batch.ops)
+            signature = _document_signature(batch.key)
+        except BaseException as e:
+            batch.error = e
+            signature = None
+
+        with _cache_lock:
+            entry = batch.entry
+            if signature is not None:
+                entry.signature = signature
+                entry.journal_offset = signature[1][1] if signature[1] is not None else 0
+            if _pending.get(batch.key) is entry:
+                del _pending[batch.key]
+                if signature is not None:
+                    _cache[batch.key] = entry
+                else:
+                    _cache.pop(batch.key, None)
+            _stats['flushes'] += 1
+            batch.flushed = True
+            _batch_done.notify_all()
+
+
+def _await_group_commit() -> None:
+    """Дожидается записи на диск всех изменений текущего потока"""
+    batches = getattr(_local, 'batches', None)
+    if not batches:
+        return
+    _local.batches = []
+    # Сначала записываем свои пакеты и только потом ждём чужие: иначе два
+    # лидера могут ждать друг друга
+    me = threading.get_ident()
+    for batch in sorted((b for b in batches if b.leader == me), key=lambda b: b.deadline):
+        delay = batch.deadline - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        _flush_batch(batch)
+    error = None
+    for batch in batches:
+        with _cache_lock:
+            while not batch.flushed:
+                _batch_done.wait()
+        if batch.error is not None and error is None:
+            error = batch.error
+    if error is not None:
+        raise error
+
+
+def _write_snapshot(file_path: str, data: Dict, drop_journal: bool = False, shared: bool = False,
+                    positions: Dict = None, indexes: Dict = None) -> None:
+    """Записывает документ целиком и обновляет кэш.
+    drop_journal — удалить журнал (его записи уже вошли в снимок);
+    shared — data больше никто не изменяет, кэш может хранить сам объект;
+    positions, indexes — уже актуальные для data индексы, чтобы не строить их заново."""
+    if shared:
+        entry = _CacheEntry(None, data=data, positions=positions, indexes=indexes)
+    else:
+        # Запоминаем снимок данных: вызывающий код может продолжить изменять
+        # свой объект, на кэш это не повлияет
+        blob = pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+        decoders = _decoders_for(file_path)
+        if decoders:
+            # Копии из pickle — словари; в кэш кладём декодированные записи
+            entry = _CacheEntry(None, data=_decode_document(pickle.loads(blob), decoders), blob=blob,
+                                positions=positions, indexes=indexes)
+        else:
+            entry = _CacheEntry(None, blob=blob, positions=positions, indexes=indexes)
+
+    if _group_commit_enabled():
+        _stage(file_path, entry, snapshot=entry.get_data(), drop_journal=drop_journal)
+        return
+
+    _atomic_write(file_path, data)
+    if drop_journal:
+        _remove_journal(file_path)
+
+    entry.signature = _document_signature(file_path)
+    with _cache_lock:
+        _stats['writes'] += 1
+        _stats['flushes'] += 1
+        if entry.signature is None:
+            _cache.pop(_cache_key(file_path), None)
+        else:
+            _cache[_cache_key(file_path)] = entry
+
+
+def _append_journal(file_path: str, ops: List[Dict]) -> None:
+    """Дописывает записи в журнал одним fsync"""
+    if _group_commit_enabled():
+        current = _get_entry(file_path)
+        base = current.get_data() if current is not None else {}
+        data, positions, indexes = _replay(base, ops, current.positions if current is not None else None,
+                                           copy_on_write=True,
+                                           indexes=current.indexes if current is not None else None,
+                                           decoders=_decoders_for(file_path))
+        lines = (current.journal_lines if current is not None else 0) + len(ops)
+        _stage(file_path, _CacheEntry(None, data=data, journal_lines=lines, positions=positions,
+                                      indexes=indexes), ops=ops)
+    else:
+        _write_journal_lines(file_path, ops)
+        with _cache_lock:
+            _stats['writes'] += 1
+            _stats['flushes'] += 1
+
+    entry = _get_entry(file_path)
+    if entry is not None and entry.journal_lines >= config.JOURNAL_COMPACT_THRESHOLD:
+        compact_journal(file_path)
+
+
+def _diff_ops(current: Dict, data: Dict) -> Optional[List[Dict]]:
+    """Строит записи журнала, превращающие current в data.
+    Возвращает None, если изменения не выражаются записями журнала
+    (например, изменились поля верхнего уровня, а не записи коллекций)."""
+    ops = []
+    for key in set(current) | set(data):
+        old, new = current.get(key), data.get(key)
+        if old == new:
+            continue
+        if not isinstance(old, list) or not isinstance(new, list):
+            return None
+        if not all(isinstance(r, dict) and 'id' in r for r in new):
+            return None
+        old_by_id = {r.get('id'): r for r in old if isinstance(r, Mapping)}
+        new_ids = set()
+        for record in new:
+            record_id = record['id']
+            new_ids.add(record_id)
+            before = old_by_id.get(record_id)
+            if before is None:
+                ops.append({'op': 'add', 'key': key, 'record': record})
+            elif before != record:
+                if set(before) - set(record):
+                    ops.append({'op': 'put', 'key': key, 'id': record_id, 'record': record})
+                else:
+                    fields = {k: v for k, v in record.items() if before.get(k, object()) != v}
+                    ops.append({'op': 'set', 'key': key, 'id': record_id, 'fields': fields})
+        for record_id in old_by_id:
+            if record_id not in new_ids:
+                ops.append({'op': 'del', 'key': key, 'id': record_id})
+    return ops
+
+
+def save_json(file_path: str, data: Dict) -> None:
+    """Сохраняет данные в JSON файл и сразу обновляет кэш.
+    Для журналируемых файлов записываются только отличия от текущего
+    состояния (в виде записей журнала)."""
+    with _locked(file_path):
+        _save_json(file_path, data)
+
+
+def _save_json(file_path: str, data: Dict) -> None:
+    if is_journaled(file_path) and _document_signature(file_path) is not None:
+        ops = _diff_ops(load_json_shared(file_path), data)
+        if ops is not None and len(ops) < config.JOURNAL_COMPACT_THRESHOLD:
+            if ops:
+                _append_journal(file_path, ops)
+            return
+        _write_snapshot(file_path, data, drop_journal=True)
+        return
+
+    _write_snapshot(file_path, data)
+
+
+def append_record(file_path: str, key: str, record: Dict) -> None:
+    """Добавляет запись в коллекцию документа.
+    Для журналируемых файлов — одна строка в журнале и один fsync."""
+    with _locked(file_path):
+        _append_record(file_path, key, record)
+
+
+def _append_record(file_path: str, key: str, record: Dict) -> None:
+    op = {'op': 'add', 'key': key, 'record': clone(record)}
+    if not is_journaled(file_path):
+        _rewrite_with(file_path, [op])
+        return
+    _append_journal(file_path, [op])
+
+
+def _rewrite_with(file_path: str, ops: List[Dict]) -> None:
+    """Применяет записи к нежурналируемому документу и перезаписывает файл.
+    Индексы предыдущей версии обновляются по записям, а не строятся заново."""
+    entry = _get_entry(file_path)
+    decoders = _decoders_for(file_path)
+    if entry is None:
+        data, positions, indexes = _replay({}, ops, None, copy_on_write=False, decoders=decoders)
+    else:
+        data, positions, indexes = _replay(entry.get_data(), ops, entry.positions, copy_on_write=True,
+                                           indexes=entry.indexes, decoders=decoders)
+    _write_snapshot(file_path, data, shared=True, positions=positions, indexes=indexes)
+
+
+def patch_record(file_path: str, key: str, record_id, fields: Dict) -> bool:
+    """Изменяет поля записи коллекции по id.
+    Для журналируемых файлов изменение дописывается в журнал как патч."""
+    with _locked(file_path):
+        return _patch_record(file_path, key, record_id, fields)
+
+
+def _patch_record(file_path: str, key: str, record_id, fields: Dict) -> bool:
+    entry = _get_entry(file_path)
+    if entry is None or entry.position(key, record_id) is None:
+        return False
+
+    op = {'op': 'set', 'key': key, 'id': record_id, 'fields': clone(fields)}
+    if not is_journaled(file_path):
+        _rewrite_with(file_path, [op])
+        return True
+
+    _append_journal(file_path, [op])
+    return True
+
+
+def _remove_journal(file_path: str) -> None:
+    try:
+        os.remove(journal_path(file_path))
+    except FileNotFoundError:
+        pass
+
+
+def remove_document(file_path: str) -> None:
+    """Удаляет документ вместе с журналом и сбрасывает его кэш"""
+    with _locked(file_path):
+        # Незаписанный пакет этого файла иначе восстановил бы документ после удаления
+        key = _cache_key(file_path)
+        with _cache_lock:
+            batch = _open_batches.get(key)
+        if batch is not None:
+            if batch.leader == threading.get_ident():
+                _flush_batch(batch)
+            with _cache_lock:
+                while not batch.flushed:
+                    _batch_done.wait()
+        try:
+            os.remove(file_path)
+        except FileNotFoundError:
+            pass
+        _remove_journal(file_path)
+        invalidate_cache(file_path)
+
+
+def compact_journal(file_path: str) -> None:
+    """Сворачивает журнал в снимок: записывает объединённый документ
+    в основной файл и удаляет журнал.
+    Если процесс прервётся между этими шагами, журнал будет применён к новому
+    снимку повторно — это безопасно, так как записи журнала идемпотентны."""
+    with _locked(file_path):
+        _compact_journal(file_path)
+
+
+def _compact_journal(file_path: str) -> None:
+    entry = _get_entry(file_path)
+    if entry is None or entry.signature[1] is None:
+        return
+    # Документ уже разобран — кэш сохраняет его, и следующее чтение
+    # не будет парсить файл заново
+    _write_snapshot(file_path, entry.get_data(), drop_journal=True, shared=True,
+                    positions=entry.positions, indexes=entry.indexes)
+
+
+def invalidate_cache(file_path: str = None) -> None:
+    """Сбрасывает кэш для файла (или весь кэш, если путь не указан)"""
+    with _cache_lock:
+        if file_path is None:
+            _cache.clear()
+        else:
+            _cache.pop(_cache_key(file_path), None)
+
+
+def cache_stats() -> Dict:
+    """Счётчики кэша: попадания, промахи и число разборов по каждому файлу"""
+    with _cache_lock:
+        return {
+            'hits': _stats['hits'],
+            'misses': _stats['misses'],
+            'parses': dict(_stats['parses']),
+            'replays': _stats['replays'],
+            'writes': _stats['writes'],
+            'flushes': _stats['flushes'],
+            'entries': len(_cache)
+        }
+
+
+def reset_cache_stats() -> None:
+    """Обнуляет счётчики кэша (например, в начале обработки запроса)"""
+    with _cache_lock:
+        _stats['hits'] = 0
+        _stats['misses'] = 0
+        _stats['parses'] = {}
+        _stats['replays'] = 0
+        _stats['writes'] = 0
+        _stats['flushes'] = 0
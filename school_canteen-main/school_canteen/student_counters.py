@@ -0,0 +1,194 @@
+"""Счётчики питания учеников.
+
+Раньше после каждого заказа (create_order, выдача питания поваром,
+подтверждение получения) заказы ученика просматривались заново, чтобы
+пересчитать meals_this_month, и весь users.json переписывался. Теперь у
+каждого пользователя есть запись коллекции student_counters (id — id
+пользователя):
+    month                — месяц, к которому относятся счётчики месяца
+    meals_this_month     — заказов за месяц
+    order_sum_this_month — сумма цен этих заказов
+    spent_this_month     — потрачено за месяц (платежи, кроме пополнений)
+    orders_total         — заказов за всё время
+    last_meal            — последнее питание: [дата, время]
+
+Счётчики обновляются как сводные показатели (aggregates.py): при каждой
+записи заказов и платежей вычисляется разница, и она записывается в той
+же транзакции. Запись журналируется, поэтому заказ добавляет в журнал
+одну короткую строку. С началом нового месяца счётчики месяца
+обнуляются — при первом событии месяца, а до него при чтении (current).
+
+Запись, которой ещё нет, считается по заказам и платежам пользователя
+(через индексы) при первом событии. Последнее питание сравнивается по
+метке времени ts (timestamps.py), а если изменён или удалён сам последний
+заказ, предыдущий находится по упорядоченному индексу заказов ученика. Массовые операции (replace_all,
+перенос между хранилищами) счётчики не обновляют — после них нужен
+пересчёт: python rebuild_aggregates.py
+"""
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from aggregates import record_states
+from timestamps import timestamp
+
+# Коллекции, от которых зависят счётчики
+TRACKED = ('orders', 'payments')
+MONTH_FIELDS = ('meals_this_month', 'order_sum_this_month', 'spent_this_month')
+
+
+def _owner(collection: str, record: Optional[Dict]):
+    if record is None:
+        return None
+    return record.get('student_id') if collection == 'orders' else record.get('user_id')
+
+
+def _order_ts(order: Dict) -> int:
+    # -1 — заказ без корректной даты: последним питанием он не считается
+    ts = order.get('ts')
+    if not isinstance(ts, int):
+        ts = timestamp(order)
+    return ts if ts is not None else -1
+
+
+def _meal_ts(meal) -> int:
+    return _order_ts({'date': meal[0], 'time': meal[1]}) if meal else -1
+
+
+def _meal(order: Optional[Dict]) -> Optional[List]:
+    return [order.get('date'), order.get('time')] if order is not None else None
+
+
+def _contributions(collection: str, record: Optional[Dict], month: str):
+    """Вклад записи в счётчики её владельца"""
+    if record is None:
+        return
+    in_month = str(record.get('date') or '').startswith(month)
+    if collection == 'orders':
+        yield 'orders_total', 1
+        if in_month:
+            yield 'meals_this_month', 1
+            yield 'order_sum_this_month', record.get('price', 0) or 0
+    elif collection == 'payments':
+        # Пополнение баланса — не трата
+        if in_month and record.get('type') != 'recharge':
+            yield 'spent_this_month', record.get('amount', 0) or 0
+
+
+def _number(value):
+    return int(value) if float(value).is_integer() else value
+
+
+def compute(backend, user_id, month: str = None) -> Dict:
+    """Счётчики пользователя, посчитанные по его заказам и платежам"""
+    month = month or datetime.now().strftime('%Y-%m')
+    orders = backend.query('orders', student_id=user_id)
+    totals = defaultdict(float)
+    for order in orders:
+        for name, value in _contributions('orders', order, month):
+            totals[name] += value
+    for payment in backend.scan('payments', date_prefix=month, user_id=user_id):
+        for name, value in _contributions('payments', payment, month):
+            totals[name] += value
+    record = {'id': user_id, 'month': month, 'orders_total': 0,
+              'last_meal': _meal(backend.latest('orders', student_id=user_id))}
+    record.update((name, 0) for name in MONTH_FIELDS)
+    record.update((name, _number(value)) for name, value in totals.items())
+    return record
+
+
+def current(record: Dict, month: str = None) -> Dict:
+    """Счётчики на текущий месяц: если записей этого месяца ещё не было,
+    счётчики месяца — нули"""
+    month = month or datetime.now().strftime('%Y-%m')
+    if record.get('month') == month:
+        return record
+    return dict(record, month=month, **{name: 0 for name in MONTH_FIELDS})
+
+
+def changes(backend, ops: List[Dict]) -> List[Dict]:
+    """Операции над счётчиками для набора операций транзакции.
+    Вызывается под блокировкой транзакции, до записи ops."""
+    states = record_states(backend, ops, TRACKED)
+    by_owner: Dict[object, list] = {}
+    for (collection, _), (before, after) in states.items():
+        for owner in {_owner(collection, before), _owner(collection, after)} - {None}:
+            by_owner.setdefault(owner, []).append((collection, before, after))
+    if not by_owner:
+        return []
+
+    month = datetime.now().strftime('%Y-%m')
+    result = []
+    for owner, changed in by_owner.items():
+        stored = backend.get('student_counters', owner)
+        # Запись считается по данным до транзакции, изменения добавляются ниже
+        counters = current(stored, month) if stored is not None else compute(backend, owner, month)
+        deltas = defaultdict(float)
+        last_meal, recount_last_meal = counters.get('last_meal'), False
+        for collection, before, after in changed:
+            if _owner(collection, before) == owner:
+                for name, value in _contributions(collection, before, month):
+                    deltas[name] -= value
+            if _owner(collection, after) == owner:
+                for name, value in _contributions(collection, after, month):
+                    deltas[name] += value
+            if collection != 'orders':
+                continue
+            if before is not None and _owner(collection, before) == owner \
+                    and [before.get('date'), before.get('time')] == last_meal:
+                # Последнее питание изменено или удалено — максимум находим заново
+                recount_last_meal = True
+            if after is not None and _owner(collection, after) == owner:
+                if _order_ts(after) > _meal_ts(last_meal):
+                    last_meal = _meal(after)
+        if recount_last_meal:
+            # Последний из заказов, не затронутых транзакцией, — первый по
+            # убыванию времени в индексе ученика; затронутые — по их новому состоянию
+            touched = {(after or before)['id'] for collection, before, after in changed if collection == 'orders'}
+            candidates = [after for collection, _, after in changed
+                          if collection == 'orders' and after is not None and _owner(collection, after) == owner]
+            candidates += [next((order for order in backend.between('orders', reverse=True, student_id=owner)
+                                 if order['id'] not in touched), None)]
+            candidates = [order for order in candidates if order is not None and _order_ts(order) >= 0]
+            last_meal = _meal(max(candidates, key=_order_ts)) if candidates else None
+
+        fields = {name: _number(counters.get(name, 0) + delta) for name, delta in deltas.items() if delta}
+        if last_meal != counters.get('last_meal'):
+            fields['last_meal'] = last_meal
+        if stored is None or stored.get('month') != month:
+            # Новая запись или первый в этом месяце заказ — записываем целиком
+            result.append({'op': 'put', 'collection': 'student_counters', 'record': dict(counters, **fields)})
+        elif fields:
+            result.append({'op': 'set', 'collection': 'student_counters', 'id': owner, 'fields': fields})
+    return result
+
+
+def rebuild(backend) -> int:
+    """Пересчитывает счётчики всех пользователей одним проходом по данным.
+    Возвращает количество записей."""
+    month = datetime.now().strftime('%Y-%m')
+    records: Dict[object, Dict] = {}
+
+    def record_of(owner):
+        record = records.get(owner)
+        if record is None:
+            record = records[owner] = {'id': owner, 'month': month, 'orders_total': 0, 'last_meal': None}
+            record.update((name, 0) for name in MONTH_FIELDS)
+        return record
+
+    with backend.transaction(*TRACKED, 'student_counters'):
+        for collection in TRACKED:
+            for item in backend.scan(collection):
+                owner = _owner(collection, item)
+                if owner is None:
+                    continue
+                record = record_of(owner)
+                for name, value in _contributions(collection, item, month):
+                    record[name] += value
+                if collection == 'orders':
+                    if _order_ts(item) > _meal_ts(record['last_meal']):
+                        record['last_meal'] = _meal(item)
+        for record in records.values():
+            record.update((name, _number(record[name])) for name in MONTH_FIELDS)
+        backend.replace_all('student_counters', list(records.values()))
+    return len(records)
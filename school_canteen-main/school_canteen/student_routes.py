@@ -1,8 +1,9 @@
 from flask import Blueprint, render_template, session, redirect, url_for, flash, request
 from functools import wraps
-from data_manager import get_user_by_id, get_menu_items, recharge_balance, get_user_payments, load_json, save_json
-from data_manager import get_reviews_by_student, get_menu_item_by_id, get_reviews_by_menu_item
-from data_manager import create_order, get_user_orders, add_payment, update_user, get_user_nutrition_stats, get_user_active_subscriptions_count
+from data_manager import get_user_by_id, get_menu_items, recharge_balance, get_recent_payments
+from data_manager import get_reviews_by_student, get_menu_item_by_id, get_reviews_by_menu_item, add_review
+from data_manager import create_order, get_user_orders, update_user, get_user_nutrition_stats, get_user_active_subscriptions_count
+from data_manager import get_order_by_id, update_order, pay_from_balance, join_records
 from datetime import datetime
 
 student_bp = Blueprint('student', __name__)
@@ -29,11 +30,19 @@ def dashboard():
     today = datetime.now().strftime('%Y-%m-%d')
 
     # Получаем сегодняшнее меню
-    breakfast_items = get_menu_items(date=today, meal_type='breakfast')
-    lunch_items = get_menu_items(date=today, meal_type='lunch')
+    menu_today = get_menu_items(date=today)
+    breakfast_items = [item for item in menu_today if item['type'] == 'breakfast']
+    lunch_items = [item for item in menu_today if item['type'] == 'lunch']
 
     # Получаем последние платежи (последние 5)
-    payments = sorted(get_user_payments(session['user_id']), key=lambda p: p.get('date', ''), reverse=True)[:5]
+    payments = get_recent_payments(session['user_id'], 5)
+
+    # Статистика питания для отображения на дашборде. Заказы и платежи
+    # ученика за месяц, прочитанные здесь, снимок запроса использует и
+    # для выборок ниже (сегодняшние заказы, абонементы)
+    nutrition = get_user_nutrition_stats(session['user_id'])
+    meals_this_month = nutrition.get('meals_this_month', 0)
+    active_subscriptions = get_user_active_subscriptions_count(session['user_id'])
 
     # Получаем сегодняшние заказы
     today_orders = get_user_orders(session['user_id'], today)
@@ -41,11 +50,6 @@ def dashboard():
     # Получаем отзывы
     reviews = get_reviews_by_student(session['user_id'])
 
-    # Статистика питания для отображения на дашборде
-    nutrition = get_user_nutrition_stats(session['user_id'])
-    meals_this_month = nutrition.get('meals_this_month', 0)
-    active_subscriptions = get_user_active_subscriptions_count(session['user_id'])
-
     return render_template('student/dashboard.html',
                            user=user,
                            breakfast_items=breakfast_items[:3],
@@ -121,14 +125,14 @@ def profile():
             user = get_user_by_id(session['user_id'])
 
     # Получаем историю платежей (последние 10)
-    payments = sorted(get_user_payments(session['user_id']), key=lambda p: p.get('date', ''), reverse=True)
+    payments = get_recent_payments(session['user_id'], 10)
 
     # Статистика питания для профиля
     nutrition = get_user_nutrition_stats(session['user_id'])
 
     return render_template('student/profile.html',
                            user=user,
-                           payments=payments[:10],
+                           payments=payments,
                            nutrition=nutrition)
 
 
@@ -145,31 +149,16 @@ def pay():
             flash('Сумма должна быть положительной', 'danger')
             return redirect(url_for('student.dashboard'))
 
-        user = get_user_by_id(session['user_id'])
-
-        # Проверяем баланс
-        if user['balance'] < amount:
+        # Списание и платеж записываются одной транзакцией
+        if payment_type != 'subscription':
+            payment_type = 'single'
+        if not pay_from_balance(session['user_id'], amount, payment_type, description):
             flash('Недостаточно средств на балансе', 'danger')
             return redirect(url_for('student.dashboard'))
 
-        # Обрабатываем платеж
         if payment_type == 'subscription':
-            # Для абонемента списываем средства
-            new_balance = user['balance'] - amount
-            update_user(session['user_id'], {'balance': new_balance})
-
-            # Записываем платеж
-            add_payment(session['user_id'], amount, 'subscription', description)
-
             flash(f'Абонемент оплачен на сумму {amount} руб.', 'success')
         else:
-            # Для разового платежа просто списываем
-            new_balance = user['balance'] - amount
-            update_user(session['user_id'], {'balance': new_balance})
-
-            # Записываем платеж
-            add_payment(session['user_id'], amount, 'single', description)
-
             flash(f'Разовый платеж на сумму {amount} руб. успешно выполнен', 'success')
 
     except ValueError:
@@ -239,24 +228,14 @@ def review(menu_item_id):
             flash('Оценка должна быть от 1 до 5', 'danger')
         else:
             # Добавляем отзыв
-            from data_manager import load_json, save_json
-            reviews_data = load_json('data/reviews.json')
-
-            if 'reviews' not in reviews_data:
-                reviews_data['reviews'] = []
-
-            new_review = {
-                'id': len(reviews_data['reviews']) + 1,
+            add_review({
                 'student_id': session['user_id'],
                 'menu_item_id': menu_item_id,
                 'rating': rating,
                 'comment': comment,
                 'date': datetime.now().isoformat(),
                 'approved': True  # Для упрощения сразу одобряем
-            }
-
-            reviews_data['reviews'].append(new_review)
-            save_json('data/reviews.json', reviews_data)
+            })
 
             flash('Спасибо за ваш отзыв!', 'success')
             return redirect(url_for('student.reviews'))
@@ -277,9 +256,7 @@ def reviews():
     user_reviews = get_reviews_by_student(session['user_id'])
 
     # Добавляем информацию о блюдах
-    for review in user_reviews:
-        menu_item = get_menu_item_by_id(review['menu_item_id'])
-        review['menu_item'] = menu_item
+    join_records(user_reviews, 'menu_item_id', 'menu', 'menu_item')
 
     return render_template('student/my_reviews.html', reviews=user_reviews)
 
@@ -291,12 +268,7 @@ def orders():
     user_orders = get_user_orders(session['user_id'])
 
     # Добавляем информацию о блюдах (если меню_item существует)
-    for order in user_orders:
-        if 'menu_item_id' in order:
-            menu_item = get_menu_item_by_id(order['menu_item_id'])
-            order['menu_item'] = menu_item
-        else:
-            order['menu_item'] = None
+    join_records(user_orders, 'menu_item_id', 'menu', 'menu_item')
 
     return render_template('student/orders.html', orders=user_orders)
 
@@ -304,28 +276,21 @@ def orders():
 @student_required
 def confirm_order(order_id):
     """Ученик подтверждает получение своего заказа"""
-    orders_data = load_json('data/orders.json')
-
-    for order in orders_data.get('orders', []):
-        if order.get('id') == order_id and order.get('student_id') == session['user_id']:
-            # Разрешаем подтверждение только если блюдо выдано/подготовлено/отмечено
-            if order.get('status') in ('served', 'prepared', 'issued'):
-                order['status'] = 'received'
-                order['received_at'] = datetime.now().strftime('%H:%M')
-                save_json('data/orders.json', orders_data)
-
-                # Синхронизация поля meals_this_month
-                try:
-                    nutrition = get_user_nutrition_stats(session['user_id'])
-                    update_user(session['user_id'], {'meals_this_month': nutrition.get('meals_this_month', 0)})
-                except Exception:
-                    pass
-
-                flash('Отметка о получении сохранена', 'success')
-                return redirect(url_for('student.orders'))
-            else:
-                flash('Заказ ещё не выдан', 'warning')
-                return redirect(url_for('student.orders'))
+    order = get_order_by_id(order_id)
+
+    if order and order.get('student_id') == session['user_id']:
+        # Разрешаем подтверждение только если блюдо выдано/подготовлено/отмечено
+        if order.get('status') in ('served', 'prepared', 'issued'):
+            update_order(order_id, {
+                'status': 'received',
+                'received_at': datetime.now().strftime('%H:%M')
+            })
+
+            flash('Отметка о получении сохранена', 'success')
+            return redirect(url_for('student.orders'))
+        else:
+            flash('Заказ ещё не выдан', 'warning')
+            return redirect(url_for('student.orders'))
 
     flash('Заказ не найден или доступ запрещен', 'danger')
     return redirect(url_for('student.orders'))
@@ -334,5 +299,5 @@ def confirm_order(order_id):
 @student_required
 def payments():
     """История платежей"""
-    user_payments = sorted(get_user_payments(session['user_id']), key=lambda p: p.get('date', ''), reverse=True)
+    user_payments = get_recent_payments(session['user_id'])
     return render_template('student/payments.html', payments=user_payments)
\ No newline at end of file
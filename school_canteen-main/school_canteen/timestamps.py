@@ -0,0 +1,102 @@
+"""Метки времени заказов и платежей.
+
+Заказ хранит дату и время строками ('date': '2026-10-16', 'time': '12:30'),
+платёж — дату-время ISO ('date': '2026-10-16T12:30:05.123456'). Чтобы найти
+последнее питание, приходилось разбирать strptime каждый заказ ученика,
+а выборка за день или месяц шла сравнением начала строки date.
+
+Теперь у каждого заказа и платежа есть поле ts — число секунд от
+1970-01-01 00:00 по часам столовой (часовой пояс не учитывается, поэтому
+сутки — ровно DAY секунд). Поле проставляет хранилище при каждой записи,
+а по нему строятся упорядоченные индексы: общий и по ученику
+(Backend.between, Backend.latest). «Последнее питание», «заказы за
+сегодня», «за месяц» и любой период — двоичный поиск границ в индексе.
+
+Записи, сохранённые до появления ts, получают его командой
+python migrate_timestamps.py (её же выполняет bootstrap.py). До этого
+такие записи в упорядоченные индексы не попадают: хранилище при чтении
+и записи ничего не проставляет, чтобы не брать блокировки разделов
+посреди чужой транзакции.
+"""
+import re
+from datetime import date, datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+DAY = 86400
+_EPOCH = datetime(1970, 1, 1)
+_DATE_RE = re.compile(r'\d{4}-\d{2}-\d{2}')
+
+
+def timestamp(record: Dict) -> Optional[int]:
+    """Метка времени записи по её полям date и time; None, если дата
+    некорректна. Некорректное время — начало дня."""
+    text = str(record.get('date') or '')
+    # Дата должна начинаться с YYYY-MM-DD, как и для раздела по месяцам
+    if not _DATE_RE.match(text):
+        return None
+    try:
+        moment = datetime.fromisoformat(text)
+    except ValueError:
+        try:
+            moment = datetime.fromisoformat(text[:10])
+        except ValueError:
+            return None
+    if len(text) <= 10 and record.get('time'):
+        try:
+            moment = datetime.fromisoformat(f"{text}T{record['time']}")
+        except (TypeError, ValueError):
+            pass
+    # Время с часовым поясом считаем временем столовой
+    return (moment.replace(tzinfo=None) - _EPOCH) // timedelta(seconds=1)
+
+
+def stamp(record: Dict) -> Dict:
+    """Проставляет записи поле ts (или убирает его, если дата некорректна)"""
+    ts = timestamp(record)
+    if ts is None:
+        record.pop('ts', None)
+    else:
+        record['ts'] = ts
+    return record
+
+
+def to_datetime(ts: int) -> datetime:
+    return _EPOCH + timedelta(seconds=ts)
+
+
+def day_start(day) -> int:
+    """Начало дня ('YYYY-MM-DD' или date)"""
+    if isinstance(day, str):
+        day = date.fromisoformat(day)
+    return (day - _EPOCH.date()).days * DAY
+
+
+def date_range(date_prefix: str) -> Optional[Tuple[int, int]]:
+    """[начало, конец) для года 'YYYY', месяца 'YYYY-MM' или дня
+    'YYYY-MM-DD'; None для других строк"""
+    try:
+        if _DATE_RE.fullmatch(date_prefix):
+            start = day_start(date_prefix)
+            return start, start + DAY
+        if re.fullmatch(r'\d{4}-\d{2}', date_prefix):
+            year, month = int(date_prefix[:4]), int(date_prefix[5:])
+            following = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+            return day_start(date(year, month, 1)), day_start(following)
+        if re.fullmatch(r'\d{4}', date_prefix):
+            year = int(date_prefix)
+            return day_start(date(year, 1, 1)), day_start(date(year + 1, 1, 1))
+    except ValueError:
+        pass
+    return None
+
+
+def period_range(start: str = None, end: str = None) -> Tuple[Optional[int], Optional[int]]:
+    """[начало, конец) для периода с границами 'YYYY-MM-DD' включительно;
+    отсутствующая граница — None"""
+    return (day_start(start) if start else None,
+            day_start(end) + DAY if end else None)
+
+
+def month_of(ts: int) -> str:
+    """Месяц 'YYYY-MM' метки времени"""
+    return to_datetime(ts).strftime('%Y-%m')
@@ -0,0 +1,64 @@
+"""Единицы измерения продуктов и пересчёт между ними.
+
+Продукт инвентаря хранит остаток в своей единице (кг, л, шт, ...), а
+рецептура блюда (recipes.py) — количество на порцию в удобной повару
+(150 мл молока, 2 шт яиц). Количество из рецептуры пересчитывается в
+единицу продукта по таблице UNITS: масса — через граммы, объём — через
+миллилитры. Штучные единицы (шт, уп и любые неизвестные) между собой не
+пересчитываются: размер упаковки таблице не известен.
+"""
+from typing import Tuple
+
+MASS = 'mass'
+VOLUME = 'volume'
+
+# Единица -> (величина, сколько в ней базовых единиц: граммов или миллилитров)
+UNITS = {
+    'мг': (MASS, 0.001),
+    'г': (MASS, 1),
+    'гр': (MASS, 1),
+    'кг': (MASS, 1000),
+    'мл': (VOLUME, 1),
+    'л': (VOLUME, 1000),
+    'mg': (MASS, 0.001),
+    'g': (MASS, 1),
+    'kg': (MASS, 1000),
+    'ml': (VOLUME, 1),
+    'l': (VOLUME, 1000),
+}
+
+# Порция продукта для блюд без рецептуры (в базовых единицах величины);
+# для штучных продуктов — одна единица. Раньше то же правило угадывалось
+# по подстроке единицы: 'кг'/'л' -> 0.1, 'г'/'мл' -> 100, иначе 1.
+DEFAULT_PORTION = {MASS: 100, VOLUME: 100}
+
+
+class UnitError(ValueError):
+    """Количество нельзя пересчитать в нужную единицу"""
+
+
+def normalize_unit(unit) -> str:
+    """' Кг. ' -> 'кг'"""
+    return str(unit or '').strip().lower().rstrip('.')
+
+
+def _dimension(unit: str) -> Tuple[str, float]:
+    """(величина, множитель) единицы; штучная единица — сама себе величина"""
+    return UNITS.get(unit, (unit, 1))
+
+
+def convert(quantity: float, from_unit, to_unit) -> float:
+    """Количество quantity в единицах from_unit, выраженное в to_unit"""
+    source, target = normalize_unit(from_unit), normalize_unit(to_unit)
+    if source == target:
+        return quantity
+    (source_kind, source_factor), (target_kind, target_factor) = _dimension(source), _dimension(target)
+    if source_kind != target_kind:
+        raise UnitError(f'нельзя пересчитать {from_unit or "(без единицы)"} в {to_unit or "(без единицы)"}')
+    return quantity * source_factor / target_factor
+
+
+def default_portion(unit) -> float:
+    """Порция продукта с единицей unit для блюда без рецептуры"""
+    kind, factor = _dimension(normalize_unit(unit))
+    return DEFAULT_PORTION[kind] / factor if kind in DEFAULT_PORTION else 1